@@ -0,0 +1,286 @@
+"""Build a paired Allen section-image / annotation dataset.
+
+For every coronal AtlasImage with structure boundaries, the downsampled
+section image and its boundary SVG are downloaded concurrently. The SVG is
+rasterized at the resolution of the downloaded image, and both are written in
+the ``images/`` + ``labels/`` layout of the other dataset tools:
+
+  <output>/images/<section id>.jpg          section image, as served by the API
+  <output>/labels/structures/<section id>.png
+      uint16 PNG of class indices (``classes.json``): every pixel is the
+      structure of the path drawn there, or its ancestor at ``--level``
+  <output>/labels/<acronym>/<section id>.png
+      with ``--structure``: 0/255 mask of the structure and its descendants
+  <output>/classes.json                     class index -> structure id, acronym, name
+  <output>/dataset.json                     sections, download settings, failures
+
+Downloads go to ``.tmp`` files and are only kept once they decode, so an
+interrupted run resumes where it stopped: images, SVGs (cached in
+``--svg-dir``) and labels that exist are not fetched or rasterized again.
+Rasterization runs in worker processes while downloads are still in flight.
+
+Any server that mirrors the API paths can stand in for the Allen API, e.g. a
+folder served with ``python -m http.server`` containing
+``api/v2/data/query.csv``, ``api/v2/svg_download/<id>``,
+``api/v2/atlas_image_download/<id>`` and
+``api/v2/structure_graph_download/1.json``.
+
+Example usage:
+  python allen_dataset.py allen_dataset --downsample 4
+  python allen_dataset.py allen_dataset --downsample 4 --level 5
+  python allen_dataset.py allen_dataset --structure Isocortex --api-base http://localhost:8000
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import allen_svg
+from download_allen import API_BASE, ONTOLOGY_CACHE, StructureOntology, list_section_ids
+
+STRUCTURES_LABEL = 'structures'
+
+_thread_state = threading.local()
+
+
+def image_url(section_id, downsample, api_base=API_BASE):
+    """URL of a section image downsampled by ``2 ** downsample``, without annotation overlay."""
+    return f"{api_base}/api/v2/atlas_image_download/{section_id}?downsample={downsample}&annotation=false"
+
+
+def svg_url(section_id, api_base=API_BASE):
+    """URL of the structure-boundary SVG of a section at full resolution."""
+    return f"{api_base}/api/v2/svg_download/{section_id}?groups=28"
+
+
+def _is_valid_image(data):
+    import cv2
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED) is not None
+
+
+def _is_valid_svg(data):
+    return b'<svg' in data[:4096]
+
+
+def fetch_to_file(url, path, validate=None, retries=3, timeout=60):
+    """
+    Download ``url`` to ``path`` unless it already exists.
+
+    The response is written to ``path + '.tmp'`` and only renamed into place
+    when ``validate(content)`` passes, so a partial or broken download is
+    never mistaken for a cached file. Failed requests are retried with
+    exponential backoff, except client errors (4xx). Each thread reuses one ``requests.Session``.
+
+    Returns
+    -------
+    bool
+        True if the file was downloaded, False if it was already there
+    """
+    if os.path.exists(path):
+        return False
+    import requests
+
+    session = getattr(_thread_state, 'session', None)
+    if session is None:
+        session = _thread_state.session = requests.Session()
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            content = response.content
+            if validate is not None and not validate(content):
+                raise ValueError(f'Invalid content from {url}')
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            return True
+        except (requests.RequestException, ValueError) as e:
+            response = getattr(e, 'response', None)
+            # Client errors (e.g. 404 for a missing section) will not go away on retry
+            if attempt == retries or (response is not None and 400 <= response.status_code < 500):
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def _download_section(section_id, image_path, svg_path, downsample, api_base, retries):
+    fetched = fetch_to_file(svg_url(section_id, api_base), svg_path, _is_valid_svg, retries)
+    fetched += fetch_to_file(image_url(section_id, downsample, api_base), image_path, _is_valid_image, retries)
+    return fetched
+
+
+def _write_png(path, image):
+    import cv2
+    tmp_path = path + '.tmp.png'
+    if not cv2.imwrite(tmp_path, image):
+        raise OSError(f'Could not write {path}')
+    os.replace(tmp_path, path)
+
+
+def _rasterize_labels(args):
+    """Worker: rasterize one section SVG at the size of its image and write the label PNG(s)."""
+    import cv2
+
+    svg_path, image_path, class_path, mask_path, ontology, depth, structure_id = args
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    height, width = image.shape[:2]
+    scale = width / allen_svg.read_svg_size(svg_path)['width']
+    section = allen_svg.parse_svg(svg_path, tolerance=0.5 / scale)
+    path_ids = np.array([p['structure_id'] for p in section['paths']], dtype=np.int64)
+    # Draw every path with its 1-based index and map indices to labels afterwards,
+    # so later paths cover earlier ones exactly as in the SVG
+    paths = allen_svg.rasterize_paths(section, scale, shape=(height, width))
+
+    structure_ids = path_ids if depth is None else ontology.ancestor_at_depth(path_ids, depth)
+    classes = np.concatenate([[0], ontology.positions(structure_ids) + 1]).astype(np.uint16)
+    _write_png(class_path, classes[paths])
+    if mask_path is not None:
+        inside = np.concatenate([[False], ontology.descendant_mask(path_ids, structure_id)])
+        _write_png(mask_path, inside[paths].astype(np.uint8) * 255)
+    return height, width
+
+
+def build_atlas_dataset(output_dir, api_base=API_BASE, downsample=4, svg_dir=allen_svg.SVG_DIR,
+                        depth=None, structure=None, section_ids=None, cache_path=ONTOLOGY_CACHE,
+                        download_workers=8, raster_workers=None, retries=3):
+    """
+    Download section images and rasterize their annotations into a training dataset.
+
+    Parameters
+    ----------
+    output_dir : str
+        Dataset root; receives ``images/``, ``labels/``, ``classes.json`` and ``dataset.json``
+    api_base : str
+        Allen API base URL, or a local stand-in
+    downsample : int
+        Images are downsampled by ``2 ** downsample`` (4: ~1/16 of full resolution)
+    svg_dir : str
+        Cache folder of the section SVGs (shared with the other atlas tools)
+    depth : int, optional
+        Map every structure to its ancestor at this ontology depth
+    structure : int or str, optional
+        Structure id or acronym; also writes a binary mask of it and its descendants
+    section_ids : list, optional
+        Sections to include (default: all sections listed by the API)
+    cache_path : str
+        Structure ontology cache
+    download_workers : int
+        Concurrent downloads
+    raster_workers : int, optional
+        Rasterization processes (default: CPU count)
+    retries : int
+        Retries per failed download
+
+    Returns
+    -------
+    dict
+        'sections' (completed ids), 'failed' (id -> error), 'downloaded' (files fetched),
+        'rasterized', 'skipped' (labels already present)
+    """
+    ontology = StructureOntology.load(cache_path, api_base=api_base)
+    structure_id = None
+    if structure is not None:
+        structure_id = int(structure) if str(structure).isdigit() else ontology.find(structure)
+        ontology.position(structure_id)  # fail early on unknown ids
+    if section_ids is None:
+        section_ids = list_section_ids(api_base)
+    section_ids = [str(s) for s in section_ids]
+
+    class_dir = os.path.join(output_dir, 'labels', STRUCTURES_LABEL)
+    mask_dir = None
+    if structure_id is not None:
+        mask_dir = os.path.join(output_dir, 'labels', ontology.acronyms[ontology.position(structure_id)])
+    for folder in (os.path.join(output_dir, 'images'), svg_dir, class_dir, mask_dir):
+        if folder is None:
+            continue
+        os.makedirs(folder, exist_ok=True)
+
+    summary = {'sections': [], 'failed': {}, 'downloaded': 0, 'rasterized': 0, 'skipped': 0}
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=raster_workers) as rasterizers:
+        pending = {}
+        for section_id in section_ids:
+            image_path = os.path.join(output_dir, 'images', f'{section_id}.jpg')
+            svg_path = os.path.join(svg_dir, f'{section_id}.svg')
+            future = downloads.submit(_download_section, section_id, image_path, svg_path,
+                                      downsample, api_base, retries)
+            pending[future] = (section_id, image_path, svg_path)
+
+        rasters = {}
+        for future in as_completed(pending):
+            section_id, image_path, svg_path = pending[future]
+            try:
+                summary['downloaded'] += future.result()
+            except Exception as e:
+                summary['failed'][section_id] = f'download: {e}'
+                print(f'Failed to download section {section_id}: {e}')
+                continue
+            class_path = os.path.join(class_dir, f'{section_id}.png')
+            mask_path = None if mask_dir is None else os.path.join(mask_dir, f'{section_id}.png')
+            if os.path.exists(class_path) and (mask_path is None or os.path.exists(mask_path)):
+                summary['skipped'] += 1
+                summary['sections'].append(section_id)
+                continue
+            task = (svg_path, image_path, class_path, mask_path, ontology, depth, structure_id)
+            rasters[rasterizers.submit(_rasterize_labels, task)] = section_id
+
+        for future in as_completed(rasters):
+            section_id = rasters[future]
+            try:
+                future.result()
+            except Exception as e:
+                summary['failed'][section_id] = f'rasterize: {e}'
+                print(f'Failed to rasterize section {section_id}: {e}')
+                continue
+            summary['rasterized'] += 1
+            summary['sections'].append(section_id)
+
+    summary['sections'].sort(key=lambda s: (len(s), s))
+    classes = {'0': {'id': 0, 'acronym': '', 'name': 'background'}}
+    for i in range(len(ontology)):
+        if depth is None or ontology.depth[i] <= depth:
+            classes[str(i + 1)] = {'id': int(ontology.ids[i]), 'acronym': ontology.acronyms[i],
+                                   'name': ontology.names[i]}
+    manifest = {'api_base': api_base, 'downsample': downsample, 'depth': depth,
+                'structure_id': structure_id,
+                'labels': [os.path.relpath(folder, output_dir) for folder in (class_dir, mask_dir) if folder],
+                'sections': summary['sections'], 'failed': summary['failed']}
+    for name, content in (('classes.json', classes), ('dataset.json', manifest)):
+        path = os.path.join(output_dir, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    print(f"{len(summary['sections'])} sections ready in {output_dir} ({summary['downloaded']} files downloaded, "
+          f"{summary['rasterized']} rasterized, {summary['skipped']} already done, "
+          f"{len(summary['failed'])} failed)")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a paired Allen section-image / annotation dataset')
+    parser.add_argument('output_dir', help='Dataset root (images/, labels/, classes.json, dataset.json)')
+    parser.add_argument('--api-base', default=API_BASE, help='Allen API base URL (default: %(default)s)')
+    parser.add_argument('--downsample', type=int, default=4, help='Image downsampling exponent (default: 4)')
+    parser.add_argument('--svg-dir', default=allen_svg.SVG_DIR, help='SVG cache folder')
+    parser.add_argument('--level', type=int, default=None, help='Map structures to their ancestor at this depth')
+    parser.add_argument('--structure', default=None, help='Also write a mask of this structure id or acronym')
+    parser.add_argument('--sections', nargs='+', default=None, help='Only these SectionImage ids')
+    parser.add_argument('--cache', default=ONTOLOGY_CACHE, help='Structure ontology cache')
+    parser.add_argument('--download-workers', type=int, default=8, help='Concurrent downloads (default: 8)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Rasterization processes')
+    args = parser.parse_args(argv)
+    summary = build_atlas_dataset(args.output_dir, api_base=args.api_base, downsample=args.downsample,
+                                  svg_dir=args.svg_dir, depth=args.level, structure=args.structure,
+                                  section_ids=args.sections, cache_path=args.cache,
+                                  download_workers=args.download_workers, raster_workers=args.workers)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    main()
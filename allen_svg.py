@@ -0,0 +1,254 @@
+"""Parse and rasterize the Allen coronal atlas SVGs in ``allen_svg_coronal``.
+
+Every SVG holds one coronal section. Each ``<path>`` outlines one region and
+carries the Allen ``structure_id`` of that region. Paths are flattened to
+polygons (cubic and quadratic Bezier segments are subdivided until they are
+within ``tolerance`` SVG pixels of the true curve) and can be rasterized to
+label images at any scale.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+# Relative to the working directory, where ``download_allen.py svgs`` writes the SVGs by default
+SVG_DIR = 'allen_svg_coronal'
+
+_TOKEN_RE = re.compile(r'[MmLlHhVvCcSsQqTtZzAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_N_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'Z': 0}
+
+
+def list_sections(svg_dir=SVG_DIR):
+    """Sorted SectionImage ids of the SVG files in ``svg_dir``."""
+    ids = []
+    for fname in os.listdir(svg_dir):
+        stem, ext = os.path.splitext(fname)
+        if ext.lower() == '.svg' and stem.isdigit():
+            ids.append(int(stem))
+    return sorted(ids)
+
+
+def _flatten_cubics(segments, tolerance):
+    """Evaluate cubic segments (S, 4, 2) as polyline points, excluding each segment's start point."""
+    segments = np.asarray(segments, dtype=np.float64)
+    p0, p1, p2, p3 = segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3]
+    # Subdivisions needed for a flattening error <= tolerance (bound from the second differences)
+    dd = np.maximum(np.linalg.norm(p0 - 2 * p1 + p2, axis=1), np.linalg.norm(p1 - 2 * p2 + p3, axis=1))
+    n = np.maximum(1, np.ceil(np.sqrt(0.75 * dd / tolerance))).astype(np.int64)
+
+    seg = np.repeat(np.arange(len(segments)), n)
+    starts = np.cumsum(n) - n
+    t = (np.arange(n.sum()) - np.repeat(starts, n) + 1) / np.repeat(n, n)
+    t = t[:, np.newaxis]
+    mt = 1 - t
+    return (mt ** 3 * p0[seg] + 3 * mt ** 2 * t * p1[seg] + 3 * mt * t ** 2 * p2[seg] + t ** 3 * p3[seg])
+
+
+def parse_path_d(d, tolerance=0.5):
+    """
+    Flatten an SVG path ``d`` attribute into polygon rings.
+
+    Parameters
+    ----------
+    d : str
+        Path data (M, L, H, V, C, S, Q, T, Z commands, absolute or relative)
+    tolerance : float
+        Maximum distance in SVG pixels between the curves and the polygons
+
+    Returns
+    -------
+    list of np.ndarray
+        One (K, 2) float64 array of (x, y) vertices per subpath
+    """
+    tokens = _TOKEN_RE.findall(d)
+    rings = []
+    segments = []  # cubic control points of the current subpath
+    current = np.zeros(2)
+    start = np.zeros(2)
+    last_control = None  # reflected for S/T
+    last_command = None
+    command = None
+    i = 0
+
+    def close_ring():
+        if segments:
+            points = _flatten_cubics(segments, tolerance)
+            rings.append(np.vstack([segments[0][0], points]))
+            segments.clear()
+
+    def line_to(target):
+        segments.append((current, current + (target - current) / 3, current + 2 * (target - current) / 3, target))
+
+    while i < len(tokens):
+        token = tokens[i]
+        if token.isalpha():
+            command = token
+            i += 1
+            if command.upper() == 'A':
+                raise ValueError('Elliptical arc commands are not supported')
+            if command in 'Zz':
+                if segments and not np.allclose(current, start):
+                    line_to(start.copy())
+                close_ring()
+                current = start.copy()
+                last_command, last_control = 'Z', None
+                continue
+        elif command is None:
+            raise ValueError(f'Path data must start with a command: {d[:40]!r}')
+
+        upper = command.upper()
+        n_args = _N_ARGS[upper]
+        args = np.array(tokens[i:i + n_args], dtype=np.float64)
+        if len(args) < n_args:
+            raise ValueError(f'Truncated {command} command in path data')
+        i += n_args
+        relative = command.islower()
+        origin = current if relative else np.zeros(2)
+
+        if upper == 'M':
+            close_ring()
+            current = origin + args
+            start = current.copy()
+            # Further coordinate pairs after a moveto are implicit linetos
+            command = 'l' if relative else 'L'
+            last_control = None
+        elif upper == 'L':
+            target = origin + args
+            line_to(target)
+            current = target
+            last_control = None
+        elif upper in 'HV':
+            target = current.copy()
+            axis = 0 if upper == 'H' else 1
+            target[axis] = (current[axis] if relative else 0) + args[0]
+            line_to(target)
+            current = target
+            last_control = None
+        elif upper == 'C':
+            c1, c2, target = origin + args[0:2], origin + args[2:4], origin + args[4:6]
+            segments.append((current, c1, c2, target))
+            last_control, current = c2, target
+        elif upper == 'S':
+            c1 = 2 * current - last_control if last_command in 'CS' and last_control is not None else current
+            c2, target = origin + args[0:2], origin + args[2:4]
+            segments.append((current, c1, c2, target))
+            last_control, current = c2, target
+        elif upper in 'QT':
+            if upper == 'Q':
+                q, target = origin + args[0:2], origin + args[2:4]
+            else:
+                q = 2 * current - last_control if last_command in 'QT' and last_control is not None else current
+                target = origin + args[0:2]
+            # Elevate the quadratic to a cubic
+            segments.append((current, current + 2 / 3 * (q - current), target + 2 / 3 * (q - target), target))
+            last_control, current = q, target
+        last_command = upper
+
+    close_ring()
+    return rings
+
+
+def read_svg_size(svg_path):
+    """'width' and 'height' of a section SVG, read from the root element only."""
+    for _, element in ET.iterparse(svg_path, events=('start',)):
+        return {'width': float(element.get('width')), 'height': float(element.get('height'))}
+    raise ValueError(f'Empty SVG: {svg_path}')
+
+
+def parse_svg(svg_path, tolerance=0.5):
+    """
+    Parse one atlas section SVG.
+
+    Returns
+    -------
+    dict
+        'width', 'height' (SVG pixels), 'sub_image_id' and 'paths': a list of
+        dicts with 'id', 'structure_id', 'order', 'style' and 'rings' (see ``parse_path_d``)
+        in document (drawing) order
+    """
+    root = ET.parse(svg_path).getroot()
+    section = {
+        'width': float(root.get('width')),
+        'height': float(root.get('height')),
+        'sub_image_id': int(os.path.splitext(os.path.basename(svg_path))[0]),
+        'paths': [],
+    }
+    for element in root.iter():
+        if not element.tag.endswith('path') or element.get('structure_id') is None:
+            continue
+        section['paths'].append({
+            'id': int(element.get('id')),
+            'structure_id': int(element.get('structure_id')),
+            'order': int(element.get('order', 0)),
+            'style': element.get('style', ''),
+            'rings': parse_path_d(element.get('d', ''), tolerance),
+        })
+    return section
+
+
+def output_shape(section, scale):
+    """(height, width) of a section rasterized at ``scale``."""
+    return int(round(section['height'] * scale)), int(round(section['width'] * scale))
+
+
+def rasterize_paths(section, scale=0.1, values=None, shape=None):
+    """
+    Rasterize the paths of a parsed section into a label image.
+
+    Paths are filled in document order, so later paths paint over earlier
+    ones, as in the SVG. Subpaths of one path are filled with the even-odd
+    rule, so inner rings become holes.
+
+    Parameters
+    ----------
+    section : dict
+        Output of ``parse_svg``
+    scale : float
+        Output pixels per SVG pixel
+    values : array-like, optional
+        Value drawn for each path (default: 1-based path index). Paths with value
+        0 are skipped
+    shape : tuple, optional
+        (height, width) of the output (default: ``output_shape(section, scale)``)
+
+    Returns
+    -------
+    np.ndarray
+        int32 image of shape ``shape``; 0 where no path was drawn
+    """
+    import cv2
+
+    if shape is None:
+        shape = output_shape(section, scale)
+    if values is None:
+        values = np.arange(1, len(section['paths']) + 1)
+    labels = np.zeros(shape, dtype=np.int32)
+    shift = 4  # sub-pixel vertex precision for cv2.fillPoly
+    for path, value in zip(section['paths'], values):
+        if value == 0 or not path['rings']:
+            continue
+        # -0.5: SVG coordinates address pixel corners, OpenCV addresses pixel centers
+        polys = [np.round((ring * scale - 0.5) * (1 << shift)).astype(np.int32) for ring in path['rings']]
+        cv2.fillPoly(labels, polys, int(value), lineType=cv2.LINE_8, shift=shift)
+    return labels
+
+
+def rasterize_section(svg_path, scale=0.1, tolerance=None):
+    """
+    Rasterize a section SVG to a structure-id image.
+
+    ``tolerance`` defaults to half an output pixel.
+
+    Returns
+    -------
+    np.ndarray
+        uint32 image of Allen structure ids; 0 is background
+    """
+    if tolerance is None:
+        tolerance = 0.5 / scale
+    section = parse_svg(svg_path, tolerance)
+    structure_ids = np.array([0] + [p['structure_id'] for p in section['paths']], dtype=np.uint32)
+    return structure_ids[rasterize_paths(section, scale)]
@@ -0,0 +1,292 @@
+"""Stack the Allen coronal atlas SVGs into a disk-backed structure-id volume.
+
+Sections are ordered along the anterior-posterior (AP) axis. By default they
+are sorted by SectionImage id, which follows the atlas section order. Each
+section is rasterized at ``scale`` output pixels per SVG pixel and written
+into a (AP, height, width) uint32 ``.npy`` file through ``np.memmap``.
+Because the section canvases differ in size, each section is centered in the
+largest canvas. A ``.json`` metadata file describes the axes and the section
+order.
+
+Only a bounded number of rasterized sections are in memory at once, so the
+volume can be larger than RAM.
+
+Example usage:
+  python allen_volume.py build allen_volume.npy --scale 0.05
+  python allen_volume.py build allen_volume.npy --order section_order.json --workers 8
+  python allen_volume.py counts allen_volume.npy --output voxel_counts.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import allen_svg
+
+AXES = ('anterior_posterior', 'superior_inferior', 'left_right')
+
+
+def metadata_path(volume_path):
+    """Path of the metadata JSON stored next to a volume."""
+    return os.path.splitext(volume_path)[0] + '.json'
+
+
+def section_order(svg_dir=allen_svg.SVG_DIR, order=None):
+    """
+    SectionImage ids in anterior-to-posterior order.
+
+    Parameters
+    ----------
+    svg_dir : str
+        Folder of section SVGs
+    order : str, list or dict, optional
+        A list of section ids in AP order, a dict mapping section id to an AP
+        position (e.g. the atlas section number), or a JSON file holding either.
+        Sections missing from a dict are dropped. Default: sorted by id
+
+    Returns
+    -------
+    list of int
+    """
+    available = allen_svg.list_sections(svg_dir)
+    if order is None:
+        return available
+    if isinstance(order, str):
+        with open(order, 'r') as f:
+            order = json.load(f)
+    if isinstance(order, dict):
+        positions = {int(sec_id): float(position) for sec_id, position in order.items()}
+        ordered = sorted((sec_id for sec_id in available if sec_id in positions), key=positions.get)
+    else:
+        ordered = [int(sec_id) for sec_id in order]
+    missing = sorted(set(ordered) - set(available))
+    if missing:
+        raise ValueError(f'Sections without an SVG in {svg_dir}: {missing[:10]}')
+    return ordered
+
+
+def _rasterize(args):
+    svg_path, scale, shape = args
+    section = allen_svg.parse_svg(svg_path, tolerance=0.5 / scale)
+    height, width = allen_svg.output_shape(section, scale)
+    # Center the section canvas in the volume canvas
+    top, left = (shape[0] - height) // 2, (shape[1] - width) // 2
+    section['paths'] = [dict(p, rings=[ring + (left / scale, top / scale) for ring in p['rings']])
+                        for p in section['paths']]
+    structure_ids = np.array([0] + [p['structure_id'] for p in section['paths']], dtype=np.uint32)
+    return structure_ids[allen_svg.rasterize_paths(section, scale, shape=shape)]
+
+
+def build_volume(output_path, svg_dir=allen_svg.SVG_DIR, scale=0.05, order=None,
+                 max_workers=None, max_pending=None, verbose=True):
+    """
+    Rasterize all sections into a memory-mapped (AP, height, width) uint32 volume.
+
+    Parameters
+    ----------
+    output_path : str
+        Output ``.npy`` file; metadata goes to ``metadata_path(output_path)``
+    svg_dir : str
+        Folder of section SVGs
+    scale : float
+        In-plane output pixels per SVG pixel
+    order : str, list or dict, optional
+        Section order, see ``section_order``
+    max_workers : int, optional
+        Worker processes (default: CPU count)
+    max_pending : int, optional
+        Maximum rasterized sections held in memory (default: 2 * workers)
+    verbose : bool
+        Print progress
+
+    Returns
+    -------
+    dict
+        The volume metadata
+    """
+    sections = section_order(svg_dir, order)
+    if not sections:
+        raise ValueError(f'No section SVGs found in {svg_dir}')
+
+    # Canvas size from the SVG headers only
+    height = width = 0
+    for sec_id in sections:
+        section = allen_svg.read_svg_size(os.path.join(svg_dir, f'{sec_id}.svg'))
+        h, w = allen_svg.output_shape(section, scale)
+        height, width = max(height, h), max(width, w)
+    shape = (len(sections), height, width)
+
+    tmp_path = output_path + '.tmp.npy'
+    volume = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint32, shape=shape)
+    structure_ids = set()
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    tasks = iter(enumerate(sections))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        done_count = 0
+        while True:
+            while len(pending) < max_pending:
+                try:
+                    index, sec_id = next(tasks)
+                except StopIteration:
+                    break
+                future = executor.submit(_rasterize, (os.path.join(svg_dir, f'{sec_id}.svg'), scale, shape[1:]))
+                pending[future] = index
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = pending.pop(future)
+                image = future.result()
+                volume[index] = image
+                structure_ids.update(np.unique(image).tolist())
+                done_count += 1
+                if verbose:
+                    print(f'Rasterized section {done_count}/{len(sections)}', end='\r')
+    volume.flush()
+    del volume
+    os.replace(tmp_path, output_path)
+    if verbose:
+        print()
+
+    structure_ids.discard(0)
+    metadata = {
+        'shape': list(shape),
+        'dtype': 'uint32',
+        'axes': list(AXES),
+        'scale': scale,
+        'svg_pixels_per_voxel': 1 / scale,
+        'alignment': 'center',
+        'sections': sections,
+        'structure_ids': sorted(int(i) for i in structure_ids),
+    }
+    with open(metadata_path(output_path), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+class StructureVolume:
+    """
+    Read-only, memory-mapped view of a volume written by ``build_volume``.
+
+    ``volume[ap, y, x]`` indexes the (AP, height, width) array directly; only
+    the touched pages are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.load(path, mmap_mode='r')
+        meta_path = metadata_path(path)
+        self.metadata = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.metadata = json.load(f)
+        self.sections = self.metadata.get('sections', list(range(self.data.shape[0])))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def slice(self, axis, index):
+        """2D slice along ``axis`` (0/'anterior_posterior', 1/'superior_inferior', 2/'left_right')."""
+        if isinstance(axis, str):
+            axis = AXES.index(axis)
+        return np.asarray(np.take(self.data, index, axis=axis))
+
+    def coronal(self, index):
+        return self.slice(0, index)
+
+    def horizontal(self, index):
+        return self.slice(1, index)
+
+    def sagittal(self, index):
+        return self.slice(2, index)
+
+    def section(self, sec_id):
+        """Coronal slice of a SectionImage id."""
+        return self.coronal(self.sections.index(int(sec_id)))
+
+    def voxel_counts(self, structure_ids=None, chunk_sections=16):
+        """
+        Voxels per structure id, in one pass over the volume.
+
+        Parameters
+        ----------
+        structure_ids : array-like, optional
+            Ids to count (default: all ids in the metadata, or found in the volume)
+        chunk_sections : int
+            Coronal sections read per step, bounding memory use
+
+        Returns
+        -------
+        dict
+            structure id -> voxel count (background 0 excluded)
+        """
+        if structure_ids is None:
+            structure_ids = self.metadata.get('structure_ids')
+        if structure_ids is None:
+            found = set()
+            for start in range(0, self.shape[0], chunk_sections):
+                found.update(np.unique(self.data[start:start + chunk_sections]).tolist())
+            found.discard(0)
+            structure_ids = found
+        structure_ids = np.unique(np.asarray(list(structure_ids), dtype=np.uint32))
+
+        # Dense bincount over compact indices; ids not in the list fall into the last bin
+        counts = np.zeros(len(structure_ids) + 1, dtype=np.int64)
+        for start in range(0, self.shape[0], chunk_sections):
+            chunk = np.asarray(self.data[start:start + chunk_sections]).ravel()
+            index = np.searchsorted(structure_ids, chunk)
+            index[index == len(structure_ids)] = 0
+            index = np.where(structure_ids[index] == chunk, index, len(structure_ids))
+            counts += np.bincount(index, minlength=len(structure_ids) + 1)
+        return {int(s): int(c) for s, c in zip(structure_ids, counts[:-1]) if s != 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query an Allen structure-id volume')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Rasterize all sections into a memory-mapped volume')
+    build.add_argument('output', help='Output .npy volume')
+    build.add_argument('--svg-dir', default=allen_svg.SVG_DIR, help='Folder of section SVGs')
+    build.add_argument('--scale', type=float, default=0.05, help='Voxels per SVG pixel in-plane (default: %(default)s)')
+    build.add_argument('--order', default=None,
+                       help='JSON list of section ids in AP order, or dict of section id -> AP position')
+    build.add_argument('--workers', '-w', type=int, default=None, help='Worker processes')
+    build.add_argument('--max-pending', type=int, default=None, help='Maximum sections held in memory')
+
+    counts = subparsers.add_parser('counts', help='Voxel count of every structure')
+    counts.add_argument('volume', help='Volume .npy written by build')
+    counts.add_argument('--output', '-o', default=None, help='Write counts to this CSV instead of printing')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        metadata = build_volume(args.output, args.svg_dir, args.scale, args.order, args.workers, args.max_pending)
+        print(f"Volume {tuple(metadata['shape'])} with {len(metadata['structure_ids'])} structures "
+              f"written to {args.output}")
+    else:
+        result = StructureVolume(args.volume).voxel_counts()
+        if args.output:
+            with open(args.output, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['structure_id', 'voxels'])
+                writer.writerows(sorted(result.items()))
+            print(f"Counts for {len(result)} structures written to {args.output}")
+        else:
+            for structure_id, count in sorted(result.items(), key=lambda item: -item[1]):
+                print(f"{structure_id:>10}  {count:>12,}")
+
+
+if __name__ == '__main__':
+    main()
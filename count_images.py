@@ -5,6 +5,7 @@ Counts common image formats: .jpg, .jpeg, .png, .bmp, .tiff, .tif, .gif, .webp
 """
 
 import os
+import sys
 import argparse
 from collections import defaultdict
 
@@ -47,22 +48,22 @@ def count_images_in_directory(directory_path):
     
     return total_count, format_counts, folder_counts
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Count images in a directory and subdirectories')
     parser.add_argument('directory', nargs='?', default='/home/wanglab/Whisker_Dataset',
                        help='Directory path to scan (default: /home/wanglab/Whisker_Dataset)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     directory_path = args.directory
     
     if not os.path.exists(directory_path):
         print(f"Error: Directory '{directory_path}' does not exist.")
-        return
+        return 1
     
     if not os.path.isdir(directory_path):
         print(f"Error: '{directory_path}' is not a directory.")
-        return
+        return 1
     
     print(f"Counting images in: {directory_path}")
     print()
@@ -93,4 +94,4 @@ def main():
             print(f"  {relative_path}: {count} images")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""Count images in `images` and `labels/tongue` for each parent folder under a root.
+r"""Count images in `images` and `labels/tongue` for each parent folder under a root.
 Also count rows (excluding header) in `labels/jaw/jaw.csv` files.
 
 Example usage (PowerShell):
@@ -73,7 +73,7 @@ def count_csv_rows(csv_path: Path):
         return 0
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Count images in parent folders and CSV rows')
     parser.add_argument('root', nargs='?',
                         default=r'C:\Users\wanglab\Desktop\Mask+Jaw',
@@ -81,7 +81,7 @@ def main():
     parser.add_argument('--csv', '-c', help='Path to write CSV output')
     parser.add_argument('--extensions', '-e', nargs='+',
                         help='List of image extensions to include (with or without leading dot). Example: -e .png .jpg')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     root = Path(args.root)
     if not root.exists():
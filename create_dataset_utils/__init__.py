@@ -0,0 +1,7 @@
+"""Utilities to prepare licking/tracking datasets and Allen atlas data.
+
+Run ``dataset-utils --help`` (or ``python -m create_dataset_utils --help``) for
+the command-line tools.
+"""
+
+__version__ = '0.1.0'
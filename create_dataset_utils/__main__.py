@@ -0,0 +1,5 @@
+import sys
+
+from create_dataset_utils.cli import main
+
+sys.exit(main())
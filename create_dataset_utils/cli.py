@@ -0,0 +1,163 @@
+"""Single command-line entry point for the dataset utilities.
+
+Every subcommand lives in its own module and is imported only when it runs,
+so heavy dependencies (cv2, numpy, pandas, requests, Pillow) are never loaded
+for quick commands such as ``count`` or ``clean``. ``startup-check`` measures
+how long the quick commands take to start and which modules they import.
+
+Example usage:
+  dataset-utils count /data/Mask+Jaw
+  dataset-utils count --labels /data/Mask+Jaw --csv counts.csv
+  dataset-utils clean /data/Mask+Jaw --dry-run
+  dataset-utils convert /data/Mask+Jaw
+  dataset-utils remap labels/jaw/jaw.csv images/
+  dataset-utils build-dataset /data/Mask+Jaw licking_dataset.pkl --stats
+  dataset-utils append-dataset append /data/Mask+Jaw /data/licking_dataset
+  dataset-utils transcode /data/Mask+Jaw /data/Mask+Jaw-fast --format npy
+  dataset-utils dedup /data/Mask+Jaw --manifest dedup.json --link
+  dataset-utils download-atlas svgs --output-dir allen_svg_coronal
+  dataset-utils atlas-dataset allen_dataset --downsample 4 --level 5
+  dataset-utils startup-check
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROG = 'dataset-utils'
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_WRANGLING_DIR = os.path.join(REPO_ROOT, 'tracking', 'tongue', 'data_wrangling')
+
+# Seconds a quick command may take from interpreter start to exit
+STARTUP_BUDGET = 0.5
+HEAVY_MODULES = ('cv2', 'numpy', 'pandas', 'PIL', 'requests', 'tqdm', 'matplotlib', 'keras', 'tensorflow')
+
+# name -> (module, function, help, extra sys.path entry)
+COMMANDS = {
+    'count': ('count_images', 'main', 'Count images in a directory tree (--labels: per-experiment label counts)', None),
+    'clean': ('create_dataset_utils.file_utils', 'clean_main', 'Delete .DS_Store/._ files', None),
+    'convert': ('create_dataset_utils.file_utils', 'convert_main', 'Convert labels/tongue images to PNG', None),
+    'remap': ('create_dataset_utils.file_utils', 'remap_main', 'Replace jaw CSV frame numbers with image names', None),
+    'build-dataset': ('licking_data_parser', 'main', 'Load a licking dataset folder into one dataset file',
+                      DATA_WRANGLING_DIR),
+    'append-dataset': ('incremental_ingest', 'main', 'Append new or changed experiment folders to a built dataset',
+                       DATA_WRANGLING_DIR),
+    'transcode': ('create_dataset_utils.transcode', 'main', 'Transcode frames to a fast-decode format (mirror tree)',
+                  None),
+    'dedup': ('create_dataset_utils.dedup', 'main', 'Find byte-identical files; hard-link or record them', None),
+    'download-atlas': ('download_allen', 'main', 'Download Allen atlas SVGs, ontology and masks', None),
+    'atlas-dataset': ('allen_dataset', 'main', 'Build paired Allen section images and annotation labels', None),
+}
+QUICK_COMMANDS = ('count', 'clean', 'remap')
+
+
+def _run_command(name, argv):
+    module_name, function_name, _, extra_path = COMMANDS[name]
+    if name == 'count' and '--labels' in argv:
+        module_name = 'count_mask_jaw'
+        argv = [arg for arg in argv if arg != '--labels']
+    if extra_path is not None:
+        if not os.path.isdir(extra_path):
+            raise SystemExit(f'{PROG} {name} needs a source checkout: its modules live in '
+                             f'{os.path.relpath(extra_path, REPO_ROOT)} of the repository and are not installed. '
+                             f'Install the clone with "pip install -e ."')
+        # The repository root holds the notebooks' utils.py shim, which would
+        # shadow the tracking repo's ``utils`` package these modules import
+        sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != REPO_ROOT]
+        if extra_path not in sys.path:
+            sys.path.insert(0, extra_path)
+    elif REPO_ROOT not in sys.path:
+        sys.path.append(REPO_ROOT)
+    function = getattr(importlib.import_module(module_name), function_name)
+    # Subcommand parsers take their program name from sys.argv[0]
+    sys.argv = [f'{PROG} {name}'] + list(argv)
+    result = function(argv)
+    return result if isinstance(result, int) else 0
+
+
+def startup_check(budget=STARTUP_BUDGET, repeats=3, verbose=True):
+    """
+    Time quick commands in fresh interpreters and list the heavy modules they import.
+
+    Returns
+    -------
+    dict
+        command -> {'seconds': best wall time, 'heavy_modules': [...], 'ok': bool}
+    """
+    probe = ('import sys, runpy\n'
+             'try:\n'
+             '    runpy.run_module("create_dataset_utils", run_name="__main__")\n'
+             'except SystemExit:\n'
+             '    pass\n'
+             'heavy = {heavy!r}\n'
+             'sys.stderr.write("HEAVY:" + ",".join(m for m in heavy if m in sys.modules) + "\\n")\n'
+             ).format(heavy=HEAVY_MODULES)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO_ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'jaw.csv'), 'w') as f:
+            f.write('frame,x,y\n0,1,2\n')
+        os.makedirs(os.path.join(tmp, 'images'))
+        open(os.path.join(tmp, 'images', 'a.png'), 'wb').close()
+        invocations = {
+            'count': ['count', tmp],
+            'clean': ['clean', tmp, '--dry-run'],
+            'remap': ['remap', os.path.join(tmp, 'jaw.csv'), os.path.join(tmp, 'images'),
+                      '--output', os.path.join(tmp, 'out.csv')],
+        }
+        for name in QUICK_COMMANDS:
+            best = float('inf')
+            heavy = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                proc = subprocess.run([sys.executable, '-c', probe] + invocations[name],
+                                      capture_output=True, text=True, env=env)
+                best = min(best, time.perf_counter() - start)
+                for line in proc.stderr.splitlines():
+                    if line.startswith('HEAVY:'):
+                        heavy = [m for m in line[len('HEAVY:'):].split(',') if m]
+            results[name] = {'seconds': best, 'heavy_modules': heavy, 'ok': best <= budget and not heavy}
+
+    if verbose:
+        print(f"{'Command':<10} {'Startup':>9}  Heavy imports")
+        for name, result in results.items():
+            status = 'ok' if result['ok'] else 'OVER BUDGET'
+            print(f"{name:<10} {result['seconds'] * 1000:>7.0f}ms  {', '.join(result['heavy_modules']) or '-'}"
+                  f"  {status}")
+        print(f'Budget: {budget * 1000:.0f} ms per command, no heavy imports')
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(
+        prog=PROG,
+        description='Dataset preparation utilities. Run "%(prog)s <command> --help" for command options.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(f'  {name:<16}{spec[2]}' for name, spec in COMMANDS.items())
+               + f'\n  {"startup-check":<16}Measure the startup time of the quick commands')
+    parser.add_argument('command', choices=list(COMMANDS) + ['startup-check'], metavar='command')
+    parser.add_argument('--version', action='version',
+                        version=f'%(prog)s {importlib.import_module("create_dataset_utils").__version__}')
+
+    # Only the command name is parsed here; the rest goes to the subcommand's own parser
+    split = next((i for i, arg in enumerate(argv) if not arg.startswith('-')), len(argv))
+    args = parser.parse_args(argv[:split + 1])
+    if args.command == 'startup-check':
+        check = argparse.ArgumentParser(prog=f'{PROG} startup-check', description=startup_check.__doc__)
+        check.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='Seconds (default: %(default)s)')
+        check.add_argument('--repeats', type=int, default=3, help='Runs per command; the best is kept')
+        check_args = check.parse_args(argv[split + 1:])
+        results = startup_check(check_args.budget, check_args.repeats)
+        return 0 if all(result['ok'] for result in results.values()) else 1
+    return _run_command(args.command, argv[split + 1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Find byte-identical files across a dataset tree and deduplicate them.
+
+Correction rounds and re-exports copy the same images and masks into many
+experiment folders. ``find_duplicates`` finds them in three passes, each on
+fewer files than the last:
+
+1. group files by size (one ``os.walk``, no reads); unique sizes are done,
+2. hash the first chunk of every remaining file,
+3. hash the full content, chunk by chunk, of files whose first chunks match.
+
+Hashing runs on a thread pool (hashlib releases the GIL while hashing), and
+files that are already hard links of each other are read only once.
+
+Duplicates can then be replaced with hard links to one canonical copy
+(``link_duplicates``; contents are compared byte by byte first), and/or
+recorded in a JSON manifest (``write_manifest``). Passing the manifest to
+``load_licking_data(dedup_manifest=...)`` decodes each duplicated file once.
+"""
+
+import filecmp
+import hashlib
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 2 ** 20
+HEAD_SIZE = 64 * 2 ** 10
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE, limit=None):
+    """BLAKE2b hex digest of a file, read in chunks.
+
+    Args:
+        path (str): File to hash.
+        chunk_size (int): Bytes read per call.
+        limit (int|None): Hash only the first ``limit`` bytes.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    remaining = limit
+    with open(path, 'rb') as fh:
+        while remaining is None or remaining > 0:
+            chunk = fh.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _split_by_hash(groups, executor, limit, links):
+    """Split groups of paths by (partial) content hash; drop unique files that have no other hard links."""
+    paths = [path for group in groups for path in group]
+    digests = dict(zip(paths, executor.map(lambda p: hash_file(p, limit=limit), paths)))
+    result = []
+    for group in groups:
+        by_hash = defaultdict(list)
+        for path in group:
+            by_hash[digests[path]].append(path)
+        result.extend((digest, members) for digest, members in by_hash.items()
+                      if len(members) > 1 or len(links[members[0]]) > 1)
+    return result
+
+
+def find_duplicates(root_directory, extensions=None, min_size=1, max_workers=8, exclude=(), verbose=True):
+    """Find groups of byte-identical files under ``root_directory``.
+
+    Args:
+        root_directory (str): Dataset root to scan.
+        extensions (tuple|None): Only consider these file extensions (e.g. ('.png', '.jpg')); None
+            considers every file.
+        min_size (int): Ignore files smaller than this many bytes (empty files by default).
+        max_workers (int): Hashing threads.
+        exclude (tuple): Paths to skip (e.g. the manifest being written).
+        verbose (bool): Print the progress of every pass.
+
+    Returns:
+        dict: Summary with keys files (scanned), groups (list of dicts with 'size', 'hash' and
+              'paths', sorted; the first path is the canonical copy), duplicates (files that are
+              copies of another), duplicate_bytes (bytes that hard-linking would free), hashed_bytes.
+    """
+    if not os.path.isdir(root_directory):
+        raise ValueError(f'Root directory does not exist: {root_directory}')
+    extensions = None if extensions is None else tuple(ext.lower() for ext in extensions)
+    exclude = {os.path.abspath(path) for path in exclude}
+
+    # Pass 1: sizes. Hard links of one inode are hashed once and share the result
+    by_size = defaultdict(list)
+    inode_paths = defaultdict(list)
+    n_files = 0
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.endswith('.tmp') or (extensions is not None and not fname.lower().endswith(extensions)):
+                continue
+            path = os.path.join(dirpath, fname)
+            if os.path.abspath(path) in exclude or os.path.islink(path):
+                continue
+            st = os.stat(path)
+            if st.st_size < min_size:
+                continue
+            n_files += 1
+            inode = (st.st_dev, st.st_ino)
+            if not inode_paths[inode]:
+                by_size[st.st_size].append(path)
+            inode_paths[inode].append(path)
+    inode_of = {paths[0]: paths for paths in inode_paths.values()}
+    candidates = {size: paths for size, paths in by_size.items()
+                  if len(paths) > 1 or len(inode_of[paths[0]]) > 1}
+    if verbose:
+        print(f'{n_files} files, {sum(len(p) for p in candidates.values())} share a size with another file')
+
+    hashed_bytes = 0
+    groups = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Files that are only hard links of each other need no hashing
+        multi = {}
+        for size, paths in candidates.items():
+            if len(paths) > 1:
+                multi[size] = paths
+            else:
+                groups.append((size, None, paths))
+
+        # Pass 2: first chunk; files no larger than it are fully hashed here
+        small = [paths for size, paths in multi.items() if size <= HEAD_SIZE]
+        large = [paths for size, paths in multi.items() if size > HEAD_SIZE]
+        hashed_bytes += sum(size * len(paths) for size, paths in multi.items() if size <= HEAD_SIZE)
+        hashed_bytes += HEAD_SIZE * sum(len(paths) for paths in large)
+        for digest, paths in _split_by_hash(small, executor, None, inode_of):
+            groups.append((os.path.getsize(paths[0]), digest, paths))
+        head_groups = [paths for _, paths in _split_by_hash(large, executor, HEAD_SIZE, inode_of)]
+        if verbose:
+            print(f'{sum(len(p) for p in head_groups)} large files share their first {HEAD_SIZE // 1024} KB; '
+                  f'hashing their full content')
+
+        # Pass 3: full content
+        hashed_bytes += sum(os.path.getsize(p[0]) * len(p) for p in head_groups)
+        for digest, paths in _split_by_hash(head_groups, executor, None, inode_of):
+            groups.append((os.path.getsize(paths[0]), digest, paths))
+
+    result = []
+    duplicate_bytes = 0
+    for size, digest, paths in groups:
+        duplicate_bytes += size * (len(paths) - 1)  # hard links of one inode hold no extra bytes
+        members = sorted(path for first in paths for path in inode_of[first])
+        if digest is None:
+            digest = hash_file(members[0])
+        result.append({'size': size, 'hash': digest, 'paths': members})
+    result.sort(key=lambda group: group['paths'][0])
+
+    summary = {'files': n_files, 'groups': result,
+               'duplicates': sum(len(g['paths']) - 1 for g in result),
+               'duplicate_bytes': duplicate_bytes,
+               'hashed_bytes': hashed_bytes}
+    if verbose:
+        print(f"{summary['duplicates']} duplicate files in {len(result)} groups "
+              f"({summary['duplicate_bytes'] / 2 ** 20:.1f} MB; hashed {hashed_bytes / 2 ** 20:.1f} MB)")
+    return summary
+
+
+def link_duplicates(groups, dry_run=False, verbose=True):
+    """Replace every duplicate with a hard link to the first path of its group.
+
+    Contents are compared byte by byte before a file is replaced, and the link is
+    created under a temporary name and renamed over the duplicate.
+
+    Args:
+        groups (list): Groups as returned by ``find_duplicates``.
+        dry_run (bool): Only report what would be linked.
+        verbose (bool): Print every failure and the totals.
+
+    Returns:
+        dict: Summary with keys linked, already_linked, saved_bytes, errors (list of (path, error_str)).
+    """
+    summary = {'linked': 0, 'already_linked': 0, 'saved_bytes': 0, 'errors': []}
+    for group in groups:
+        canonical = group['paths'][0]
+        canonical_stat = os.stat(canonical)
+        for path in group['paths'][1:]:
+            try:
+                st = os.stat(path)
+                if (st.st_dev, st.st_ino) == (canonical_stat.st_dev, canonical_stat.st_ino):
+                    summary['already_linked'] += 1
+                    continue
+                if st.st_dev != canonical_stat.st_dev:
+                    raise OSError('on a different file system than its canonical copy')
+                if not filecmp.cmp(canonical, path, shallow=False):
+                    raise ValueError('content differs from its canonical copy')
+                if not dry_run:
+                    tmp_path = path + '.tmp'
+                    os.link(canonical, tmp_path)
+                    os.replace(tmp_path, path)
+                summary['linked'] += 1
+                summary['saved_bytes'] += group['size']
+            except (OSError, ValueError) as e:
+                summary['errors'].append((path, str(e)))
+                if verbose:
+                    print(f'Not linked: {path}: {e}')
+    if verbose:
+        action = 'Would link' if dry_run else 'Linked'
+        print(f"{action} {summary['linked']} duplicates ({summary['saved_bytes'] / 2 ** 20:.1f} MB saved, "
+              f"{summary['already_linked']} already linked, {len(summary['errors'])} errors)")
+    return summary
+
+
+def write_manifest(groups, root_directory, manifest_path):
+    """Write the duplicate groups as JSON, with paths relative to ``root_directory``.
+
+    Args:
+        groups (list): Groups as returned by ``find_duplicates``.
+        root_directory (str): Root the paths are made relative to (stored as an absolute path).
+        manifest_path (str): Output JSON path.
+    """
+    root = os.path.abspath(root_directory)
+    manifest = {'root': root,
+                'groups': [{'size': g['size'], 'hash': g['hash'],
+                            'paths': [os.path.relpath(os.path.abspath(p), root) for p in g['paths']]}
+                           for g in groups]}
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def main(argv=None):
+    """CLI: report, hard-link and/or record duplicate files of a dataset tree."""
+    import argparse
+    parser = argparse.ArgumentParser(description='Find byte-identical files in a dataset tree')
+    parser.add_argument('root', help='Dataset root containing experiment folders')
+    parser.add_argument('--extensions', nargs='+', default=None,
+                        help='Only consider these extensions (default: all files)')
+    parser.add_argument('--min-size', type=int, default=1, help='Ignore smaller files (default: 1 byte)')
+    parser.add_argument('--workers', type=int, default=8, help='Hashing threads (default: 8)')
+    parser.add_argument('--manifest', default=None, help='Write the duplicate groups to this JSON file')
+    parser.add_argument('--link', action='store_true', help='Replace duplicates with hard links')
+    parser.add_argument('--dry-run', action='store_true', help='With --link, only report what would be linked')
+    args = parser.parse_args(argv)
+    summary = find_duplicates(args.root, extensions=args.extensions, min_size=args.min_size,
+                              max_workers=args.workers, exclude=[args.manifest] if args.manifest else ())
+    if args.manifest:
+        write_manifest(summary['groups'], args.root, args.manifest)
+        print(f'Wrote {len(summary["groups"])} groups to {args.manifest}')
+    if args.link:
+        if link_duplicates(summary['groups'], dry_run=args.dry_run)['errors']:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    main()
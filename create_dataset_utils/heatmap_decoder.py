@@ -0,0 +1,118 @@
+"""
+Vectorized conversion of keypoint heatmaps back to pixel coordinates.
+
+This is the inverse of the Gaussian jaw heatmaps built by ``load_licking_data``
+and of the heatmaps predicted by the pole tracker. A whole batch is decoded at
+once; there is no Python loop over frames or keypoints.
+"""
+
+import numpy as np
+
+
+DECODE_METHODS = ('argmax', 'quadratic', 'soft_argmax')
+
+
+def _as_batch(heatmaps):
+    """Return heatmaps as float64 (N, H, W, K) scaled to [0, 1]."""
+    heatmaps = np.asarray(heatmaps)
+    if heatmaps.ndim == 3:
+        heatmaps = heatmaps[..., np.newaxis]
+    if heatmaps.ndim != 4:
+        raise ValueError(f'Expected heatmaps of shape (N, H, W, K), got {heatmaps.shape}')
+    scale = 255.0 if heatmaps.dtype == np.uint8 else 1.0
+    return heatmaps.astype(np.float64) / scale
+
+
+def _quadratic_offset(left, center, right):
+    """Sub-pixel peak offset of a parabola through three log-samples, in [-0.5, 0.5]."""
+    eps = 1e-10
+    left, center, right = (np.log(np.maximum(v, eps)) for v in (left, center, right))
+    denominator = left - 2 * center + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = 0.5 * (left - right) / denominator
+    # Only refine proper maxima; flat or saturated peaks keep the integer position
+    offset = np.where(denominator < 0, offset, 0.0)
+    return np.clip(np.nan_to_num(offset), -0.5, 0.5)
+
+
+def decode_heatmaps(heatmaps, original_resolution=None, method='quadratic', threshold=0.1, window=2):
+    """
+    Decode a batch of heatmaps to keypoint coordinates.
+
+    Parameters
+    ----------
+    heatmaps : np.ndarray
+        Heatmaps of shape (N, H, W, K), or (N, H, W) for a single keypoint.
+        ``uint8`` heatmaps (as saved by ``load_licking_data``) are scaled to [0, 1]
+    original_resolution : tuple or np.ndarray, optional
+        (height, width) of the original frames, either one pair for the whole
+        batch or an array of shape (N, 2). Coordinates are scaled from heatmap
+        pixels by ``original / heatmap size``, the inverse of the scaling used
+        when the labels were built. If None, heatmap pixels are returned
+    method : str
+        'argmax' (integer peak), 'quadratic' (parabola fit through the log of the
+        peak and its neighbours, exact for Gaussian heatmaps) or 'soft_argmax'
+        (weighted centroid of a window around the peak)
+    threshold : float
+        Keypoints whose peak value is below this are marked occluded
+    window : int
+        Half-width of the soft_argmax window
+
+    Returns
+    -------
+    coords : np.ndarray
+        (x, y) coordinates, shape (N, K, 2); NaN for occluded keypoints
+    confidence : np.ndarray
+        Peak heatmap value in [0, 1], shape (N, K)
+    visible : np.ndarray
+        Boolean mask of keypoints at or above ``threshold``, shape (N, K)
+    """
+    if method not in DECODE_METHODS:
+        raise ValueError(f'Unknown method {method!r}, expected one of {DECODE_METHODS}')
+
+    heatmaps = _as_batch(heatmaps)
+    n, h, w, k = heatmaps.shape
+
+    # (N, K, H, W) so each keypoint map is contiguous
+    maps = np.moveaxis(heatmaps, 3, 1)
+    flat = maps.reshape(n, k, h * w)
+    peak = flat.argmax(axis=2)
+    confidence = np.take_along_axis(flat, peak[..., np.newaxis], axis=2)[..., 0]
+    py, px = np.divmod(peak, w)
+    x = px.astype(np.float64)
+    y = py.astype(np.float64)
+
+    if method == 'quadratic':
+        def sample(dy, dx):
+            yy = np.clip(py + dy, 0, h - 1)
+            xx = np.clip(px + dx, 0, w - 1)
+            return np.take_along_axis(flat, (yy * w + xx)[..., np.newaxis], axis=2)[..., 0]
+
+        x_offset = _quadratic_offset(sample(0, -1), confidence, sample(0, 1))
+        y_offset = _quadratic_offset(sample(-1, 0), confidence, sample(1, 0))
+        # Neighbours outside the map are clamped to the peak itself; do not refine there
+        x += np.where((px > 0) & (px < w - 1), x_offset, 0.0)
+        y += np.where((py > 0) & (py < h - 1), y_offset, 0.0)
+
+    elif method == 'soft_argmax':
+        offsets = np.arange(-window, window + 1)
+        # (N, K, S, S) window indices around each peak, clipped to the map
+        yy = np.clip(py[..., np.newaxis, np.newaxis] + offsets[:, np.newaxis], 0, h - 1)
+        xx = np.clip(px[..., np.newaxis, np.newaxis] + offsets[np.newaxis, :], 0, w - 1)
+        index = (yy * w + xx).reshape(n, k, -1)
+        weights = np.take_along_axis(flat, index, axis=2)
+        total = weights.sum(axis=2)
+        safe_total = np.where(total > 0, total, 1.0)
+        x = np.where(total > 0, (weights * (index % w)).sum(axis=2) / safe_total, x)
+        y = np.where(total > 0, (weights * (index // w)).sum(axis=2) / safe_total, y)
+
+    coords = np.stack([x, y], axis=-1)
+
+    if original_resolution is not None:
+        original_resolution = np.asarray(original_resolution, dtype=np.float64).reshape(-1, 2)
+        scale = np.stack([original_resolution[:, 1] / w, original_resolution[:, 0] / h], axis=-1)
+        coords = coords * scale[:, np.newaxis, :]
+
+    visible = confidence >= threshold
+    coords[~visible] = np.nan
+    return coords, confidence, visible
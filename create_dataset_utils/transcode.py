@@ -0,0 +1,271 @@
+"""Transcode the frames of whole experiment trees to a fast-decode format.
+
+Decoding heavily compressed PNGs and JPEGs is the main cost of every ingest.
+``transcode_frames`` mirrors a dataset tree (experiment folders with
+``images/`` and ``labels/``) into a new root, converting every frame in the
+``images`` folders in parallel to either
+
+* ``png``: PNG with a low zlib compression level (lossless), or
+* ``npy``: the raw decoded array, optionally resized to a fixed resolution.
+
+Frame names are kept (only the extension changes), so frame numbers, jaw CSV
+rows and tongue mask names still match. Everything else in the tree (labels,
+CSVs, videos) is hard-linked, or copied where links are not possible. Every
+converted frame is decoded again and compared with the pixels that were
+written; without resizing this is pixel equality with the source frame. Source
+and output decode times are summed to report the decode speed-up.
+
+Every converted ``images`` folder gets an ``images/transcode.json`` with the
+settings and the original frame resolution, so the loader still scales jaw
+coordinates and crop boxes from original pixels when frames are resized. It is
+written before the folder's frames are converted; a resumed run only skips
+existing frames of folders whose metadata matches the current settings.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = ('png', 'npy')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+METADATA_NAME = 'transcode.json'
+
+
+def _decode(data, path):
+    """Decode file bytes as the loader does (``cv2.imread`` colour, or ``np.load`` for .npy)."""
+    import io
+    import cv2
+    import numpy as np
+    if path.lower().endswith('.npy'):
+        return np.load(io.BytesIO(data))
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _transcode_file(job):
+    """Convert one frame; runs in a worker process. Returns a result dict."""
+    import cv2
+    import numpy as np
+    src_path, dst_path, fmt, png_compression, resolution, verify = job
+    result = {'src': src_path, 'dst': dst_path, 'error': None, 'equal': None, 'shape': None,
+              'src_bytes': 0, 'dst_bytes': 0, 'src_decode': 0.0, 'dst_decode': 0.0}
+    try:
+        with open(src_path, 'rb') as fh:
+            src_data = fh.read()
+        start = time.perf_counter()
+        image = _decode(src_data, src_path)
+        result['src_decode'] = time.perf_counter() - start
+        if image is None:
+            raise ValueError('could not decode image')
+        result['shape'] = list(image.shape[:2])
+        if resolution is not None and (image.shape[1], image.shape[0]) != tuple(resolution):
+            image = cv2.resize(image, tuple(resolution), interpolation=cv2.INTER_AREA)
+
+        if fmt == 'png':
+            ok, encoded = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, png_compression])
+            if not ok:
+                raise ValueError('PNG encoding failed')
+            dst_data = encoded.tobytes()
+        else:
+            import io
+            buffer = io.BytesIO()
+            np.save(buffer, np.ascontiguousarray(image))
+            dst_data = buffer.getvalue()
+
+        tmp_path = dst_path + '.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(dst_data)
+        os.replace(tmp_path, dst_path)
+        result['src_bytes'] = len(src_data)
+        result['dst_bytes'] = len(dst_data)
+
+        if verify:
+            with open(dst_path, 'rb') as fh:
+                written = fh.read()
+            start = time.perf_counter()
+            decoded = _decode(written, dst_path)
+            result['dst_decode'] = time.perf_counter() - start
+            result['equal'] = decoded is not None and np.array_equal(decoded, image)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _folder_metadata(out_dir, src_paths, fmt, png_compression, resolution, overwrite):
+    """Check (or with ``overwrite`` replace) a folder's ``transcode.json`` and write it before any frame.
+
+    Returns:
+        bool: Whether existing outputs may be kept (they were written with the current settings).
+    """
+    metadata_path = os.path.join(out_dir, METADATA_NAME)
+    settings = {'format': fmt, 'resolution': None if resolution is None else list(resolution),
+                'png_compression': png_compression if fmt == 'png' else None}
+    existing = None
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as fh:
+            existing = json.load(fh)
+    if existing is not None and all(existing.get(key) == value for key, value in settings.items()):
+        return not overwrite
+    stems = {os.path.splitext(os.path.basename(path))[0] for path in src_paths}
+    outputs = [fname for fname in os.listdir(out_dir)
+               if os.path.splitext(fname)[0] in stems and os.path.splitext(fname)[1][1:] in FORMATS]
+    if outputs and not overwrite:
+        found = 'other settings' if existing is not None else f'no {METADATA_NAME}'
+        raise ValueError(f'{out_dir} holds frames transcoded with {found}; '
+                         f'pass overwrite=True (--overwrite) or use a new output directory')
+    for fname in outputs:
+        os.remove(os.path.join(out_dir, fname))
+
+    # The loader scales jaw coordinates from the original frame size
+    with open(src_paths[0], 'rb') as fh:
+        image = _decode(fh.read(), src_paths[0])
+    if image is None:
+        raise ValueError(f'Could not decode {src_paths[0]} to read the original resolution')
+    metadata = dict(settings, original_resolution=list(image.shape[:2]))
+    tmp_path = metadata_path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(metadata, fh, indent=1)
+    os.replace(tmp_path, metadata_path)
+    return False
+
+
+def _link_or_copy(src_path, dst_path):
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+
+def transcode_frames(root_directory, output_directory, fmt='png', png_compression=1, resolution=None,
+                     images_dir_name='images', image_extensions=IMAGE_EXTENSIONS, max_workers=None,
+                     verify=True, overwrite=False, verbose=True):
+    """Transcode the frames of every ``images`` folder under ``root_directory`` into a mirror tree.
+
+    Args:
+        root_directory (str): Dataset root containing experiment folders.
+        output_directory (str): Root of the mirrored, transcoded tree (must differ from the source).
+        fmt (str): 'png' (low-compression PNG) or 'npy' (raw arrays).
+        png_compression (int): zlib level 0-9 for PNG output; 0-1 decode fastest.
+        resolution (tuple|None): (width, height) to resize frames to; None keeps the original size
+            and makes the conversion lossless.
+        images_dir_name (str): Name of the frame folders.
+        image_extensions (tuple): Frame file extensions to convert; other files are linked.
+        max_workers (int|None): Worker processes (default: CPU count).
+        verify (bool): Decode every output and compare it with the written pixels.
+        overwrite (bool): Convert frames whose output already exists. Otherwise they are skipped,
+            so an interrupted run can be resumed, provided the folder's ``transcode.json`` matches
+            the current settings (ValueError if not).
+        verbose (bool): Print progress and the final report.
+
+    Returns:
+        dict: Summary with keys converted, skipped, linked, errors (list of (path, error_str)),
+              mismatches (list of paths), src_bytes, dst_bytes, src_decode_seconds,
+              dst_decode_seconds, decode_speedup.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'fmt must be one of {FORMATS}, got {fmt!r}')
+    if not os.path.isdir(root_directory):
+        raise ValueError(f'Root directory does not exist: {root_directory}')
+    root_directory = os.path.abspath(root_directory)
+    output_directory = os.path.abspath(output_directory)
+    if output_directory == root_directory or output_directory.startswith(root_directory + os.sep):
+        raise ValueError('output_directory must be outside root_directory')
+    extensions = tuple(ext.lower() for ext in image_extensions)
+
+    jobs = []
+    linked = 0
+    skipped = 0
+    image_folders = set()
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        dirnames.sort()
+        out_dir = os.path.join(output_directory, os.path.relpath(dirpath, root_directory))
+        os.makedirs(out_dir, exist_ok=True)
+        frames = []
+        if os.path.basename(dirpath) == images_dir_name:
+            frames = [fname for fname in sorted(filenames) if os.path.splitext(fname)[1].lower() in extensions]
+        keep_existing = False
+        if frames:
+            image_folders.add(out_dir)
+            keep_existing = _folder_metadata(out_dir, [os.path.join(dirpath, fname) for fname in frames],
+                                             fmt, png_compression, resolution, overwrite)
+        frames = set(frames)
+        for fname in sorted(filenames):
+            src_path = os.path.join(dirpath, fname)
+            if fname in frames:
+                dst_path = os.path.join(out_dir, os.path.splitext(fname)[0] + '.' + fmt)
+                if keep_existing and os.path.exists(dst_path):
+                    skipped += 1
+                    continue
+                jobs.append((src_path, dst_path, fmt, png_compression,
+                             None if resolution is None else tuple(resolution), verify))
+            elif fname != METADATA_NAME:
+                dst_path = os.path.join(out_dir, fname)
+                if not os.path.exists(dst_path):
+                    _link_or_copy(src_path, dst_path)
+                    linked += 1
+
+    if verbose:
+        print(f'Transcoding {len(jobs)} frames in {len(image_folders)} folders to {fmt} '
+              f'({skipped} already done, {linked} other files linked)')
+
+    summary = {'converted': 0, 'skipped': skipped, 'linked': linked, 'errors': [], 'mismatches': [],
+               'src_bytes': 0, 'dst_bytes': 0, 'src_decode_seconds': 0.0, 'dst_decode_seconds': 0.0}
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(jobs) // (4 * workers))
+        for done, result in enumerate(executor.map(_transcode_file, jobs, chunksize=chunksize), 1):
+            if result['error'] is not None:
+                summary['errors'].append((result['src'], result['error']))
+                continue
+            summary['converted'] += 1
+            if result['equal'] is False:
+                summary['mismatches'].append(result['src'])
+            for key in ('src_bytes', 'dst_bytes'):
+                summary[key] += result[key]
+            summary['src_decode_seconds'] += result['src_decode']
+            summary['dst_decode_seconds'] += result['dst_decode']
+            if verbose and done % 1000 == 0:
+                print(f'  {done}/{len(jobs)} frames')
+
+    summary['decode_speedup'] = (summary['src_decode_seconds'] / summary['dst_decode_seconds']
+                                 if summary['dst_decode_seconds'] else None)
+    if verbose:
+        print(f"Converted {summary['converted']} frames, {len(summary['errors'])} errors, "
+              f"{len(summary['mismatches'])} pixel mismatches")
+        print(f"Size: {summary['src_bytes'] / 2 ** 20:.1f} MB -> {summary['dst_bytes'] / 2 ** 20:.1f} MB")
+        if summary['decode_speedup'] is not None:
+            print(f"Decode time: {summary['src_decode_seconds']:.2f}s -> {summary['dst_decode_seconds']:.2f}s "
+                  f"({summary['decode_speedup']:.1f}x faster)")
+    return summary
+
+
+def main(argv=None):
+    """CLI: transcode the frames of a dataset tree into a mirror tree."""
+    import argparse
+    parser = argparse.ArgumentParser(description='Transcode dataset frames to a fast-decode format in a mirror tree')
+    parser.add_argument('root', help='Dataset root containing experiment folders')
+    parser.add_argument('output', help='Root of the transcoded copy')
+    parser.add_argument('--format', dest='fmt', choices=FORMATS, default='png',
+                        help='png: low-compression PNG; npy: raw arrays (default: png)')
+    parser.add_argument('--compression', type=int, default=1, help='PNG zlib level 0-9 (default: 1)')
+    parser.add_argument('--resolution', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'),
+                        help='Resize frames to a fixed resolution (not lossless)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--no-verify', dest='verify', action='store_false',
+                        help='Do not decode and compare the outputs')
+    parser.add_argument('--overwrite', action='store_true', help='Convert frames whose output already exists')
+    args = parser.parse_args(argv)
+    try:
+        summary = transcode_frames(args.root, args.output, fmt=args.fmt, png_compression=args.compression,
+                                   resolution=args.resolution, max_workers=args.workers, verify=args.verify,
+                                   overwrite=args.overwrite)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 1 if summary['errors'] or summary['mismatches'] else 0
+
+
+if __name__ == '__main__':
+    main()
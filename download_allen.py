@@ -1,42 +1,378 @@
-import requests
+"""Download Allen Mouse Brain Atlas data.
+
+Fetches the coronal structure-boundary SVGs and the structure ontology, which
+is cached locally and indexed with Euler-tour intervals so "is A inside B"
+and "all descendants of B" are constant-time range checks. Masks of any
+ontology structure or level can be aggregated across all sections.
+
+Example usage:
+  python download_allen.py svgs --output-dir allen_svg_coronal
+  python download_allen.py ontology
+  python download_allen.py masks 315 --scale 0.05 --output-dir isocortex_masks
+  python download_allen.py masks --level 5 --scale 0.05 --output-dir level5_labels
+"""
+
+import argparse
 import csv
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import allen_svg
+
+API_BASE = 'http://api.brain-map.org'
+# Per-user cache, so the ontology is shared by all working directories and never written into site-packages
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+                         'create_dataset_utils')
+ONTOLOGY_CACHE = os.path.join(CACHE_DIR, 'allen_structure_graph.json')
+
+
+def list_section_ids(api_base=API_BASE):
+    """Ids of the coronal AtlasImages (Adult Mouse, atlas 1) that have structure boundaries."""
+    import requests
+
+    # AtlasImage IDs with Structure boundaries (GraphicGroupLabel.id=28)
+    csv_url = (f"{api_base}/api/v2/data/query.csv?"
+               "criteria=model::AtlasImage,"
+               "rma::criteria,atlas_data_set(atlases[id$eq1]),"
+               "graphic_objects(graphic_group_label[id$eq28]),"
+               "rma::options[tabular$eq'sub_images.id'][order$eq'sub_images.id']"
+               "&num_rows=all&start_row=0")
+
+    print("Downloading list of SectionImage IDs...")
+    response = requests.get(csv_url)
+    response.raise_for_status()
+
+    # Parse CSV to get SectionImage IDs
+    lines = response.text.splitlines()
+    reader = csv.DictReader(lines)
+    section_ids = [row['id'] for row in reader]
+
+    print(f"Found {len(section_ids)} SectionImages with structure boundaries.")
+    return section_ids
+
+
+def download_section_svgs(output_dir=allen_svg.SVG_DIR, api_base=API_BASE):
+    """Download the structure-boundary SVG of every coronal AtlasImage (Adult Mouse, atlas 1)."""
+    import requests
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Step 1: Get list of AtlasImage IDs
+    section_ids = list_section_ids(api_base)
+
+    # Step 2: Download SVG for each SectionImage
+    for sec_id in section_ids:
+        svg_url = f"{api_base}/api/v2/svg_download/{sec_id}?groups=28"
+        out_file = os.path.join(output_dir, f"{sec_id}.svg")
+
+        try:
+            r = requests.get(svg_url)
+            r.raise_for_status()
+            with open(out_file, 'wb') as f:
+                f.write(r.content)
+            print(f"Downloaded SectionImage {sec_id} -> {out_file}")
+        except Exception as e:
+            print(f"Failed to download SectionImage {sec_id}: {e}")
+
+    print("All downloads finished.")
+    return section_ids
+
+
+def fetch_structure_graph(cache_path=ONTOLOGY_CACHE, api_base=API_BASE, graph_id=1, refresh=False):
+    """
+    Return the Allen structure graph (ontology tree), downloading it only if not cached.
+
+    Parameters
+    ----------
+    cache_path : str
+        Local JSON cache of the structure graph
+    api_base : str
+        Allen API base URL; point at a local server to work offline
+    graph_id : int
+        Structure graph id (1 = Adult Mouse Brain)
+    refresh : bool
+        If True, download even if a cached copy exists
+
+    Returns
+    -------
+    dict
+        The root structure, with nested 'children' lists
+    """
+    if not refresh and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    import requests
+
+    url = f"{api_base}/api/v2/structure_graph_download/{graph_id}.json"
+    print(f"Downloading structure graph {graph_id}...")
+    response = requests.get(url)
+    response.raise_for_status()
+    payload = response.json()
+    if not payload.get('success', True):
+        raise RuntimeError(f"Structure graph request failed: {payload.get('msg')}")
+    msg = payload['msg'] if 'msg' in payload else payload
+    root = msg[0] if isinstance(msg, list) else msg
+
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(root, f)
+    os.replace(tmp_path, cache_path)
+    print(f"Cached structure graph -> {cache_path}")
+    return root
+
+
+class StructureOntology:
+    """
+    Allen structure tree indexed with Euler-tour (pre-order) intervals.
+
+    Structure ``d`` is a descendant of ``a`` exactly when
+    ``tin[a] <= tin[d] < tout[a]``, so ancestry tests are O(1) and the
+    descendants of a structure are a contiguous range of ``ids``.
+
+    Parameters
+    ----------
+    root : dict
+        Root structure with 'id', 'acronym', 'name' and nested 'children'
+    """
+
+    def __init__(self, root):
+        ids, parents, depths, acronyms, names = [], [], [], [], []
+        tout = []
+        # Iterative pre-order DFS; the exit time is written once the subtree is done
+        stack = [(root, -1, 0, False)]
+        while stack:
+            node, parent, depth, done = stack.pop()
+            if done:
+                tout[node] = len(ids)
+                continue
+            index = len(ids)
+            ids.append(int(node['id']))
+            parents.append(parent)
+            depths.append(depth)
+            acronyms.append(node.get('acronym', ''))
+            names.append(node.get('name', ''))
+            tout.append(None)
+            stack.append((index, None, None, True))
+            for child in reversed(node.get('children', [])):
+                stack.append((child, index, depth + 1, False))
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.parent = np.array(parents, dtype=np.int64)
+        self.depth = np.array(depths, dtype=np.int64)
+        self.tin = np.arange(len(ids), dtype=np.int64)
+        self.tout = np.array(tout, dtype=np.int64)
+        self.acronyms = acronyms
+        self.names = names
+        self._position = {structure_id: i for i, structure_id in enumerate(ids)}
+        self._sorter = np.argsort(self.ids)
+        self._sorted_ids = self.ids[self._sorter]
+
+    @classmethod
+    def load(cls, cache_path=ONTOLOGY_CACHE, api_base=API_BASE, refresh=False):
+        """Build the ontology from the local cache, downloading it on first use."""
+        return cls(fetch_structure_graph(cache_path, api_base=api_base, refresh=refresh))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, structure_id):
+        return int(structure_id) in self._position
+
+    def position(self, structure_id):
+        """Pre-order position of a structure id."""
+        try:
+            return self._position[int(structure_id)]
+        except KeyError:
+            raise KeyError(f'Unknown structure id: {structure_id}') from None
+
+    def positions(self, structure_ids):
+        """Vectorized ``position``; unknown ids map to -1."""
+        structure_ids = np.asarray(structure_ids, dtype=np.int64)
+        index = np.searchsorted(self._sorted_ids, structure_ids)
+        index = np.clip(index, 0, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[index] == structure_ids
+        return np.where(found, self._sorter[index], -1)
+
+    def find(self, acronym):
+        """Structure id for an acronym (e.g. 'Isocortex')."""
+        try:
+            return int(self.ids[self.acronyms.index(acronym)])
+        except ValueError:
+            raise KeyError(f'Unknown structure acronym: {acronym}') from None
+
+    def is_descendant(self, structure_id, ancestor_id, include_self=True):
+        """True if ``structure_id`` lies in the subtree of ``ancestor_id``."""
+        p, a = self.position(structure_id), self.position(ancestor_id)
+        if p == a:
+            return include_self
+        return bool(self.tin[a] <= self.tin[p] < self.tout[a])
+
+    def descendants(self, ancestor_id, include_self=True):
+        """Ids of all structures in the subtree of ``ancestor_id``."""
+        a = self.position(ancestor_id)
+        return self.ids[self.tin[a] + (0 if include_self else 1):self.tout[a]]
+
+    def ancestors(self, structure_id, include_self=True):
+        """Ids from ``structure_id`` up to the root."""
+        p = self.position(structure_id)
+        result = [] if not include_self else [int(self.ids[p])]
+        p = self.parent[p]
+        while p >= 0:
+            result.append(int(self.ids[p]))
+            p = self.parent[p]
+        return result
+
+    def descendant_mask(self, structure_ids, ancestor_id, include_self=True):
+        """Vectorized ``is_descendant`` over an array of ids (e.g. a label image)."""
+        a = self.position(ancestor_id)
+        p = self.positions(structure_ids)
+        low = self.tin[a] + (0 if include_self else 1)
+        return (p >= low) & (p < self.tout[a])
+
+    def ancestor_at_depth(self, structure_ids, depth):
+        """
+        Map ids to their ancestor at ``depth`` (root = 0), vectorized.
+
+        Structures shallower than ``depth`` map to themselves; unknown ids map to 0.
+        """
+        lookup = np.arange(len(self.ids))
+        # Walk every node up until it reaches the requested depth
+        for _ in range(int(self.depth.max())):
+            too_deep = self.depth[lookup] > depth
+            if not too_deep.any():
+                break
+            lookup = np.where(too_deep, self.parent[lookup], lookup)
+        p = self.positions(structure_ids)
+        return np.where(p >= 0, self.ids[lookup[np.maximum(p, 0)]], 0)
+
+
+def structure_rings(section, ontology, structure_id):
+    """
+    Geometric mask: polygon rings of every path of a parsed section inside ``structure_id``.
+
+    Returns
+    -------
+    list of dict
+        'id', 'structure_id' and 'rings' of each matching path, in drawing order
+    """
+    path_ids = np.array([p['structure_id'] for p in section['paths']], dtype=np.int64)
+    inside = ontology.descendant_mask(path_ids, structure_id)
+    return [{'id': p['id'], 'structure_id': p['structure_id'], 'rings': p['rings']}
+            for p, keep in zip(section['paths'], inside) if keep]
+
+
+def _section_structure_mask(args):
+    svg_path, ontology, structure_id, scale = args
+    section = allen_svg.parse_svg(svg_path, tolerance=0.5 / scale)
+    path_ids = np.array([p['structure_id'] for p in section['paths']], dtype=np.int64)
+    inside = ontology.descendant_mask(path_ids, structure_id)
+    # Draw every path so that later non-matching paths still cover earlier matching ones
+    labels = allen_svg.rasterize_paths(section, scale)
+    lut = np.concatenate([[False], inside])
+    return section['sub_image_id'], lut[labels]
+
+
+def _section_level_labels(args):
+    svg_path, ontology, depth, scale = args
+    section = allen_svg.parse_svg(svg_path, tolerance=0.5 / scale)
+    path_ids = np.array([p['structure_id'] for p in section['paths']], dtype=np.int64)
+    lut = np.concatenate([[0], ontology.ancestor_at_depth(path_ids, depth)]).astype(np.uint32)
+    return section['sub_image_id'], lut[allen_svg.rasterize_paths(section, scale)]
+
+
+def aggregate_structure_masks(ontology, structure_id=None, depth=None, svg_dir=allen_svg.SVG_DIR,
+                              scale=0.05, max_workers=None):
+    """
+    Rasterize a structure (with all its descendants) or an ontology level for every section.
+
+    Exactly one of ``structure_id`` and ``depth`` must be given.
+
+    Parameters
+    ----------
+    ontology : StructureOntology
+        Ontology used to resolve descendants/ancestors
+    structure_id : int, optional
+        Returns a boolean mask per section of all paths inside this structure
+    depth : int, optional
+        Returns a uint32 label image per section with every path mapped to its
+        ancestor at this ontology depth
+    svg_dir : str
+        Folder of section SVGs
+    scale : float
+        Output pixels per SVG pixel
+    max_workers : int, optional
+        Worker processes (default: CPU count)
+
+    Returns
+    -------
+    dict
+        SectionImage id -> mask or label image, in section order
+    """
+    if (structure_id is None) == (depth is None):
+        raise ValueError('Pass exactly one of structure_id or depth')
+    if structure_id is not None:
+        ontology.position(structure_id)  # fail early on unknown ids
+        worker, target = _section_structure_mask, structure_id
+    else:
+        worker, target = _section_level_labels, depth
+
+    tasks = [(os.path.join(svg_dir, f'{sec_id}.svg'), ontology, target, scale)
+             for sec_id in allen_svg.list_sections(svg_dir)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(worker, tasks, chunksize=4))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download and aggregate Allen atlas data')
+    parser.add_argument('--api-base', default=API_BASE, help='Allen API base URL (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='command')
+
+    svgs = subparsers.add_parser('svgs', help='Download the coronal structure-boundary SVGs')
+    svgs.add_argument('--output-dir', default=allen_svg.SVG_DIR,
+                      help='SVG folder (default: %(default)s in the working directory)')
+
+    ontology = subparsers.add_parser('ontology', help='Download and cache the structure ontology')
+    ontology.add_argument('--cache', default=ONTOLOGY_CACHE, help='Cache file (default: %(default)s)')
+    ontology.add_argument('--refresh', action='store_true', help='Download even if cached')
+
+    masks = subparsers.add_parser('masks', help='Rasterize a structure or ontology level for all sections')
+    masks.add_argument('structure', nargs='?', help='Structure id or acronym (with all descendants)')
+    masks.add_argument('--level', type=int, default=None, help='Ontology depth to aggregate to instead')
+    masks.add_argument('--svg-dir', default=allen_svg.SVG_DIR)
+    masks.add_argument('--scale', type=float, default=0.05, help='Output pixels per SVG pixel')
+    masks.add_argument('--output-dir', required=True)
+    masks.add_argument('--cache', default=ONTOLOGY_CACHE)
+    masks.add_argument('--workers', '-w', type=int, default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.command in (None, 'svgs'):
+        download_section_svgs(getattr(args, 'output_dir', allen_svg.SVG_DIR), api_base=args.api_base)
+    elif args.command == 'ontology':
+        tree = StructureOntology.load(args.cache, api_base=args.api_base, refresh=args.refresh)
+        print(f"{len(tree)} structures, max depth {int(tree.depth.max())}, cached at {args.cache}")
+    else:
+        import cv2
+
+        tree = StructureOntology.load(args.cache, api_base=args.api_base)
+        structure_id = None
+        if args.structure is not None:
+            structure_id = int(args.structure) if args.structure.isdigit() else tree.find(args.structure)
+        results = aggregate_structure_masks(tree, structure_id=structure_id, depth=args.level,
+                                            svg_dir=args.svg_dir, scale=args.scale, max_workers=args.workers)
+        os.makedirs(args.output_dir, exist_ok=True)
+        for sec_id, image in results.items():
+            if image.dtype == bool:
+                cv2.imwrite(os.path.join(args.output_dir, f'{sec_id}.png'), image.astype(np.uint8) * 255)
+            else:
+                np.save(os.path.join(args.output_dir, f'{sec_id}.npy'), image)
+        print(f"Wrote {len(results)} sections to {args.output_dir}")
+
 
-# Output folder
-output_dir = r"C:\Users\marti\Desktop\create_dataset_utils\allen_svg_coronal"
-os.makedirs(output_dir, exist_ok=True)
-
-# Step 1: Get list of AtlasImage IDs with Structure boundaries (GraphicGroupLabel.id=28)
-csv_url = ("http://api.brain-map.org/api/v2/data/query.csv?"
-           "criteria=model::AtlasImage,"
-           "rma::criteria,atlas_data_set(atlases[id$eq1]),"
-           "graphic_objects(graphic_group_label[id$eq28]),"
-           "rma::options[tabular$eq'sub_images.id'][order$eq'sub_images.id']"
-           "&num_rows=all&start_row=0")
-
-print("Downloading list of SectionImage IDs...")
-response = requests.get(csv_url)
-response.raise_for_status()
-
-# Parse CSV to get SectionImage IDs
-lines = response.text.splitlines()
-reader = csv.DictReader(lines)
-section_ids = [row['id'] for row in reader]
-
-print(f"Found {len(section_ids)} SectionImages with structure boundaries.")
-
-# Step 2: Download SVG for each SectionImage
-for sec_id in section_ids:
-    svg_url = f"http://api.brain-map.org/api/v2/svg_download/{sec_id}?groups=28"
-    out_file = os.path.join(output_dir, f"{sec_id}.svg")
-    
-    try:
-        r = requests.get(svg_url)
-        r.raise_for_status()
-        with open(out_file, 'wb') as f:
-            f.write(r.content)
-        print(f"Downloaded SectionImage {sec_id} -> {out_file}")
-    except Exception as e:
-        print(f"Failed to download SectionImage {sec_id}: {e}")
-
-print("All downloads finished.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,503 @@
+"""Write simplified level-of-detail copies of the Allen coronal SVGs.
+
+Curves are flattened to polygons, and the rings of a section are cut into arcs
+at the junctions where a boundary shared between rings starts or ends. Every
+arc is simplified once with Douglas-Peucker at each requested tolerance (in SVG
+pixels) and the rings are reassembled from the simplified arcs, so boundaries
+shared by neighbouring regions stay shared. A reassembled ring is only accepted
+if it still has at least three vertices, keeps its orientation and does not
+self-intersect; otherwise its arcs are simplified again at half the tolerance,
+and finally kept unsimplified.
+
+Each level is written as SVG (straight-line paths, same attributes) and/or a
+compressed .npz, and a CSV report lists the size reduction and the measured
+maximum geometric error of every section at every level.
+
+Example usage:
+  python simplify_allen_svg.py --output-dir allen_svg_lod --tolerances 1 4 16
+  python simplify_allen_svg.py --output-dir allen_svg_lod --format npz --workers 8
+"""
+
+import argparse
+import csv
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import allen_svg
+
+DEFAULT_TOLERANCES = (1.0, 4.0, 16.0)
+# Vertices of different rings are matched after rounding to this many decimals
+SHARED_VERTEX_DECIMALS = 6
+# Candidate edge pairs tested per step of the self-intersection check
+PAIR_CHUNK = 2 ** 16
+REPORT_FIELDS = ['section', 'tolerance', 'format', 'original_bytes', 'output_bytes', 'reduction',
+                 'flat_vertices', 'vertices', 'max_error']
+
+
+def _point_segment_distance_sq(points, a, b):
+    """Squared distance from each point to the segment ``a``-``b``."""
+    ab = b - a
+    length_sq = ab @ ab
+    if length_sq == 0:
+        diff = points - a
+    else:
+        t = np.clip((points - a) @ ab / length_sq, 0, 1)
+        diff = points - a - t[:, np.newaxis] * ab
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Douglas-Peucker simplification of an open polyline.
+
+    Returns
+    -------
+    keep : np.ndarray
+        Boolean mask of the vertices kept (always includes both end points)
+    max_error : float
+        Largest distance of a dropped vertex from the simplified polyline
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    max_error_sq = 0.0
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        distances = _point_segment_distance_sq(points[i + 1:j], points[i], points[j])
+        k = int(np.argmax(distances))
+        if distances[k] > tolerance_sq:
+            keep[i + 1 + k] = True
+            stack.append((i, i + 1 + k))
+            stack.append((i + 1 + k, j))
+        else:
+            max_error_sq = max(max_error_sq, float(distances[k]))
+    return keep, math.sqrt(max_error_sq)
+
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _self_intersects(ring, chunk_size=PAIR_CHUNK):
+    """
+    True if any two non-adjacent edges of the closed ring cross.
+
+    Only edges with overlapping bounding boxes are tested: edges are swept in
+    order of their left end, and the candidate pairs are checked in chunks of
+    about ``chunk_size``, so memory stays linear in the ring size.
+    """
+    n = len(ring)
+    if n < 4:
+        return False
+    a = ring
+    b = np.roll(ring, -1, axis=0)
+    low = np.minimum(a, b)
+    high = np.maximum(a, b)
+
+    def orient(p, q, r):
+        return np.sign((q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) -
+                       (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0]))
+
+    order = np.argsort(low[:, 0], kind='stable')
+    # Edges after each sweep position that start before its edge ends in x
+    counts = np.searchsorted(low[order, 0], high[order, 0], side='right') - np.arange(n) - 1
+    cumulative = np.cumsum(counts)
+    start = 0
+    while start < n:
+        done = cumulative[start - 1] if start else 0
+        stop = min(n, max(start + 1, int(np.searchsorted(cumulative, done + chunk_size, side='right'))))
+        chunk_counts = counts[start:stop]
+        p = np.repeat(np.arange(start, stop), chunk_counts)
+        q = p + 1 + np.arange(len(p)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        i, j = order[p], order[q]
+        # Edges i and j are adjacent when they share a vertex (first and last edge included)
+        gap = np.abs(i - j)
+        candidate = (gap != 1) & (gap != n - 1) & (low[i, 1] <= high[j, 1]) & (low[j, 1] <= high[i, 1])
+        i, j = i[candidate], j[candidate]
+        d1 = orient(a[i], b[i], a[j])
+        d2 = orient(a[i], b[i], b[j])
+        d3 = orient(a[j], b[j], a[i])
+        d4 = orient(a[j], b[j], b[i])
+        if np.any((d1 * d2 < 0) & (d3 * d4 < 0)):
+            return True
+        start = stop
+    return False
+
+
+def _valid_ring(simplified, area):
+    """True if a simplified ring has three vertices, the sign of ``area`` and no self-intersection."""
+    return (len(simplified) >= 3 and np.sign(_signed_area(simplified)) == np.sign(area)
+            and not _self_intersects(simplified))
+
+
+def simplify_ring(ring, tolerance, max_retries=4):
+    """
+    Simplify a closed ring, keeping it a valid simple polygon.
+
+    Parameters
+    ----------
+    ring : np.ndarray
+        (K, 2) vertices; a repeated closing vertex is ignored
+    tolerance : float
+        Maximum distance of the original vertices from the simplified ring
+    max_retries : int
+        Times to halve the tolerance before keeping the ring unsimplified
+
+    Returns
+    -------
+    simplified : np.ndarray
+        (M, 2) vertices, without a repeated closing vertex
+    max_error : float
+        Measured maximum distance of dropped vertices from the simplified ring
+    """
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    if len(ring) <= 3:
+        return ring, 0.0
+
+    area = _signed_area(ring)
+    # Split the ring at the vertex farthest from the start so both halves are open polylines
+    split = int(np.argmax(np.linalg.norm(ring - ring[0], axis=1)))
+    first = ring[:split + 1]
+    second = np.vstack([ring[split:], ring[:1]])
+    for _ in range(max_retries + 1):
+        keep_first, error_first = douglas_peucker(first, tolerance)
+        keep_second, error_second = douglas_peucker(second, tolerance)
+        simplified = np.vstack([first[keep_first], second[keep_second][1:-1]])
+        if _valid_ring(simplified, area):
+            return simplified, max(error_first, error_second)
+        tolerance /= 2
+    return ring, 0.0
+
+
+def split_arcs(rings):
+    """
+    Cut closed rings into arcs at their junctions.
+
+    A junction is a vertex that occurs more than once (in several rings, or
+    twice in one) with different neighbours: the end of a boundary shared by
+    rings. A ring without junctions is a single closed arc starting at its
+    lowest vertex id, so rings tracing the same loop share it too.
+
+    Parameters
+    ----------
+    rings : list of np.ndarray
+        (K, 2) vertices of each ring, without a repeated closing vertex
+
+    Returns
+    -------
+    vertices : np.ndarray
+        (V, 2) coordinates of the distinct vertices
+    arcs : list of np.ndarray
+        Vertex ids of each distinct arc, end points included; an arc and its
+        reverse are the same arc
+    ring_arcs : list of list of (int, bool)
+        For each ring, its arcs in order as (arc index, reversed)
+    """
+    if not rings:
+        return np.zeros((0, 2)), [], []
+    points = np.vstack(rings)
+    _, first, ids = np.unique(np.round(points, SHARED_VERTEX_DECIMALS), axis=0,
+                              return_index=True, return_inverse=True)
+    ids = ids.ravel()
+    vertices = points[first]
+    offsets = np.cumsum([0] + [len(ring) for ring in rings])
+    ring_ids = [ids[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+    previous = np.concatenate([np.roll(r, 1) for r in ring_ids])
+    following = np.concatenate([np.roll(r, -1) for r in ring_ids])
+    neighbours = np.unique(np.stack([ids, np.minimum(previous, following), np.maximum(previous, following)], axis=1),
+                           axis=0)
+    junction = np.bincount(neighbours[:, 0], minlength=len(vertices)) > 1
+
+    arcs, arc_index, ring_arcs = [], {}, []
+    for r in ring_ids:
+        cuts = np.flatnonzero(junction[r])
+        start = int(cuts[0]) if len(cuts) else int(np.argmin(r))
+        r = np.roll(r, -start)
+        cuts = (cuts - start) % len(r) if len(cuts) else np.zeros(1, dtype=np.int64)
+        closed = np.append(r, r[0])
+        bounds = np.append(np.sort(cuts), len(r))
+        pieces = []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            arc = closed[a:b + 1]
+            forward, backward = tuple(arc.tolist()), tuple(arc[::-1].tolist())
+            key = min(forward, backward)
+            if key not in arc_index:
+                arc_index[key] = len(arcs)
+                arcs.append(np.array(key, dtype=np.int64))
+            pieces.append((arc_index[key], key != forward))
+        ring_arcs.append(pieces)
+    return vertices, arcs, ring_arcs
+
+
+def _simplify_arc(points, tolerance):
+    """Douglas-Peucker on an arc; a closed arc is first split at the vertex farthest from its end points."""
+    if tolerance <= 0 or len(points) <= 2:
+        return np.ones(len(points), dtype=bool), 0.0
+    if not np.array_equal(points[0], points[-1]):
+        return douglas_peucker(points, tolerance)
+    split = max(1, int(np.argmax(np.linalg.norm(points - points[0], axis=1))))
+    keep_first, error_first = douglas_peucker(points[:split + 1], tolerance)
+    keep_second, error_second = douglas_peucker(points[split:], tolerance)
+    return np.concatenate([keep_first, keep_second[1:]]), max(error_first, error_second)
+
+
+def simplify_section(section, tolerance, max_retries=4):
+    """
+    Simplify the rings of a parsed section (see ``allen_svg.parse_svg``), keeping shared boundaries shared.
+
+    Every arc of ``split_arcs`` is simplified once, and the rings are
+    reassembled from their arcs. The arcs of a ring that is no longer valid
+    (see ``simplify_ring``) are simplified again at half the tolerance, up to
+    ``max_retries`` times, and then kept unsimplified; the rings sharing those
+    arcs are checked again.
+
+    Returns
+    -------
+    section : dict
+        Copy of ``section`` with simplified rings
+    stats : dict
+        'flat_vertices', 'vertices' and 'max_error' over the section
+    """
+    rings = [ring[:-1] if len(ring) > 1 and np.array_equal(ring[0], ring[-1]) else ring
+             for path in section['paths'] for ring in path['rings']]
+    vertices, arcs, ring_arcs = split_arcs(rings)
+    areas = [_signed_area(ring) for ring in rings]
+    arc_rings = [[] for _ in arcs]
+    for r, pieces in enumerate(ring_arcs):
+        for arc, _ in pieces:
+            arc_rings[arc].append(r)
+
+    def assemble(r):
+        parts = []
+        for arc, backward in ring_arcs[r]:
+            ids = arcs[arc][keeps[arc]]
+            parts.append((ids[::-1] if backward else ids)[:-1])
+        return vertices[np.concatenate(parts)]
+
+    tolerances = np.full(len(arcs), float(tolerance))
+    keeps, errors = [None] * len(arcs), np.zeros(len(arcs))
+    changed, attempt = range(len(arcs)), 0
+    while True:
+        for arc in changed:
+            keeps[arc], errors[arc] = _simplify_arc(vertices[arcs[arc]], tolerances[arc])
+        pending = sorted({r for arc in changed for r in arc_rings[arc]})
+        invalid = [r for r in pending if not _valid_ring(assemble(r), areas[r])]
+        changed = sorted({arc for r in invalid for arc, _ in ring_arcs[r] if tolerances[arc] > 0})
+        if not changed:
+            break
+        tolerances[changed] = tolerances[changed] / 2 if attempt < max_retries else 0
+        attempt += 1
+
+    simplified = [assemble(r) if ring_arcs[r] else rings[r] for r in range(len(rings))]
+    paths = []
+    flat_vertices = n_vertices = 0
+    for path in section['paths']:
+        path_rings = simplified[:len(path['rings'])]
+        simplified = simplified[len(path['rings']):]
+        flat_vertices += sum(len(ring) for ring in path['rings'])
+        n_vertices += sum(len(ring) for ring in path_rings)
+        paths.append(dict(path, rings=path_rings))
+    stats = {'flat_vertices': flat_vertices, 'vertices': n_vertices,
+             'max_error': float(errors.max()) if len(arcs) else 0.0}
+    return dict(section, paths=paths), stats
+
+
+def _coordinate_decimals(tolerance):
+    """Decimals that keep rounding error below a tenth of ``tolerance``."""
+    return max(0, math.ceil(-math.log10(tolerance / 10)))
+
+
+def write_section_svg(section, path, decimals=3):
+    """Write a section as straight-line SVG paths, keeping the original path attributes."""
+    def fmt(value):
+        text = f'{value:.{decimals}f}'
+        if decimals:
+            text = text.rstrip('0').rstrip('.')
+        return '0' if text == '-0' else text
+
+    lines = [f'<svg width="{fmt(section["width"])}" height="{fmt(section["height"])}" '
+             'xmlns="http://www.w3.org/2000/svg">',
+             f'<g sub_image_id="{section["sub_image_id"]}">']
+    for p in section['paths']:
+        d = []
+        for ring in p['rings']:
+            # Relative linetos between rounded vertices are shorter and do not accumulate rounding error
+            points = np.round(ring, decimals)
+            steps = np.diff(points, axis=0)
+            d.append(f'M{fmt(points[0, 0])},{fmt(points[0, 1])}l' +
+                     ' '.join(f'{fmt(x)},{fmt(y)}' for x, y in steps) + 'z')
+        d = ''.join(d)
+        style = f' style="{p["style"]}"' if p.get('style') else ''
+        lines.append(f'<path id="{p["id"]}" order="{p["order"]}" structure_id="{p["structure_id"]}" '
+                     f'd="{d}"{style}/>')
+    lines.append('</g>\n</svg>\n')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    os.replace(tmp_path, path)
+
+
+def write_section_npz(section, path):
+    """Write a section as flat vertex and offset arrays in a compressed .npz."""
+    rings = [ring for p in section['paths'] for ring in p['rings']]
+    ring_counts = [len(p['rings']) for p in section['paths']]
+    vertices = np.vstack(rings).astype(np.float32) if rings else np.zeros((0, 2), dtype=np.float32)
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(
+        tmp_path,
+        vertices=vertices,
+        ring_offsets=np.concatenate([[0], np.cumsum([len(r) for r in rings])]).astype(np.int64),
+        path_ring_offsets=np.concatenate([[0], np.cumsum(ring_counts)]).astype(np.int64),
+        path_ids=np.array([p['id'] for p in section['paths']], dtype=np.int64),
+        structure_ids=np.array([p['structure_id'] for p in section['paths']], dtype=np.int64),
+        orders=np.array([p['order'] for p in section['paths']], dtype=np.int64),
+        size=np.array([section['width'], section['height']]),
+        sub_image_id=np.array(section['sub_image_id']),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_section_npz(path):
+    """Read a section written by ``write_section_npz`` back into ``parse_svg`` form."""
+    with np.load(path) as data:
+        vertices = data['vertices'].astype(np.float64)
+        ring_offsets = data['ring_offsets']
+        path_ring_offsets = data['path_ring_offsets']
+        rings = [vertices[ring_offsets[i]:ring_offsets[i + 1]] for i in range(len(ring_offsets) - 1)]
+        width, height = data['size']
+        return {
+            'width': float(width),
+            'height': float(height),
+            'sub_image_id': int(data['sub_image_id']),
+            'paths': [{'id': int(path_id), 'structure_id': int(structure_id), 'order': int(order), 'style': '',
+                       'rings': rings[path_ring_offsets[i]:path_ring_offsets[i + 1]]}
+                      for i, (path_id, structure_id, order)
+                      in enumerate(zip(data['path_ids'], data['structure_ids'], data['orders']))],
+        }
+
+
+def _level_dir(output_dir, tolerance):
+    return os.path.join(output_dir, f'tol_{tolerance:g}')
+
+
+def _process_section(args):
+    svg_path, output_dir, tolerances, formats, flatten_tolerance = args
+    original_bytes = os.path.getsize(svg_path)
+    section = allen_svg.parse_svg(svg_path, tolerance=flatten_tolerance)
+    rows = []
+    for tolerance in tolerances:
+        simplified, stats = simplify_section(section, tolerance)
+        out_base = os.path.join(_level_dir(output_dir, tolerance), str(section['sub_image_id']))
+        for fmt in formats:
+            out_path = f'{out_base}.{fmt}'
+            if fmt == 'svg':
+                write_section_svg(simplified, out_path, decimals=_coordinate_decimals(tolerance))
+            else:
+                write_section_npz(simplified, out_path)
+            output_bytes = os.path.getsize(out_path)
+            rows.append({
+                'section': section['sub_image_id'],
+                'tolerance': tolerance,
+                'format': fmt,
+                'original_bytes': original_bytes,
+                'output_bytes': output_bytes,
+                'reduction': round(original_bytes / max(output_bytes, 1), 2),
+                'flat_vertices': stats['flat_vertices'],
+                'vertices': stats['vertices'],
+                # Measured against the flattened curve, which is itself within flatten_tolerance
+                'max_error': round(stats['max_error'] + flatten_tolerance, 4),
+            })
+    return rows
+
+
+def simplify_sections(output_dir, svg_dir=allen_svg.SVG_DIR, tolerances=DEFAULT_TOLERANCES,
+                      formats=('svg', 'npz'), flatten_tolerance=None, max_workers=None):
+    """
+    Write simplified copies of every section at each tolerance, in parallel.
+
+    Parameters
+    ----------
+    output_dir : str
+        Output root; level ``t`` is written to ``tol_<t>/<section>.<format>``
+    svg_dir : str
+        Folder of the original section SVGs
+    tolerances : sequence of float
+        Douglas-Peucker tolerances in SVG pixels
+    formats : sequence of str
+        Any of 'svg' and 'npz'
+    flatten_tolerance : float, optional
+        Curve flattening tolerance (default: a quarter of the smallest tolerance)
+    max_workers : int, optional
+        Worker processes (default: CPU count)
+
+    Returns
+    -------
+    list of dict
+        One report row per section, level and format (see ``REPORT_FIELDS``)
+    """
+    tolerances = sorted(float(t) for t in tolerances)
+    formats = tuple(formats)
+    unknown = set(formats) - {'svg', 'npz'}
+    if unknown:
+        raise ValueError(f'Unknown output formats: {sorted(unknown)}')
+    if flatten_tolerance is None:
+        flatten_tolerance = tolerances[0] / 4
+
+    for tolerance in tolerances:
+        os.makedirs(_level_dir(output_dir, tolerance), exist_ok=True)
+    tasks = [(os.path.join(svg_dir, f'{sec_id}.svg'), output_dir, tolerances, formats, flatten_tolerance)
+             for sec_id in allen_svg.list_sections(svg_dir)]
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for section_rows in executor.map(_process_section, tasks, chunksize=4):
+            rows.extend(section_rows)
+
+    with open(os.path.join(output_dir, 'report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write simplified level-of-detail copies of the Allen SVGs')
+    parser.add_argument('--svg-dir', default=allen_svg.SVG_DIR, help='Folder of section SVGs')
+    parser.add_argument('--output-dir', required=True, help='Output root folder')
+    parser.add_argument('--tolerances', type=float, nargs='+', default=list(DEFAULT_TOLERANCES),
+                        help='Simplification tolerances in SVG pixels (default: %(default)s)')
+    parser.add_argument('--format', choices=['svg', 'npz', 'both'], default='both')
+    parser.add_argument('--flatten-tolerance', type=float, default=None,
+                        help='Curve flattening tolerance (default: a quarter of the smallest tolerance)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Worker processes')
+    args = parser.parse_args()
+
+    formats = ('svg', 'npz') if args.format == 'both' else (args.format,)
+    rows = simplify_sections(args.output_dir, args.svg_dir, args.tolerances, formats,
+                             args.flatten_tolerance, args.workers)
+
+    print(f"{'Tolerance':>9}  {'Format':>6}  {'Original':>10}  {'Output':>10}  {'Reduction':>9}  "
+          f"{'Vertices':>9}  {'Max error':>9}")
+    for tolerance in sorted({row['tolerance'] for row in rows}):
+        for fmt in formats:
+            level = [row for row in rows if row['tolerance'] == tolerance and row['format'] == fmt]
+            original = sum(row['original_bytes'] for row in level)
+            output = sum(row['output_bytes'] for row in level)
+            vertices = sum(row['vertices'] for row in level)
+            max_error = max(row['max_error'] for row in level)
+            print(f"{tolerance:>9g}  {fmt:>6}  {original:>10,}  {output:>10,}  {original / max(output, 1):>8.1f}x  "
+                  f"{vertices:>9,}  {max_error:>9.3f}")
+    print(f"Report written to {os.path.join(args.output_dir, 'report.csv')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Compressed, chunked container for ``load_licking_data`` output.
+
+Images and labels are split into fixed-size chunks of frames and every chunk
+is compressed independently with zlib or lzma, so chunks can be compressed and
+decompressed in parallel and any batch can be read without decompressing the
+whole file. Each compressed chunk carries a SHA-256 checksum.
+
+File layout::
+
+    MAGIC | chunk payloads ... | JSON index | index offset (uint64 LE) | MAGIC
+
+Example usage:
+  python chunked_archive.py pack training_data.pkl training_data.lca --codec lzma
+  python chunked_archive.py verify training_data.lca
+  python chunked_archive.py unpack training_data.lca training_data.pkl
+"""
+
+import argparse
+import hashlib
+import json
+import lzma
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+MAGIC = b'LICKARC1'
+FORMAT_VERSION = 1
+CODECS = ('zlib', 'lzma', 'none')
+ARRAY_NAMES = ('images', 'labels')
+
+
+def _compress(data: bytes, codec: str, level: Optional[int]) -> bytes:
+    if codec == 'zlib':
+        return zlib.compress(data, 6 if level is None else level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=6 if level is None else level)
+    return data
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    return data
+
+
+def write_archive(path: str,
+                  images: np.ndarray,
+                  labels: np.ndarray,
+                  filenames: Optional[List[str]] = None,
+                  chunk_size: int = 256,
+                  codec: str = 'zlib',
+                  level: Optional[int] = None,
+                  max_workers: Optional[int] = None,
+                  metadata: Optional[Dict] = None) -> Dict:
+    """
+    Write images and labels to a chunked archive.
+
+    Parameters
+    ----------
+    path : str
+        Output file path
+    images : np.ndarray
+        Images of shape (N, H, W, C)
+    labels : np.ndarray
+        Labels of shape (N, ...), aligned with ``images``
+    filenames : Optional[List[str]]
+        Image file names to store in the index
+    chunk_size : int
+        Number of frames per chunk
+    codec : str
+        'zlib', 'lzma' or 'none'
+    level : Optional[int]
+        Compression level (zlib 0-9, lzma preset 0-9); codec default if None
+    max_workers : Optional[int]
+        Number of compression threads (default: CPU count)
+    metadata : Optional[Dict]
+        Extra JSON-serializable information stored in the index
+
+    Returns
+    -------
+    dict
+        Summary with keys: chunks, raw_bytes, compressed_bytes, ratio, seconds
+    """
+    if codec not in CODECS:
+        raise ValueError(f'Unknown codec {codec!r}, expected one of {CODECS}')
+    images = np.asarray(images)
+    labels = np.asarray(labels)
+    if len(images) != len(labels):
+        raise ValueError(f'images and labels differ in length: {len(images)} vs {len(labels)}')
+    if filenames is not None and len(filenames) != len(images):
+        raise ValueError('filenames must have one entry per image')
+
+    start = time.perf_counter()
+    n = len(images)
+    arrays = {'images': images, 'labels': labels}
+    bounds = [(s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    def compress_chunk(bound):
+        s, e = bound
+        result = {}
+        for name in ARRAY_NAMES:
+            payload = _compress(np.ascontiguousarray(arrays[name][s:e]).tobytes(), codec, level)
+            result[name] = (payload, hashlib.sha256(payload).hexdigest())
+        return result
+
+    chunks = []
+    raw_bytes = images.nbytes + labels.nbytes
+    with open(path + '.tmp', 'wb') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        f.write(MAGIC)
+        # Keep a bounded number of chunks in flight so memory stays flat for large datasets
+        pending = deque()
+        bound_iter = iter(bounds)
+        for bound in bound_iter:
+            pending.append((bound, executor.submit(compress_chunk, bound)))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            bound, future = pending.popleft()
+            next_bound = next(bound_iter, None)
+            if next_bound is not None:
+                pending.append((next_bound, executor.submit(compress_chunk, next_bound)))
+            entry = {'start': bound[0], 'stop': bound[1]}
+            for name, (payload, digest) in future.result().items():
+                entry[name] = {'offset': f.tell(), 'length': len(payload), 'sha256': digest}
+                f.write(payload)
+            chunks.append(entry)
+
+        index = {
+            'version': FORMAT_VERSION,
+            'codec': codec,
+            'chunk_size': chunk_size,
+            'length': n,
+            'arrays': {name: {'shape': list(arr.shape[1:]), 'dtype': arr.dtype.str}
+                       for name, arr in arrays.items()},
+            'filenames': list(filenames) if filenames is not None else None,
+            'metadata': metadata or {},
+            'chunks': chunks,
+        }
+        index_offset = f.tell()
+        f.write(json.dumps(index).encode('utf-8'))
+        f.write(struct.pack('<Q', index_offset))
+        f.write(MAGIC)
+    os.replace(path + '.tmp', path)
+
+    compressed_bytes = os.path.getsize(path)
+    return {
+        'chunks': len(chunks),
+        'raw_bytes': raw_bytes,
+        'compressed_bytes': compressed_bytes,
+        'ratio': raw_bytes / compressed_bytes if compressed_bytes else 0.0,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+class ChunkedArchive:
+    """
+    Random-access reader for archives written by ``write_archive``.
+
+    Indexing with an int or a slice returns ``(images, labels)`` and only
+    decompresses the chunks that overlap the requested frames.
+
+    Parameters
+    ----------
+    path : str
+        Archive path
+    verify : bool
+        If True, check the checksum of every chunk as it is read
+    max_workers : Optional[int]
+        Threads used to decompress multi-chunk reads (default: CPU count)
+    """
+
+    def __init__(self, path: str, verify: bool = True, max_workers: Optional[int] = None):
+        self.path = path
+        self.verify_reads = verify
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+
+        self._file.seek(-(len(MAGIC) + 8), os.SEEK_END)
+        tail = self._file.read(len(MAGIC) + 8)
+        self._file.seek(0)
+        head = self._file.read(len(MAGIC))
+        if head != MAGIC or tail[8:] != MAGIC:
+            raise ValueError(f'Not a chunked licking archive: {path}')
+        (index_offset,) = struct.unpack('<Q', tail[:8])
+        index_length = os.path.getsize(path) - index_offset - len(tail)
+        self._file.seek(index_offset)
+        self.index = json.loads(self._file.read(index_length).decode('utf-8'))
+        if self.index['version'] != FORMAT_VERSION:
+            raise ValueError(f'Unsupported archive version {self.index["version"]}')
+
+        self.codec = self.index['codec']
+        self.chunk_size = self.index['chunk_size']
+        self.filenames = self.index['filenames']
+        self.metadata = self.index['metadata']
+        self.chunks = self.index['chunks']
+        self._arrays = {name: (tuple(spec['shape']), np.dtype(spec['dtype']))
+                        for name, spec in self.index['arrays'].items()}
+
+    def __len__(self) -> int:
+        return self.index['length']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def shapes(self) -> Dict[str, tuple]:
+        """Full shapes of the stored arrays, e.g. {'images': (N, H, W, C), ...}."""
+        return {name: (len(self),) + shape for name, (shape, _) in self._arrays.items()}
+
+    def _read_payload(self, entry: Dict) -> bytes:
+        with self._lock:
+            self._file.seek(entry['offset'])
+            return self._file.read(entry['length'])
+
+    def read_chunk(self, chunk_index: int, verify: Optional[bool] = None):
+        """Decompress one chunk, returning ``(images, labels)``."""
+        verify = self.verify_reads if verify is None else verify
+        chunk = self.chunks[chunk_index]
+        n = chunk['stop'] - chunk['start']
+        result = []
+        for name in ARRAY_NAMES:
+            payload = self._read_payload(chunk[name])
+            if verify and hashlib.sha256(payload).hexdigest() != chunk[name]['sha256']:
+                raise IOError(f'Checksum mismatch in chunk {chunk_index} ({name}) of {self.path}')
+            shape, dtype = self._arrays[name]
+            # bytearray so the returned arrays are writable like the original ones
+            data = bytearray(_decompress(payload, self.codec))
+            result.append(np.frombuffer(data, dtype=dtype).reshape((n,) + shape))
+        return tuple(result)
+
+    def read(self, start: int = 0, stop: Optional[int] = None):
+        """Read frames ``[start, stop)``, decompressing the overlapping chunks in parallel."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = max(0, start)
+        if start >= stop:
+            empty = {name: np.empty((0,) + shape, dtype=dtype) for name, (shape, dtype) in self._arrays.items()}
+            return empty['images'], empty['labels']
+
+        first, last = start // self.chunk_size, (stop - 1) // self.chunk_size
+        chunk_indices = range(first, last + 1)
+        if len(chunk_indices) == 1:
+            parts = [self.read_chunk(first)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunk_indices))) as executor:
+                parts = list(executor.map(self.read_chunk, chunk_indices))
+        offset = first * self.chunk_size
+        images = np.concatenate([p[0] for p in parts])[start - offset:stop - offset]
+        labels = np.concatenate([p[1] for p in parts])[start - offset:stop - offset]
+        return images, labels
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step > 0:
+                images, labels = self.read(start, stop)
+                return images[::step], labels[::step]
+            images, labels = self.read(stop + 1, start + 1)
+            return images[::-1][::-step], labels[::-1][::-step]
+        index = int(key)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Index {key} out of range for archive of length {len(self)}')
+        images, labels = self.read_chunk(index // self.chunk_size)
+        return images[index % self.chunk_size], labels[index % self.chunk_size]
+
+    def verify(self) -> List[int]:
+        """Check every chunk checksum; returns the indices of corrupt chunks."""
+        def check(chunk_index):
+            chunk = self.chunks[chunk_index]
+            return all(hashlib.sha256(self._read_payload(chunk[name])).hexdigest() == chunk[name]['sha256']
+                       for name in ARRAY_NAMES)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            ok = list(executor.map(check, range(len(self.chunks))))
+        return [i for i, good in enumerate(ok) if not good]
+
+
+def pack_pickle(pickle_path: str, archive_path: str, **kwargs) -> Dict:
+    """
+    Convert a dataset pickle to a chunked archive.
+
+    Accepts both ``(images, labels)`` pickles (``training_data.pkl``) and
+    ``(images, filenames, labels)`` pickles (merged shards).
+    """
+    with open(pickle_path, 'rb') as handle:
+        data = pickle.load(handle)
+    if len(data) == 3:
+        images, filenames, labels = data
+    else:
+        (images, labels), filenames = data, None
+    return write_archive(archive_path, images, labels, filenames=filenames, **kwargs)
+
+
+def unpack_to_pickle(archive_path: str, pickle_path: str) -> None:
+    """Write an archive back to a pickle in the layout it was packed from."""
+    with ChunkedArchive(archive_path) as archive:
+        images, labels = archive.read()
+        data = (images, labels) if archive.filenames is None else (images, archive.filenames, labels)
+    with open(pickle_path, 'wb') as handle:
+        pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunked, compressed archives of licking datasets')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack = subparsers.add_parser('pack', help='Convert a dataset pickle to an archive')
+    pack.add_argument('pickle_path')
+    pack.add_argument('archive_path')
+    pack.add_argument('--codec', choices=CODECS, default='zlib')
+    pack.add_argument('--level', type=int, default=None, help='Compression level 0-9')
+    pack.add_argument('--chunk-size', type=int, default=256, help='Frames per chunk')
+    pack.add_argument('--workers', '-w', type=int, default=None, help='Compression threads')
+
+    unpack = subparsers.add_parser('unpack', help='Convert an archive back to a pickle')
+    unpack.add_argument('archive_path')
+    unpack.add_argument('pickle_path')
+
+    verify = subparsers.add_parser('verify', help='Check all chunk checksums')
+    verify.add_argument('archive_path')
+
+    args = parser.parse_args()
+    if args.command == 'pack':
+        summary = pack_pickle(args.pickle_path, args.archive_path, codec=args.codec, level=args.level,
+                              chunk_size=args.chunk_size, max_workers=args.workers)
+        print(f"Wrote {summary['chunks']} chunks: {summary['raw_bytes'] / 1e6:.1f} MB -> "
+              f"{summary['compressed_bytes'] / 1e6:.1f} MB ({summary['ratio']:.1f}x) in {summary['seconds']:.1f} s")
+    elif args.command == 'unpack':
+        unpack_to_pickle(args.archive_path, args.pickle_path)
+        print(f'Wrote {args.pickle_path}')
+    else:
+        with ChunkedArchive(args.archive_path) as archive:
+            bad = archive.verify()
+            print(f'{len(archive.chunks)} chunks, {len(archive)} frames, {len(bad)} corrupt')
+        if bad:
+            print(f'Corrupt chunks: {bad}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
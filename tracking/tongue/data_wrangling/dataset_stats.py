@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Streaming statistics of a licking dataset.
+
+One pass over the data (in parallel chunks) fills mergeable accumulators:
+per-channel pixel mean/std (Welford/Chan) and histograms, per-experiment
+empty-label rates, the distribution of tongue mask areas, how often each pixel
+is covered by the tongue mask, and a histogram of the jaw keypoint positions
+(the peak of each jaw heatmap). Chunks are reduced independently and merged, so
+results do not depend on chunking or worker count.
+
+Statistics can be computed from the raw experiment folders (frames are
+decoded lazily and never held all at once), a ``load_licking_data`` pickle, a
+chunked archive or arrays already in memory. They are saved next to the
+dataset as ``<dataset>.stats.json`` (summary) and ``<dataset>.stats.npz``
+(full accumulators, mergeable again with ``DatasetStats.load``).
+
+Example usage:
+  python dataset_stats.py /mnt/data/Mask+Jaw/
+  python dataset_stats.py licking_dataset.pkl --workers 8
+  python dataset_stats.py training_data.lca --chunk-size 512
+"""
+
+import argparse
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class Welford:
+    """Mergeable running mean and variance of a vector of channels (Chan et al. parallel update)."""
+
+    def __init__(self, n_channels: int):
+        self.count = 0
+        self.mean = np.zeros(n_channels, dtype=np.float64)
+        self.m2 = np.zeros(n_channels, dtype=np.float64)
+
+    def merge_moments(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Merge the count, mean and sum of squared deviations of another sample."""
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, values: np.ndarray) -> None:
+        """Add samples of shape (N, n_channels)."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        mean = values.mean(axis=0)
+        self.merge_moments(len(values), mean, ((values - mean) ** 2).sum(axis=0))
+
+    def merge(self, other: 'Welford') -> None:
+        self.merge_moments(other.count, other.mean, other.m2)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / self.count) if self.count else np.full_like(self.mean, np.nan)
+
+
+def experiment_of(filename: str) -> str:
+    """Experiment folder of a ``load_licking_data`` filename (``<exp>/images/<img>`` or ``<exp>/<video>/<frame>``)."""
+    return os.path.basename(os.path.dirname(os.path.dirname(filename)))
+
+
+class DatasetStats:
+    """
+    Mergeable statistics of images (N, H, W, C) and labels (N, H, W, 2).
+
+    ``labels[..., 0]`` is the tongue mask and ``labels[..., 1]`` the jaw heatmap,
+    as returned by ``load_licking_data``. Image channels are in OpenCV (BGR) order.
+
+    Parameters
+    ----------
+    area_bins : int
+        Bins of the tongue area histogram over the mask fraction [0, 1]
+    """
+
+    def __init__(self, area_bins: int = 50):
+        self.area_bins = area_bins
+        self.n_frames = 0
+        self.shape = None  # (H, W, C)
+        self.channels = None  # Welford over pixel values
+        self.channel_hist = None  # (C, 256) counts of uint8 pixel values
+        self.area = Welford(1)  # tongue mask fraction of non-empty masks
+        self.area_hist = np.zeros(area_bins, dtype=np.int64)
+        self.tongue_occupancy = None  # (H, W) frames with tongue at each pixel
+        self.jaw_positions = None  # (H, W) frames with the jaw heatmap peak at each pixel
+        self.experiments = {}  # name -> [frames, empty tongue, empty jaw, empty both]
+
+    def _init_shape(self, images: np.ndarray, labels: np.ndarray) -> None:
+        if self.shape is None:
+            self.shape = images.shape[1:]
+            n_channels = images.shape[-1]
+            self.channels = Welford(n_channels)
+            self.channel_hist = np.zeros((n_channels, 256), dtype=np.int64)
+            self.tongue_occupancy = np.zeros(labels.shape[1:3], dtype=np.int64)
+            self.jaw_positions = np.zeros(labels.shape[1:3], dtype=np.int64)
+        elif images.shape[1:] != self.shape or labels.shape[1:3] != self.tongue_occupancy.shape:
+            raise ValueError(f'Frame shape {images.shape[1:]} does not match {self.shape}')
+
+    def update(self, images: np.ndarray, labels: np.ndarray, experiments: Sequence[str]) -> None:
+        """
+        Add a chunk of frames.
+
+        Parameters
+        ----------
+        images : np.ndarray
+            (N, H, W, C) images
+        labels : np.ndarray
+            (N, H, W, 2) labels
+        experiments : Sequence[str]
+            Experiment name of each frame
+        """
+        images = np.asarray(images)
+        labels = np.asarray(labels)
+        n = len(images)
+        if n == 0:
+            return
+        if images.ndim == 3:
+            images = images[..., np.newaxis]
+        if len(labels) != n or len(experiments) != n:
+            raise ValueError('images, labels and experiments must have the same length')
+        self._init_shape(images, labels)
+        self.n_frames += n
+
+        # Pixel statistics; for uint8 the exact moments follow from the histogram
+        n_channels = images.shape[-1]
+        pixels = images.reshape(-1, n_channels)
+        if images.dtype == np.uint8:
+            hist = np.stack([np.bincount(pixels[:, c], minlength=256) for c in range(n_channels)])
+            self.channel_hist += hist
+            values = np.arange(256, dtype=np.float64)
+            count = len(pixels)
+            mean = hist @ values / count
+            m2 = (hist * (values - mean[:, np.newaxis]) ** 2).sum(axis=1)
+            self.channels.merge_moments(count, mean, m2)
+        else:
+            self.channels.update(pixels)
+
+        # Label statistics
+        tongue = labels[..., 0].reshape(n, -1) > 0
+        jaw = labels[..., 1].reshape(n, -1)
+        tongue_pixels = np.count_nonzero(tongue, axis=1)
+        empty_tongue = tongue_pixels == 0
+        empty_jaw = ~np.any(jaw > 0, axis=1)
+
+        fraction = tongue_pixels / tongue.shape[1]
+        self.area.update(fraction[~empty_tongue, np.newaxis])
+        bins = np.minimum((fraction * self.area_bins).astype(np.int64), self.area_bins - 1)
+        self.area_hist += np.bincount(bins, minlength=self.area_bins)
+
+        self.tongue_occupancy += np.count_nonzero(tongue, axis=0).reshape(self.tongue_occupancy.shape)
+        peaks = np.argmax(jaw[~empty_jaw], axis=1)
+        self.jaw_positions += np.bincount(peaks, minlength=jaw.shape[1]).reshape(self.jaw_positions.shape)
+
+        # Per-experiment counts
+        names, inverse = np.unique(np.asarray(experiments, dtype=object).astype(str), return_inverse=True)
+        counts = np.stack([np.bincount(inverse, weights=w, minlength=len(names))
+                           for w in (np.ones(n), empty_tongue, empty_jaw, empty_tongue & empty_jaw)], axis=1)
+        for name, row in zip(names, counts.astype(np.int64)):
+            totals = self.experiments.setdefault(str(name), [0, 0, 0, 0])
+            for i, value in enumerate(row):
+                totals[i] += int(value)
+
+    def merge(self, other: 'DatasetStats') -> 'DatasetStats':
+        """Add the statistics of ``other`` (computed with the same ``area_bins``) in place."""
+        if other.n_frames == 0:
+            return self
+        if other.area_bins != self.area_bins:
+            raise ValueError('Cannot merge statistics with different area_bins')
+        if self.shape is None:
+            self.shape = other.shape
+            self.channels = Welford(len(other.channels.mean))
+            self.channel_hist = np.zeros_like(other.channel_hist)
+            self.tongue_occupancy = np.zeros_like(other.tongue_occupancy)
+            self.jaw_positions = np.zeros_like(other.jaw_positions)
+        elif other.shape != self.shape:
+            raise ValueError(f'Cannot merge statistics of shape {other.shape} into {self.shape}')
+        self.n_frames += other.n_frames
+        self.channels.merge(other.channels)
+        self.channel_hist += other.channel_hist
+        self.area.merge(other.area)
+        self.area_hist += other.area_hist
+        self.tongue_occupancy += other.tongue_occupancy
+        self.jaw_positions += other.jaw_positions
+        for name, row in other.experiments.items():
+            totals = self.experiments.setdefault(name, [0, 0, 0, 0])
+            for i, value in enumerate(row):
+                totals[i] += value
+        return self
+
+    def summary(self) -> Dict:
+        """JSON-serializable summary of the statistics."""
+        def rates(row):
+            frames, empty_tongue, empty_jaw, empty_both = row
+            return {
+                'frames': frames,
+                'empty_tongue': empty_tongue,
+                'empty_jaw': empty_jaw,
+                'empty_both': empty_both,
+                'empty_tongue_rate': empty_tongue / frames if frames else None,
+                'empty_jaw_rate': empty_jaw / frames if frames else None,
+                'empty_both_rate': empty_both / frames if frames else None,
+            }
+
+        totals = np.sum(list(self.experiments.values()), axis=0).tolist() if self.experiments else [0, 0, 0, 0]
+        jaw_frames = int(self.jaw_positions.sum()) if self.jaw_positions is not None else 0
+        jaw_mean = None
+        if jaw_frames:
+            ys, xs = np.indices(self.jaw_positions.shape)
+            jaw_mean = [float((xs * self.jaw_positions).sum() / jaw_frames),
+                        float((ys * self.jaw_positions).sum() / jaw_frames)]
+        return {
+            'n_frames': self.n_frames,
+            'image_shape': list(self.shape) if self.shape is not None else None,
+            'channel_order': 'BGR',
+            'channel_mean': self.channels.mean.tolist() if self.channels else None,
+            'channel_std': self.channels.std.tolist() if self.channels else None,
+            'labels': rates(totals),
+            'tongue_area_fraction': {
+                'nonempty_frames': self.area.count,
+                'mean': float(self.area.mean[0]) if self.area.count else None,
+                'std': float(self.area.std[0]) if self.area.count else None,
+                'histogram': self.area_hist.tolist(),
+                'bin_edges': np.linspace(0, 1, self.area_bins + 1).tolist(),
+            },
+            'jaw_keypoint': {'frames': jaw_frames, 'mean_xy': jaw_mean},
+            'experiments': {name: rates(row) for name, row in sorted(self.experiments.items())},
+        }
+
+    def save(self, path_prefix: str) -> Tuple[str, str]:
+        """Write ``<path_prefix>.json`` (summary) and ``<path_prefix>.npz`` (accumulators)."""
+        names = sorted(self.experiments)
+        arrays = {
+            'area_bins': np.array(self.area_bins),
+            'n_frames': np.array(self.n_frames),
+            'area': np.array([self.area.count, self.area.mean[0], self.area.m2[0]]),
+            'area_hist': self.area_hist,
+            'experiment_names': np.array(names, dtype=str),
+            'experiment_counts': np.array([self.experiments[name] for name in names],
+                                          dtype=np.int64).reshape(-1, 4),
+        }
+        if self.shape is not None:
+            arrays.update({
+                'shape': np.array(self.shape),
+                'channel_count': np.array(self.channels.count),
+                'channel_mean': self.channels.mean,
+                'channel_m2': self.channels.m2,
+                'channel_hist': self.channel_hist,
+                'tongue_occupancy': self.tongue_occupancy,
+                'jaw_positions': self.jaw_positions,
+            })
+        json_path, npz_path = path_prefix + '.json', path_prefix + '.npz'
+        np.savez_compressed(npz_path + '.tmp.npz', **arrays)
+        os.replace(npz_path + '.tmp.npz', npz_path)
+        with open(json_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(json_path + '.tmp', json_path)
+        return json_path, npz_path
+
+    @classmethod
+    def load(cls, path_prefix: str) -> 'DatasetStats':
+        """Read accumulators written by ``save`` (``path_prefix`` with or without ``.npz``)."""
+        if path_prefix.endswith('.npz'):
+            path_prefix = path_prefix[:-4]
+        with np.load(path_prefix + '.npz') as data:
+            stats = cls(int(data['area_bins']))
+            stats.n_frames = int(data['n_frames'])
+            count, mean, m2 = data['area']
+            stats.area.count, stats.area.mean[0], stats.area.m2[0] = int(count), mean, m2
+            stats.area_hist = data['area_hist']
+            stats.experiments = {str(name): row.tolist()
+                                 for name, row in zip(data['experiment_names'], data['experiment_counts'])}
+            if 'shape' in data:
+                stats.shape = tuple(int(s) for s in data['shape'])
+                stats.channels = Welford(len(data['channel_mean']))
+                stats.channels.count = int(data['channel_count'])
+                stats.channels.mean = data['channel_mean']
+                stats.channels.m2 = data['channel_m2']
+                stats.channel_hist = data['channel_hist']
+                stats.tongue_occupancy = data['tongue_occupancy']
+                stats.jaw_positions = data['jaw_positions']
+        return stats
+
+
+def stats_path(dataset_path: str) -> str:
+    """Path prefix the statistics of a dataset are saved under."""
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, 'dataset_stats')
+    return os.path.splitext(dataset_path)[0] + '.stats'
+
+
+def _chunk_stats(images, labels, experiments, area_bins):
+    stats = DatasetStats(area_bins)
+    stats.update(images, labels, experiments)
+    return stats
+
+
+def compute_stats_arrays(images: np.ndarray,
+                         labels: np.ndarray,
+                         filenames: Optional[List[str]] = None,
+                         chunk_size: int = 256,
+                         max_workers: Optional[int] = None,
+                         area_bins: int = 50) -> DatasetStats:
+    """
+    Statistics of in-memory ``load_licking_data`` output, reduced in parallel chunks.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        (N, H, W, C) images
+    labels : np.ndarray
+        (N, H, W, 2) labels
+    filenames : Optional[List[str]]
+        Frame filenames, used to group frames by experiment (default: one group)
+    chunk_size : int
+        Frames per chunk
+    max_workers : Optional[int]
+        Worker threads (numpy releases the GIL for the reductions)
+    area_bins : int
+        Bins of the tongue area histogram
+
+    Returns
+    -------
+    DatasetStats
+    """
+    experiments = [experiment_of(f) for f in filenames] if filenames is not None else [''] * len(images)
+    starts = range(0, len(images), chunk_size)
+    stats = DatasetStats(area_bins)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in executor.map(lambda s: _chunk_stats(images[s:s + chunk_size], labels[s:s + chunk_size],
+                                                         experiments[s:s + chunk_size], area_bins), starts):
+            stats.merge(chunk)
+    return stats
+
+
+def _experiment_stats(args):
+    from licking_dataset import LickingDataset
+
+    data_folder, folder, chunk_size, area_bins, dataset_kwargs = args
+    dataset = LickingDataset(data_folder, experiment_folders=[folder], cache_size=0, **dataset_kwargs)
+    stats = DatasetStats(area_bins)
+    for start in range(0, len(dataset), chunk_size):
+        images, labels = dataset[start:start + chunk_size]
+        stats.update(images, labels, [folder] * len(images))
+    return stats
+
+
+def compute_stats_folder(data_folder: str,
+                         chunk_size: int = 256,
+                         max_workers: Optional[int] = None,
+                         area_bins: int = 50,
+                         **dataset_kwargs) -> DatasetStats:
+    """
+    Statistics of an experiment corpus, streamed without loading it into memory.
+
+    Experiments are processed in parallel worker processes; each decodes its
+    frames lazily through ``LickingDataset``, ``chunk_size`` frames at a time.
+    ``dataset_kwargs`` (target resolution, sigma, folder layout) are passed on
+    to ``LickingDataset`` so the frames match ``load_licking_data``.
+    """
+    folders = sorted(filename for filename in os.listdir(data_folder)
+                     if os.path.isdir(os.path.join(data_folder, filename)))
+    tasks = [(data_folder, folder, chunk_size, area_bins, dataset_kwargs) for folder in folders]
+    stats = DatasetStats(area_bins)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for experiment in executor.map(_experiment_stats, tasks):
+            stats.merge(experiment)
+    return stats
+
+
+def compute_stats_archive(archive_path: str,
+                          max_workers: Optional[int] = None,
+                          area_bins: int = 50) -> DatasetStats:
+    """Statistics of a chunked archive, decompressing one archive chunk at a time."""
+    from chunked_archive import ChunkedArchive
+
+    stats = DatasetStats(area_bins)
+    with ChunkedArchive(archive_path, max_workers=max_workers) as archive:
+        chunk_size = archive.index['chunk_size']
+        for chunk_index, start in enumerate(range(0, len(archive), chunk_size)):
+            images, labels = archive.read_chunk(chunk_index)
+            names = archive.filenames[start:start + len(images)] if archive.filenames else None
+            stats.merge(compute_stats_arrays(images, labels, names, max_workers=max_workers,
+                                             area_bins=area_bins))
+    return stats
+
+
+def compute_stats(dataset_path: str,
+                  chunk_size: int = 256,
+                  max_workers: Optional[int] = None,
+                  area_bins: int = 50,
+                  save: bool = True,
+                  **dataset_kwargs) -> DatasetStats:
+    """
+    Statistics of a dataset folder, pickle or chunked archive, saved next to it.
+
+    Pickles may hold ``(images, labels)`` or ``(images, filenames, labels)``;
+    anything else that is not a folder or pickle is opened as a chunked archive.
+    """
+    if os.path.isdir(dataset_path):
+        stats = compute_stats_folder(dataset_path, chunk_size, max_workers, area_bins, **dataset_kwargs)
+    elif dataset_path.endswith('.pkl'):
+        with open(dataset_path, 'rb') as handle:
+            data = pickle.load(handle)
+        if len(data) == 3:
+            images, filenames, labels = data
+        else:
+            (images, labels), filenames = data, None
+        stats = compute_stats_arrays(images, labels, filenames, chunk_size, max_workers, area_bins)
+    else:
+        stats = compute_stats_archive(dataset_path, max_workers, area_bins)
+    if save:
+        json_path, _ = stats.save(stats_path(dataset_path))
+        print(f'Saved statistics of {stats.n_frames} frames to {json_path}')
+    return stats
+
+
+def print_stats(stats: DatasetStats) -> None:
+    """Print a human-readable summary."""
+    summary = stats.summary()
+    print(f"Frames: {summary['n_frames']}  image shape: {summary['image_shape']}")
+    if summary['channel_mean'] is not None:
+        for name, mean, std in zip('BGR', summary['channel_mean'], summary['channel_std']):
+            print(f'  {name}: mean {mean:8.3f}  std {std:8.3f}')
+    labels = summary['labels']
+    if labels['frames']:
+        print(f"Empty tongue masks: {labels['empty_tongue']} ({labels['empty_tongue_rate']:.1%})  "
+              f"empty jaw heatmaps: {labels['empty_jaw']} ({labels['empty_jaw_rate']:.1%})  "
+              f"both empty: {labels['empty_both']} ({labels['empty_both_rate']:.1%})")
+    area = summary['tongue_area_fraction']
+    if area['nonempty_frames']:
+        print(f"Tongue area (non-empty masks): mean {area['mean']:.2%} std {area['std']:.2%}")
+    print(f"{'Experiment':<30} {'Frames':>8} {'Empty tongue':>13} {'Empty jaw':>10}")
+    for name, row in summary['experiments'].items():
+        print(f"{name:<30} {row['frames']:>8} {row['empty_tongue_rate']:>12.1%} {row['empty_jaw_rate']:>9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute streaming statistics of a licking dataset')
+    parser.add_argument('dataset', help='Experiment corpus folder, dataset .pkl or chunked archive')
+    parser.add_argument('--chunk-size', type=int, default=256, help='Frames per chunk (default: 256)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Parallel workers')
+    parser.add_argument('--area-bins', type=int, default=50, help='Tongue area histogram bins (default: 50)')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(256, 256), metavar=('WIDTH', 'HEIGHT'),
+                        help='Target resolution when reading a corpus folder (default: 256 256)')
+    parser.add_argument('--labeled-only', dest='load_all_images', action='store_false',
+                        help='Only include frames that have jaw labels (corpus folders)')
+    parser.add_argument('--no-save', dest='save', action='store_false', help='Do not save the statistics')
+    args = parser.parse_args()
+
+    dataset_kwargs = {}
+    if os.path.isdir(args.dataset):
+        dataset_kwargs = {'target_resolution': tuple(args.resolution), 'load_all_images': args.load_all_images}
+    stats = compute_stats(args.dataset, args.chunk_size, args.workers, args.area_bins, args.save, **dataset_kwargs)
+    print_stats(stats)
+
+
+if __name__ == '__main__':
+    main()
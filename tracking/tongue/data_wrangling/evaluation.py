@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Vectorized scoring of tongue mask and keypoint predictions.
+
+Predictions are compared with the labels ``load_licking_data`` produces:
+``(N, H, W, 2)`` arrays holding the tongue mask and the jaw heatmap. Every
+metric is computed for all frames at once with array operations, so a full
+validation set can be scored after every training epoch.
+
+Masks
+    ``mask_scores`` returns per-frame intersection, union, IoU and Dice.
+    Masks can be dense arrays (probabilities are thresholded), bit-packed
+    (``pack_masks``, 8 pixels per byte) or run-length encoded
+    (``encode_rle``). Packed masks are compared with a byte popcount table,
+    run-length masks by sweeping the run boundaries of both masks, without
+    decoding either to pixels.
+
+Keypoints
+    ``heatmap_keypoints`` finds the peak of each heatmap with
+    ``create_dataset_utils.heatmap_decoder``, shared with the pole tracker
+    (sub-pixel refinement included); an empty heatmap is an occluded
+    keypoint. ``keypoint_errors`` and ``pck`` score keypoint coordinates,
+    excluding keypoints that are occluded in the labels. Predictions
+    missing for a visible keypoint count as misses.
+
+``evaluate_predictions`` combines both and reports overall and per-experiment
+results.
+
+Example:
+  results = evaluate_predictions(model.predict(images), labels, filenames, thresholds=(2, 5, 10))
+  print_evaluation(results)
+
+  python evaluation.py licking_dataset.pkl predictions.npy --thresholds 2 5 10
+"""
+
+import argparse
+import os
+import pickle
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from create_dataset_utils.heatmap_decoder import DECODE_METHODS, decode_heatmaps
+from dataset_stats import experiment_of
+
+# Number of set bits of every byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+
+class PackedMasks(NamedTuple):
+    """Boolean masks with the pixels of each frame packed 8 per byte: ``bits`` is (N, ceil(H * W / 8))."""
+    bits: np.ndarray
+    shape: Tuple[int, int, int]
+
+
+class RunLengthMasks(NamedTuple):
+    """
+    Boolean masks as runs of foreground pixels in row-major order.
+
+    Run ``k`` covers flat pixels ``start[k]`` to ``start[k] + length[k] - 1``
+    of frame ``frame[k]``; runs are sorted by frame, then start.
+    """
+    frame: np.ndarray
+    start: np.ndarray
+    length: np.ndarray
+    shape: Tuple[int, int, int]
+
+
+def _as_bool(masks: np.ndarray, threshold: float) -> np.ndarray:
+    masks = np.asarray(masks)
+    if masks.dtype == bool:
+        return masks
+    if np.issubdtype(masks.dtype, np.floating):
+        return masks > threshold
+    # Integer masks: 0/1 or 0/255
+    return masks > 0
+
+
+def pack_masks(masks: np.ndarray, threshold: float = 0.5) -> PackedMasks:
+    """
+    Bit-pack (N, H, W) masks.
+
+    Float masks are thresholded at ``threshold``, integer masks at 0.
+    """
+    masks = _as_bool(masks, threshold)
+    return PackedMasks(np.packbits(masks.reshape(len(masks), -1), axis=1), masks.shape)
+
+
+def unpack_masks(packed: PackedMasks) -> np.ndarray:
+    n, h, w = packed.shape
+    return np.unpackbits(packed.bits, axis=1, count=h * w).astype(bool).reshape(n, h, w)
+
+
+def encode_rle(masks: np.ndarray, threshold: float = 0.5) -> RunLengthMasks:
+    """Run-length encode (N, H, W) masks (see ``pack_masks`` for thresholding)."""
+    masks = _as_bool(masks, threshold)
+    n = len(masks)
+    flat = masks.reshape(n, -1)
+    # A run starts where a pixel is set and its predecessor is not; the zero
+    # column keeps runs from continuing across frames
+    padded = np.zeros((n, flat.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = flat
+    edges = np.diff(padded, axis=1)
+    start_frame, start = np.nonzero(edges == 1)
+    _, end = np.nonzero(edges == -1)
+    return RunLengthMasks(start_frame.astype(np.int64), start.astype(np.int64),
+                          (end - start).astype(np.int64), masks.shape)
+
+
+def decode_rle(rle: RunLengthMasks) -> np.ndarray:
+    n, h, w = rle.shape
+    size = h * w
+    # +1 at run starts and -1 after run ends, per frame, then a running sum
+    delta = np.zeros(n * (size + 1), dtype=np.int32)
+    np.add.at(delta, rle.frame * (size + 1) + rle.start, 1)
+    np.add.at(delta, rle.frame * (size + 1) + rle.start + rle.length, -1)
+    return (np.cumsum(delta.reshape(n, size + 1), axis=1)[:, :size] > 0).reshape(n, h, w)
+
+
+def _areas_rle(rle: RunLengthMasks) -> np.ndarray:
+    return np.bincount(rle.frame, weights=rle.length, minlength=rle.shape[0]).astype(np.int64)
+
+
+def _intersection_rle(a: RunLengthMasks, b: RunLengthMasks) -> np.ndarray:
+    """Pixels covered by both masks of every frame, from run boundaries only."""
+    n, h, w = a.shape
+    size = h * w
+    frames = np.concatenate([a.frame, a.frame, b.frame, b.frame])
+    positions = np.concatenate([a.start, a.start + a.length, b.start, b.start + b.length]) + frames * size
+    deltas = np.concatenate([np.ones_like(a.start), -np.ones_like(a.start),
+                             np.ones_like(b.start), -np.ones_like(b.start)])
+    # Ends sort before starts at the same position, so the segment after a tie
+    # belongs to the frame of the run that starts there
+    order = np.lexsort((deltas, positions))
+    positions, deltas, frames = positions[order], deltas[order], frames[order]
+    # Number of masks covering the segment from each boundary to the next
+    coverage = np.cumsum(deltas)
+    lengths = np.diff(positions, append=positions[-1] if len(positions) else 0)
+    return np.bincount(frames, weights=lengths * (coverage == 2), minlength=n).astype(np.int64)
+
+
+def _mask_counts(pred, target, threshold: float, chunk_size: int):
+    """Per-frame (intersection, pred area, target area) for dense, packed or run-length masks."""
+    if isinstance(pred, RunLengthMasks) or isinstance(target, RunLengthMasks):
+        if not isinstance(pred, RunLengthMasks):
+            pred = encode_rle(unpack_masks(pred) if isinstance(pred, PackedMasks) else pred, threshold)
+        if not isinstance(target, RunLengthMasks):
+            target = encode_rle(unpack_masks(target) if isinstance(target, PackedMasks) else target, threshold)
+        if tuple(pred.shape) != tuple(target.shape):
+            raise ValueError(f'Mask shapes differ: {pred.shape} vs {target.shape}')
+        return _intersection_rle(pred, target), _areas_rle(pred), _areas_rle(target)
+
+    n = len(pred.bits) if isinstance(pred, PackedMasks) else len(pred)
+    if n != (len(target.bits) if isinstance(target, PackedMasks) else len(target)):
+        raise ValueError('Predictions and targets have different numbers of frames')
+    intersection = np.empty(n, dtype=np.int64)
+    pred_area = np.empty(n, dtype=np.int64)
+    target_area = np.empty(n, dtype=np.int64)
+    # Dense masks are packed a chunk at a time to bound temporary memory
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        p = pred.bits[chunk] if isinstance(pred, PackedMasks) else pack_masks(pred[chunk], threshold).bits
+        t = target.bits[chunk] if isinstance(target, PackedMasks) else pack_masks(target[chunk], threshold).bits
+        if p.shape != t.shape:
+            raise ValueError(f'Mask shapes differ: {p.shape} vs {t.shape} (packed)')
+        intersection[chunk] = _POPCOUNT[p & t].sum(axis=1)
+        pred_area[chunk] = _POPCOUNT[p].sum(axis=1)
+        target_area[chunk] = _POPCOUNT[t].sum(axis=1)
+    return intersection, pred_area, target_area
+
+
+def mask_scores(pred, target, threshold: float = 0.5, chunk_size: int = 1024) -> Dict[str, np.ndarray]:
+    """
+    Per-frame IoU and Dice of predicted masks.
+
+    Parameters
+    ----------
+    pred, target : np.ndarray, PackedMasks or RunLengthMasks
+        (N, H, W) masks. Dense float masks are thresholded at ``threshold``,
+        integer masks at 0
+    threshold : float
+        Probability threshold of dense float masks
+    chunk_size : int
+        Dense frames packed at a time
+
+    Returns
+    -------
+    dict
+        (N,) arrays 'intersection', 'union', 'pred_area', 'target_area',
+        'iou', 'dice'. Frames where both masks are empty score 1 and are
+        marked in 'empty'
+    """
+    intersection, pred_area, target_area = _mask_counts(pred, target, threshold, chunk_size)
+    union = pred_area + target_area - intersection
+    empty = union == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(empty, 1.0, intersection / union)
+        dice = np.where(empty, 1.0, 2 * intersection / (pred_area + target_area))
+    return {'intersection': intersection, 'union': union, 'pred_area': pred_area,
+            'target_area': target_area, 'iou': iou, 'dice': dice, 'empty': empty}
+
+
+def heatmap_keypoints(heatmaps: np.ndarray, min_peak: float = 0.0, method: str = 'quadratic') -> np.ndarray:
+    """
+    Keypoint coordinates at the peaks of heatmaps, decoded with ``create_dataset_utils.heatmap_decoder.decode_heatmaps``.
+
+    Parameters
+    ----------
+    heatmaps : np.ndarray
+        (N, H, W) for one keypoint or (N, H, W, K); ``uint8`` heatmaps are scaled to [0, 1]
+    min_peak : float
+        A heatmap whose maximum (in [0, 1]) is not above this is an occluded keypoint (NaN)
+    method : str
+        Sub-pixel refinement, one of ``DECODE_METHODS``: 'quadratic' fits a
+        parabola through the log of the peak and its neighbours, which is
+        exact for the Gaussian heatmaps of ``load_licking_data``
+
+    Returns
+    -------
+    np.ndarray
+        (N, K, 2) float64 (x, y) coordinates in heatmap pixels
+    """
+    coords, confidence, _ = decode_heatmaps(heatmaps, method=method, threshold=-np.inf)
+    coords[confidence <= min_peak] = np.nan
+    return coords
+
+
+def keypoint_errors(pred: np.ndarray,
+                    target: np.ndarray,
+                    pixel_scale: Tuple[float, float] = (1.0, 1.0)) -> np.ndarray:
+    """
+    Euclidean pixel error of every keypoint.
+
+    Parameters
+    ----------
+    pred, target : np.ndarray
+        (N, K, 2) (x, y) coordinates; NaN marks a missing prediction or an
+        occluded label
+    pixel_scale : Tuple[float, float]
+        (x, y) factors converting coordinates to the pixels errors are reported
+        in, e.g. original width / label width
+
+    Returns
+    -------
+    np.ndarray
+        (N, K) errors: NaN where the label is occluded, inf where the label is
+        visible but the prediction is missing
+    """
+    pred = np.asarray(pred, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    if pred.shape != target.shape:
+        raise ValueError(f'Keypoint shapes differ: {pred.shape} vs {target.shape}')
+    errors = np.hypot(*np.moveaxis((pred - target) * np.asarray(pixel_scale, dtype=np.float64), -1, 0))
+    visible = ~np.isnan(target).any(axis=-1)
+    errors[visible & np.isnan(errors)] = np.inf
+    return errors
+
+
+def pck(errors: np.ndarray, thresholds: Sequence[float] = (2, 5, 10)) -> np.ndarray:
+    """
+    Percentage of correct keypoints: the fraction of visible keypoints within each threshold.
+
+    Parameters
+    ----------
+    errors : np.ndarray
+        (N, K) errors from ``keypoint_errors``
+    thresholds : Sequence[float]
+        Distances in the units of ``errors``
+
+    Returns
+    -------
+    np.ndarray
+        (len(thresholds), K) fractions; NaN for a keypoint that is never visible
+    """
+    visible = ~np.isnan(errors)
+    with np.errstate(invalid='ignore'):
+        hits = errors[None] <= np.asarray(thresholds, dtype=np.float64)[:, None, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return hits.sum(axis=1) / visible.sum(axis=0)
+
+
+def _summarize(scores: dict, errors: Optional[np.ndarray], thresholds, frames: np.ndarray) -> dict:
+    """Aggregate per-frame scores of the frames selected by the boolean mask ``frames``."""
+    summary = {'frames': int(frames.sum())}
+    if scores is not None:
+        labeled = frames & ~scores['empty']
+        summary['tongue_frames'] = int((frames & (scores['target_area'] > 0)).sum())
+        # Mean IoU/Dice over frames where either mask is set; IoU pooled over pixels
+        summary['mean_iou'] = float(scores['iou'][labeled].mean()) if labeled.any() else float('nan')
+        summary['mean_dice'] = float(scores['dice'][labeled].mean()) if labeled.any() else float('nan')
+        union = scores['union'][frames].sum()
+        summary['pixel_iou'] = float(scores['intersection'][frames].sum() / union) if union else float('nan')
+        # Frames with an empty label whose prediction is empty too
+        empty_label = frames & (scores['target_area'] == 0)
+        summary['empty_accuracy'] = (float((scores['pred_area'][empty_label] == 0).mean())
+                                     if empty_label.any() else float('nan'))
+    if errors is not None:
+        selected = errors[frames]
+        visible = ~np.isnan(selected)
+        summary['visible_keypoints'] = visible.sum(axis=0).tolist()
+        summary['missed_keypoints'] = np.isinf(selected).sum(axis=0).tolist()
+        with np.errstate(invalid='ignore'):
+            found = np.where(np.isfinite(selected), selected, np.nan)
+            summary['mean_error'] = [float(v) for v in np.nanmean(found, axis=0)] if len(found) else []
+            summary['median_error'] = [float(v) for v in np.nanmedian(found, axis=0)] if len(found) else []
+        summary['pck'] = {float(t): [float(v) for v in row] for t, row in zip(thresholds, pck(selected, thresholds))}
+    return summary
+
+
+def evaluate_predictions(pred_labels,
+                         labels,
+                         filenames: Optional[Sequence[str]] = None,
+                         thresholds: Sequence[float] = (2, 5, 10),
+                         mask_threshold: float = 0.5,
+                         min_peak: float = 0.0,
+                         pixel_scale: Tuple[float, float] = (1.0, 1.0),
+                         pred_keypoints: Optional[np.ndarray] = None,
+                         target_keypoints: Optional[np.ndarray] = None,
+                         method: str = 'quadratic') -> dict:
+    """
+    Score tongue masks and keypoints, overall and per experiment.
+
+    Parameters
+    ----------
+    pred_labels : np.ndarray or None
+        (N, H, W, 1 + K) predictions laid out like ``labels``: tongue mask
+        (probabilities or binary) then keypoint heatmaps. None to score
+        ``pred_keypoints`` only
+    labels : np.ndarray or None
+        (N, H, W, 1 + K) labels from ``load_licking_data``
+    filenames : Optional[Sequence[str]]
+        Frame filenames; adds a per-experiment breakdown
+    thresholds : Sequence[float]
+        PCK distances in (scaled) pixels
+    mask_threshold : float
+        Threshold of float mask predictions
+    min_peak : float
+        Predicted heatmaps whose peak is not above this count as "not found".
+        Label heatmaps are occluded when they are all zero
+    pixel_scale : Tuple[float, float]
+        (x, y) factors from label pixels to the pixels errors are reported in
+    pred_keypoints, target_keypoints : Optional[np.ndarray]
+        (N, K, 2) coordinates used instead of the heatmap peaks
+    method : str
+        Sub-pixel refinement of the heatmap peaks (see ``heatmap_keypoints``)
+
+    Returns
+    -------
+    dict
+        'overall' and 'experiments' (experiment -> same keys) summaries, plus
+        the per-frame 'iou', 'dice' and 'keypoint_errors' arrays
+    """
+    scores = None
+    if pred_labels is not None and labels is not None:
+        scores = mask_scores(pred_labels[..., 0], labels[..., 0], threshold=mask_threshold)
+
+    errors = None
+    if pred_keypoints is None and pred_labels is not None and pred_labels.shape[-1] > 1:
+        pred_keypoints = heatmap_keypoints(pred_labels[..., 1:], min_peak=min_peak, method=method)
+    if target_keypoints is None and labels is not None and labels.shape[-1] > 1:
+        target_keypoints = heatmap_keypoints(labels[..., 1:], min_peak=0, method=method)
+    if pred_keypoints is not None and target_keypoints is not None:
+        errors = keypoint_errors(pred_keypoints, target_keypoints, pixel_scale)
+
+    n = len(scores['iou']) if scores is not None else len(errors)
+    results = {'overall': _summarize(scores, errors, thresholds, np.ones(n, dtype=bool)), 'experiments': {},
+               'iou': None if scores is None else scores['iou'],
+               'dice': None if scores is None else scores['dice'],
+               'keypoint_errors': errors}
+    if filenames is not None:
+        experiments, inverse = np.unique(np.asarray([experiment_of(f) for f in filenames], dtype=str),
+                                         return_inverse=True)
+        for e, experiment in enumerate(experiments):
+            results['experiments'][str(experiment)] = _summarize(scores, errors, thresholds, inverse == e)
+    return results
+
+
+def print_evaluation(results: dict) -> None:
+    """Print an evaluation summary table."""
+    rows = [('all', results['overall'])] + list(results['experiments'].items())
+    print(f"{'Experiment':<24} {'Frames':>7} {'IoU':>6} {'Dice':>6} {'Empty':>6}  Keypoint error (px) / PCK")
+    for name, summary in rows:
+        line = f"{name[:24]:<24} {summary['frames']:>7}"
+        if 'mean_iou' in summary:
+            line += (f" {summary['mean_iou']:>6.3f} {summary['mean_dice']:>6.3f}"
+                     f" {summary['empty_accuracy']:>6.1%}")
+        if 'mean_error' in summary:
+            for k, error in enumerate(summary['mean_error']):
+                pcks = ' '.join(f'{values[k]:.1%}@{t:g}' for t, values in summary['pck'].items())
+                line += (f"  kp{k}: {error:.2f} (n={summary['visible_keypoints'][k]}, "
+                         f"missed {summary['missed_keypoints'][k]}) {pcks}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score tongue mask and keypoint predictions against a licking dataset')
+    parser.add_argument('dataset', help='Dataset .pkl with (images, filenames, labels) or (images, labels)')
+    parser.add_argument('predictions', help='.npy of (N, H, W, 2) predictions in the layout of the labels')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[2, 5, 10], help='PCK distances in pixels')
+    parser.add_argument('--mask-threshold', type=float, default=0.5, help='Threshold of probability masks')
+    parser.add_argument('--min-peak', type=float, default=0.0,
+                        help='Predicted heatmaps with a lower peak count as not found')
+    parser.add_argument('--method', '-m', default='quadratic', choices=DECODE_METHODS,
+                        help='Sub-pixel refinement of heatmap peaks')
+    parser.add_argument('--pixel-scale', type=float, nargs=2, default=(1.0, 1.0), metavar=('X', 'Y'),
+                        help='Factors from label pixels to reported pixels, e.g. 2.5 2.5 for 640x480 from 256x192')
+    parser.add_argument('--output', '-o', default=None, help='Write the per-frame scores to this .npz')
+    args = parser.parse_args()
+
+    with open(args.dataset, 'rb') as handle:
+        data = pickle.load(handle)
+    if len(data) == 3:
+        _, filenames, labels = data
+    else:
+        (_, labels), filenames = data, None
+    predictions = np.load(args.predictions, mmap_mode='r')
+
+    results = evaluate_predictions(predictions, labels, filenames, args.thresholds, args.mask_threshold,
+                                   args.min_peak, tuple(args.pixel_scale), method=args.method)
+    print_evaluation(results)
+    if args.output:
+        arrays = {key: results[key] for key in ('iou', 'dice', 'keypoint_errors') if results[key] is not None}
+        tmp_path = args.output + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            np.savez(handle, **arrays)
+        os.replace(tmp_path, args.output)
+        print(f'Per-frame scores saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Incremental ingestion: append new labeling rounds to a built dataset.
+
+A dataset folder holds the frames of every ingested experiment folder in
+arrays that grow in place, plus a manifest recording, per experiment folder,
+its frame range and a fingerprint of its files:
+
+  images.npy, labels.npy   frames and labels as ``load_licking_data`` returns them
+  filenames.txt            one image path per frame
+  relpaths.txt             one path per frame, relative to the data folder
+  train.npy, test.npy      frame indices of each split
+  manifest.json            loader settings, experiments, retired frame ranges
+
+``append_experiments`` fingerprints every experiment folder (file names,
+sizes and modification times; no reads), and loads only the folders that are
+new or whose fingerprint changed. Their frames are appended to the ``.npy``
+files by rewriting the header shape and writing past the end, so a labeling
+round costs time proportional to its own frames. The frames a changed folder
+had before are retired: they stay in the arrays but leave the splits, until
+``compact_dataset`` rewrites the arrays without them.
+
+Every frame is assigned to a split by a hash of its path relative to the data
+folder, so existing frames never change split when data is added, and a
+re-ingested frame keeps the split it had. The relative paths are stored when a
+frame is ingested, so the splits do not depend on the working directory; a data
+folder that moved must be confirmed with ``--relocate``.
+
+Example usage:
+  python incremental_ingest.py append /mnt/data/Mask+Jaw/ /mnt/data/licking_dataset/
+  python incremental_ingest.py append /mnt/data/Mask+Jaw/ /mnt/data/licking_dataset/ --dry-run
+  python incremental_ingest.py export /mnt/data/licking_dataset/ /mnt/data/Mask+Jaw/
+  python incremental_ingest.py compact /mnt/data/licking_dataset/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from licking_data_parser import load_licking_data
+from sharded_ingest import RUNTIME_LOADER_KWARGS, _write_atomic, check_loader_kwargs, list_experiment_folders
+
+MANIFEST_NAME = 'manifest.json'
+ARRAYS = ('images', 'labels')
+PATH_LISTS = ('filenames', 'relpaths')
+SPLITS = ('train', 'test')
+NPY_HEADER_SIZE = 256  # fixed, so the shape in the header can grow in place
+
+def experiment_fingerprint(experiment_path: str, content: bool = False) -> Tuple[str, int]:
+    """
+    Fingerprint of every file in an experiment folder.
+
+    Parameters
+    ----------
+    experiment_path : str
+        Experiment folder
+    content : bool
+        Hash file contents instead of sizes and modification times
+
+    Returns
+    -------
+    Tuple[str, int]
+        Hex digest and number of files
+    """
+    digest = hashlib.sha1()
+    n_files = 0
+    for dirpath, dirnames, filenames in os.walk(experiment_path):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            path = os.path.join(dirpath, fname)
+            relpath = os.path.relpath(path, experiment_path).replace(os.sep, '/')
+            if content:
+                with open(path, 'rb') as handle:
+                    file_digest = hashlib.sha1(handle.read()).hexdigest()
+                digest.update(f'{relpath}\0{file_digest}\n'.encode('utf-8'))
+            else:
+                st = os.stat(path)
+                digest.update(f'{relpath}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+            n_files += 1
+    return digest.hexdigest(), n_files
+
+
+def split_assignment(relpaths: List[str], test_fraction: float, seed: int = 0) -> np.ndarray:
+    """
+    Stable split of frames: True for test frames.
+
+    A frame is a test frame when the hash of ``seed`` and its path falls in the
+    lowest ``test_fraction`` of the hash range, so the assignment of a frame
+    never depends on the other frames.
+    """
+    buckets = np.array([int.from_bytes(hashlib.blake2b(f'{seed}:{p}'.encode('utf-8'), digest_size=8).digest(),
+                                       'little') for p in relpaths], dtype=np.uint64)
+    return buckets < np.uint64(int(test_fraction * 2 ** 64)) if len(buckets) else np.zeros(0, dtype=bool)
+
+
+def _npy_header(dtype: np.dtype, shape: tuple) -> bytes:
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                   'shape': tuple(int(s) for s in shape)}).encode('latin1')
+    size = NPY_HEADER_SIZE - 10  # magic (6), version (2), header length (2)
+    if len(header) >= size:
+        raise ValueError(f'Array header too long for shape {shape}')
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', size) + header.ljust(size - 1) + b'\n'
+
+
+def _npy_info(path: str) -> Tuple[np.dtype, tuple]:
+    """dtype and shape from the header of an appendable ``.npy`` file."""
+    with open(path, 'rb') as handle:
+        np.lib.format.read_magic(handle)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(handle)
+        if handle.tell() != NPY_HEADER_SIZE or fortran_order:
+            raise ValueError(f'{path} was not written by incremental_ingest')
+    return dtype, shape
+
+
+def create_npy(path: str, dtype: np.dtype, item_shape: tuple) -> None:
+    """Create an empty ``.npy`` file of ``(0,) + item_shape`` that ``append_npy`` can grow."""
+    with open(path, 'wb') as handle:
+        handle.write(_npy_header(dtype, (0,) + tuple(item_shape)))
+
+
+def append_npy(path: str, array: np.ndarray) -> int:
+    """
+    Append rows to a ``.npy`` file in place; returns the new number of rows.
+
+    The rows are written first and the header last, so an interrupted append
+    leaves the previous array readable (see ``truncate_npy``).
+    """
+    dtype, shape = _npy_info(path)
+    array = np.ascontiguousarray(array, dtype=dtype)
+    if tuple(array.shape[1:]) != tuple(shape[1:]):
+        raise ValueError(f'Cannot append rows of shape {array.shape[1:]} to {path} of shape {shape}')
+    row_bytes = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+    n_rows = shape[0] + len(array)
+    with open(path, 'r+b') as handle:
+        handle.seek(NPY_HEADER_SIZE + shape[0] * row_bytes)
+        handle.write(array.tobytes())
+        handle.truncate()
+        handle.seek(0)
+        handle.write(_npy_header(dtype, (n_rows,) + tuple(shape[1:])))
+    return n_rows
+
+
+def truncate_npy(path: str, n_rows: int) -> None:
+    """Cut a ``.npy`` file written by ``append_npy`` back to its first ``n_rows`` rows."""
+    dtype, shape = _npy_info(path)
+    row_bytes = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+    with open(path, 'r+b') as handle:
+        handle.write(_npy_header(dtype, (n_rows,) + tuple(shape[1:])))
+        handle.truncate(NPY_HEADER_SIZE + n_rows * row_bytes)
+
+
+def _write_npy(path: str, array: np.ndarray) -> None:
+    def write(tmp_path):
+        create_npy(tmp_path, array.dtype, array.shape[1:])
+        append_npy(tmp_path, array)
+    _write_atomic(path, write)
+
+
+def _write_json(path: str, content: Dict) -> None:
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=2)
+    _write_atomic(path, write)
+
+
+def read_manifest(dataset_folder: str) -> Optional[Dict]:
+    """The manifest of a dataset folder, or None if nothing was ingested yet."""
+    path = os.path.join(dataset_folder, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _recover(dataset_folder: str, manifest: Dict) -> None:
+    """
+    Drop rows appended after the last manifest write (an interrupted append).
+
+    Without recorded frames (a new manifest, or only empty experiments so
+    far), leftover arrays are removed and recreated by the next append.
+    """
+    n_frames = manifest['n_frames']
+    paths = [os.path.join(dataset_folder, f'{name}.npy') for name in ARRAYS]
+    list_paths = [os.path.join(dataset_folder, f'{name}.txt') for name in PATH_LISTS]
+    if not n_frames:
+        for path in paths + list_paths:
+            if os.path.exists(path):
+                print(f'Removing {path} left by an interrupted append')
+                os.remove(path)
+        return
+    for path in paths:
+        n_rows = _npy_info(path)[1][0]
+        if n_rows < n_frames:
+            raise ValueError(f'{path} has {n_rows} rows but the manifest records {n_frames} frames')
+        if n_rows > n_frames:
+            print(f'Dropping rows of an interrupted append from {path}')
+            truncate_npy(path, n_frames)
+    for path in list_paths:
+        lines = _read_lines(path)
+        if len(lines) < n_frames:
+            raise ValueError(f'{path} has {len(lines)} lines but the manifest records {n_frames} frames')
+        if len(lines) > n_frames:
+            _write_atomic(path, lambda tmp: _write_lines(tmp, lines[:n_frames], 'w'))
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def _write_lines(path: str, lines: List[str], mode: str = 'a') -> None:
+    with open(path, mode, encoding='utf-8') as f:
+        f.writelines(line + '\n' for line in lines)
+
+
+def _live_mask(manifest: Dict) -> np.ndarray:
+    live = np.ones(manifest['n_frames'], dtype=bool)
+    for start, stop in manifest['retired']:
+        live[start:stop] = False
+    return live
+
+
+def _frame_relpaths(filenames: List[str], data_folder: str) -> List[str]:
+    """Paths relative to ``data_folder``; only valid from the working directory the paths were loaded in."""
+    return [os.path.relpath(f, data_folder).replace(os.sep, '/') for f in filenames]
+
+
+def _write_splits(dataset_folder: str, manifest: Dict) -> Dict[str, int]:
+    """Rewrite the split index files for the live frames from the stored relative paths."""
+    relpaths = _read_lines(os.path.join(dataset_folder, 'relpaths.txt')) if manifest['n_frames'] else []
+    is_test = split_assignment(relpaths, manifest['split']['test_fraction'], manifest['split']['seed'])
+    live = _live_mask(manifest)
+    counts = {}
+    for name, mask in (('train', live & ~is_test), ('test', live & is_test)):
+        indices = np.flatnonzero(mask).astype(np.int64)
+        _write_npy(os.path.join(dataset_folder, f'{name}.npy'), indices)
+        counts[name] = len(indices)
+    return counts
+
+
+def append_experiments(data_folder: str,
+                       dataset_folder: str,
+                       test_fraction: float = 0.2,
+                       seed: int = 0,
+                       content_fingerprint: bool = False,
+                       dry_run: bool = False,
+                       fingerprint_workers: int = 8,
+                       relocate: bool = False,
+                       **loader_kwargs) -> Dict:
+    """
+    Ingest the new and changed experiment folders of ``data_folder`` into ``dataset_folder``.
+
+    Parameters
+    ----------
+    data_folder : str
+        Root folder containing experiment subfolders
+    dataset_folder : str
+        Dataset folder; created on the first run
+    test_fraction : float
+        Fraction of frames assigned to the test split (first run only)
+    seed : int
+        Salt of the split hash (first run only)
+    content_fingerprint : bool
+        Fingerprint file contents instead of sizes and modification times
+        (first run only)
+    dry_run : bool
+        Only report which folders would be ingested
+    fingerprint_workers : int
+        Threads fingerprinting experiment folders
+    relocate : bool
+        Accept a ``data_folder`` other than the one in the manifest (the data
+        moved); the manifest is updated to it
+    **loader_kwargs
+        Passed on to ``load_licking_data``. On later runs they must match the
+        settings stored in the manifest; omitted settings are taken from it.
+        Settings that change the returned arrays (``sharded_ingest.FIXED_LOADER_KWARGS``, a
+        list of resolutions) are rejected
+
+    Returns
+    -------
+    dict
+        'new', 'changed', 'unchanged' and 'missing' folder names, 'frames'
+        (appended), 'retired' (frames), 'n_frames' (live) and split sizes
+    """
+    start = time.perf_counter()
+    os.makedirs(dataset_folder, exist_ok=True)
+    manifest = read_manifest(dataset_folder)
+    check_loader_kwargs(loader_kwargs, 'incremental')
+    loader_kwargs = {k: list(v) if isinstance(v, tuple) else v for k, v in loader_kwargs.items()}
+    runtime_kwargs = {k: loader_kwargs.pop(k) for k in RUNTIME_LOADER_KWARGS if k in loader_kwargs}
+    if manifest is None:
+        manifest = {'data_folder': os.path.abspath(data_folder),
+                    'loader_kwargs': loader_kwargs,
+                    'split': {'test_fraction': test_fraction, 'seed': seed},
+                    'content_fingerprint': content_fingerprint,
+                    'n_frames': 0, 'experiments': {}, 'retired': []}
+    else:
+        if os.path.abspath(data_folder) != manifest['data_folder']:
+            if not relocate:
+                raise ValueError(f'{os.path.abspath(data_folder)} is not the data folder of the dataset '
+                                 f'({manifest["data_folder"]}); pass relocate=True (--relocate) if the data moved')
+            print(f'Data folder moved from {manifest["data_folder"]} to {os.path.abspath(data_folder)}')
+            manifest['data_folder'] = os.path.abspath(data_folder)
+        for key, value in loader_kwargs.items():
+            if manifest['loader_kwargs'].get(key) != value:
+                raise ValueError(f'{key}={value!r} differs from the dataset ({manifest["loader_kwargs"].get(key)!r}); '
+                                 f'build a new dataset to change loader settings')
+    loader_kwargs = dict(manifest['loader_kwargs'])
+    if 'target_resolution' in loader_kwargs:
+        loader_kwargs['target_resolution'] = tuple(loader_kwargs['target_resolution'])
+    if 'gaussian_sigma' in loader_kwargs:
+        loader_kwargs['gaussian_sigma'] = tuple(loader_kwargs['gaussian_sigma'])
+
+    folders = list_experiment_folders(data_folder)
+    with ThreadPoolExecutor(max_workers=fingerprint_workers) as executor:
+        fingerprints = dict(zip(folders, executor.map(
+            lambda folder: experiment_fingerprint(os.path.join(data_folder, folder),
+                                                  manifest['content_fingerprint']), folders)))
+    known = manifest['experiments']
+    summary = {'new': [f for f in folders if f not in known],
+               'changed': [f for f in folders if f in known and known[f]['fingerprint'] != fingerprints[f][0]],
+               'missing': sorted(set(known) - set(folders)),
+               'frames': 0, 'retired': 0}
+    summary['unchanged'] = [f for f in folders if f in known and f not in summary['changed']]
+    print(f"{len(folders)} experiment folders: {len(summary['new'])} new, {len(summary['changed'])} changed, "
+          f"{len(summary['unchanged'])} unchanged")
+    if summary['missing']:
+        print(f"Kept {len(summary['missing'])} ingested folders that are no longer in {data_folder}: "
+              f"{summary['missing']}")
+    if dry_run:
+        return summary
+    _recover(dataset_folder, manifest)
+
+    paths = {name: os.path.join(dataset_folder, f'{name}.npy') for name in ARRAYS}
+    list_paths = {name: os.path.join(dataset_folder, f'{name}.txt') for name in PATH_LISTS}
+    for folder in summary['new'] + summary['changed']:
+        images, filenames, labels = load_licking_data(data_folder, experiment_folders=[folder], return_numpy=True,
+                                                      **loader_kwargs, **runtime_kwargs)
+        if folder in known and known[folder]['stop'] > known[folder]['start']:
+            manifest['retired'].append([known[folder]['start'], known[folder]['stop']])
+            summary['retired'] += known[folder]['stop'] - known[folder]['start']
+        n_frames = manifest['n_frames']
+        if len(filenames):
+            if not manifest['n_frames']:
+                for name, array in zip(ARRAYS, (images, labels)):
+                    create_npy(paths[name], array.dtype, array.shape[1:])
+                for path in list_paths.values():
+                    open(path, 'w').close()
+            for name, array in zip(ARRAYS, (images, labels)):
+                append_npy(paths[name], array)
+            _write_lines(list_paths['filenames'], list(filenames))
+            _write_lines(list_paths['relpaths'], _frame_relpaths(filenames, data_folder))
+        known[folder] = {'fingerprint': fingerprints[folder][0], 'n_files': fingerprints[folder][1],
+                         'start': n_frames, 'stop': n_frames + len(filenames)}
+        manifest['n_frames'] = n_frames + len(filenames)
+        summary['frames'] += len(filenames)
+        # The manifest is written after every folder: an interrupted run resumes from here
+        _write_json(os.path.join(dataset_folder, MANIFEST_NAME), manifest)
+
+    if summary['new'] or summary['changed'] or not os.path.exists(os.path.join(dataset_folder, 'train.npy')):
+        summary.update(_write_splits(dataset_folder, manifest))
+    summary['n_frames'] = int(_live_mask(manifest).sum())
+    _write_json(os.path.join(dataset_folder, MANIFEST_NAME), manifest)
+    print(f"Appended {summary['frames']} frames, retired {summary['retired']}; "
+          f"{summary['n_frames']} frames in {dataset_folder} ({time.perf_counter() - start:.1f} s)")
+    return summary
+
+
+def load_split(dataset_folder: str, split: Optional[str] = None, mmap_mode: Optional[str] = 'r'):
+    """
+    Frames of one split of a dataset folder.
+
+    Parameters
+    ----------
+    dataset_folder : str
+        Dataset folder written by ``append_experiments``
+    split : Optional[str]
+        'train', 'test', or None for all live frames
+    mmap_mode : Optional[str]
+        Memory-map the arrays (only the selected frames are read)
+
+    Returns
+    -------
+    Tuple of (images, filenames, labels) as returned by ``load_licking_data``
+    """
+    manifest = read_manifest(dataset_folder)
+    if manifest is None:
+        raise FileNotFoundError(f'No {MANIFEST_NAME} in {dataset_folder}')
+    if split is None:
+        indices = np.flatnonzero(_live_mask(manifest))
+    elif split in SPLITS:
+        indices = np.load(os.path.join(dataset_folder, f'{split}.npy'))
+    else:
+        raise ValueError(f"split must be one of {SPLITS} or None, got {split!r}")
+    arrays = [np.load(os.path.join(dataset_folder, f'{name}.npy'), mmap_mode=mmap_mode)[:manifest['n_frames']]
+              for name in ARRAYS]
+    filenames = _read_lines(os.path.join(dataset_folder, 'filenames.txt'))
+    return arrays[0][indices], [filenames[i] for i in indices], arrays[1][indices]
+
+
+def compact_dataset(dataset_folder: str, chunk_size: int = 1024) -> Dict:
+    """
+    Rewrite the arrays without retired frames.
+
+    Frame indices change, but split membership does not (it depends only on
+    frame paths).
+
+    Returns
+    -------
+    dict
+        'removed' and 'n_frames'
+    """
+    manifest = read_manifest(dataset_folder)
+    if manifest is None:
+        raise FileNotFoundError(f'No {MANIFEST_NAME} in {dataset_folder}')
+    _recover(dataset_folder, manifest)
+    live = _live_mask(manifest)
+    keep = np.flatnonzero(live)
+    if len(keep) == manifest['n_frames']:
+        print('Nothing to compact')
+        return {'removed': 0, 'n_frames': len(keep)}
+
+    # New position of every old frame, for the experiment ranges
+    new_index = np.cumsum(np.concatenate([[0], live])).astype(np.int64)
+    for name in ARRAYS:
+        path = os.path.join(dataset_folder, f'{name}.npy')
+        source = np.load(path, mmap_mode='r')
+
+        def write(tmp_path):
+            create_npy(tmp_path, source.dtype, source.shape[1:])
+            for chunk_start in range(0, len(keep), chunk_size):
+                append_npy(tmp_path, source[keep[chunk_start:chunk_start + chunk_size]])
+        _write_atomic(path, write)
+        del source
+    for name in PATH_LISTS:
+        path = os.path.join(dataset_folder, f'{name}.txt')
+        lines = _read_lines(path)
+        lines = [lines[i] for i in keep]
+        _write_atomic(path, lambda tmp: _write_lines(tmp, lines, 'w'))
+
+    for experiment in manifest['experiments'].values():
+        experiment['start'], experiment['stop'] = (int(new_index[experiment['start']]),
+                                                   int(new_index[experiment['stop']]))
+    removed = manifest['n_frames'] - len(keep)
+    manifest['n_frames'] = len(keep)
+    manifest['retired'] = []
+    _write_splits(dataset_folder, manifest)
+    _write_json(os.path.join(dataset_folder, MANIFEST_NAME), manifest)
+    print(f'Removed {removed} retired frames; {len(keep)} frames left')
+    return {'removed': removed, 'n_frames': len(keep)}
+
+
+def export_splits(dataset_folder: str, output_folder: str) -> Dict[str, str]:
+    """
+    Write ``training_data.pkl`` and ``testing_data.pkl`` as ``(images, labels)`` tuples.
+
+    Returns
+    -------
+    dict
+        split -> written path
+    """
+    import pickle
+
+    os.makedirs(output_folder, exist_ok=True)
+    written = {}
+    for split, name in (('train', 'training_data.pkl'), ('test', 'testing_data.pkl')):
+        images, _, labels = load_split(dataset_folder, split)
+        path = os.path.join(output_folder, name)
+
+        def write_pickle(tmp_path):
+            with open(tmp_path, 'wb') as handle:
+                pickle.dump((np.asarray(images), np.asarray(labels)), handle, protocol=pickle.HIGHEST_PROTOCOL)
+        _write_atomic(path, write_pickle)
+        print(f'Wrote {len(images)} frames to {path}')
+        written[split] = path
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append new labeling rounds to a built licking dataset')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    append = subparsers.add_parser('append', help='Ingest new and changed experiment folders')
+    append.add_argument('data_folder', help='Root folder containing experiment subfolders')
+    append.add_argument('dataset_folder', help='Dataset folder (created on the first run)')
+    append.add_argument('--resolution', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'),
+                        help='Target resolution (first run default: 256 256)')
+    append.add_argument('--sigma', type=int, nargs=2, default=None, metavar=('Y', 'X'),
+                        help='Jaw heatmap Gaussian sigma (first run default: 25 25)')
+    append.add_argument('--labeled-only', action='store_true', default=None,
+                        help='Only load frames that have jaw labels')
+    append.add_argument('--test-fraction', type=float, default=0.2, help='Test split fraction (first run only)')
+    append.add_argument('--seed', type=int, default=0, help='Split hash seed (first run only)')
+    append.add_argument('--content-fingerprint', action='store_true',
+                        help='Fingerprint file contents instead of sizes and modification times (first run only)')
+    append.add_argument('--prefetch-workers', type=int, default=0, metavar='THREADS',
+                        help='Read image and mask files ahead on this many threads')
+    append.add_argument('--relocate', action='store_true',
+                        help='Accept a data folder other than the one the dataset was built from (the data moved)')
+    append.add_argument('--dry-run', action='store_true', help='Only report new and changed folders')
+
+    export = subparsers.add_parser('export', help='Write training_data.pkl and testing_data.pkl')
+    export.add_argument('dataset_folder', help='Dataset folder')
+    export.add_argument('output_folder', help='Folder for the .pkl files')
+
+    compact = subparsers.add_parser('compact', help='Rewrite the arrays without retired frames')
+    compact.add_argument('dataset_folder', help='Dataset folder')
+
+    args = parser.parse_args(argv)
+    if args.command == 'append':
+        defaults = {'target_resolution': (256, 256), 'gaussian_sigma': (25, 25), 'load_all_images': True}
+        loader_kwargs = {'target_resolution': args.resolution, 'gaussian_sigma': args.sigma,
+                         'load_all_images': None if args.labeled_only is None else not args.labeled_only}
+        loader_kwargs = {k: tuple(v) if isinstance(v, list) else v for k, v in loader_kwargs.items() if v is not None}
+        if read_manifest(args.dataset_folder) is None:
+            loader_kwargs = dict(defaults, **loader_kwargs)
+        append_experiments(args.data_folder, args.dataset_folder, test_fraction=args.test_fraction, seed=args.seed,
+                           content_fingerprint=args.content_fingerprint, dry_run=args.dry_run,
+                           relocate=args.relocate, prefetch_workers=args.prefetch_workers, **loader_kwargs)
+    elif args.command == 'export':
+        export_splits(args.dataset_folder, args.output_folder)
+    else:
+        compact_dataset(args.dataset_folder)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
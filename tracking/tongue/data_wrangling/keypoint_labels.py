@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Coordinate-only jaw keypoint labels, rendered to heatmaps on demand.
+
+A precomputed label tensor holds a full ``uint8`` Gaussian heatmap for every
+frame, even frames without a jaw keypoint. ``KeypointLabels`` keeps the tongue
+masks (bit-packed, 8 pixels per byte), the ``(x, y, visible)`` keypoint of
+every frame and the Gaussian sigma, and renders heatmaps only for the frames a
+batch asks for: about 1/16 of the label memory. Rendering uses
+``make_jaw_mask``, so without jitter the result is identical to the labels
+``load_licking_data`` precomputes. Sigma and position jitter can be added for
+augmentation.
+
+Indexing works like the label array it replaces: ``labels[index]`` with an
+integer, slice or index array returns ``(..., H, W, 2)`` uint8 labels, so
+``ScheduledBatches``, ``label_content`` and ``compute_stats_arrays`` accept it
+unchanged.
+
+Example:
+  images, filenames, labels = load_licking_data(data_folder, keypoint_format='coordinates')
+  batch_labels = labels.render(batch_indices, sigma_jitter=0.2, position_jitter=3, rng=rng)
+  full = labels.to_array()     # same as the default heatmap labels
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+from licking_data_parser import make_jaw_mask
+
+
+class KeypointLabels:
+    """
+    Tongue masks plus jaw keypoint coordinates for a dataset.
+
+    Parameters
+    ----------
+    tongue_masks : np.ndarray
+        (N, H, W) boolean tongue masks at the target resolution; stored bit-packed
+    keypoints : np.ndarray
+        (N, 3) float32 ``(x, y, visible)`` in source pixels: original frame
+        pixels, or crop pixels when the frames were cropped
+    source_resolutions : np.ndarray
+        (N, 2) (height, width) of the frame (or crop) the coordinates refer to
+    target_resolution : Tuple[int, int]
+        Resolution of the masks and rendered heatmaps (width, height)
+    gaussian_sigma : Tuple[float, float]
+        Heatmap Gaussian sigma (y_sigma, x_sigma) in source pixels
+    """
+
+    def __init__(self,
+                 tongue_masks: np.ndarray,
+                 keypoints: np.ndarray,
+                 source_resolutions: np.ndarray,
+                 target_resolution: Tuple[int, int],
+                 gaussian_sigma: Tuple[float, float]):
+        if not len(tongue_masks) == len(keypoints) == len(source_resolutions):
+            raise ValueError('tongue_masks, keypoints and source_resolutions must have one entry per frame')
+        width, height = target_resolution
+        if tuple(np.shape(tongue_masks)[1:]) != (height, width):
+            raise ValueError(f'Tongue masks of shape {np.shape(tongue_masks)[1:]} do not match '
+                             f'target resolution {target_resolution}')
+        self.tongue_bits = np.packbits(np.asarray(tongue_masks, dtype=bool).reshape(len(tongue_masks), -1), axis=1)
+        self.keypoints = np.asarray(keypoints, dtype=np.float32)
+        self.source_resolutions = np.asarray(source_resolutions, dtype=np.int32)
+        self.target_resolution = tuple(target_resolution)
+        self.gaussian_sigma = tuple(gaussian_sigma)
+
+    def __len__(self) -> int:
+        return len(self.keypoints)
+
+    @property
+    def shape(self):
+        return (len(self), self.target_resolution[1], self.target_resolution[0], 2)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def ndim(self) -> int:
+        return 4
+
+    @property
+    def nbytes(self) -> int:
+        return self.tongue_bits.nbytes + self.keypoints.nbytes + self.source_resolutions.nbytes
+
+    def render(self,
+               indices,
+               sigma_jitter: float = 0.0,
+               position_jitter: float = 0.0,
+               rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Labels of the given frames with heatmaps rendered on the fly.
+
+        Parameters
+        ----------
+        indices : array-like of int
+            Frame indices
+        sigma_jitter : float
+            Each sigma is scaled by a factor drawn uniformly from
+            ``[1 - sigma_jitter, 1 + sigma_jitter]``
+        position_jitter : float
+            Standard deviation, in source pixels, of Gaussian noise added to
+            every visible keypoint
+        rng : Optional[np.random.Generator]
+            Random generator for the jitter
+
+        Returns
+        -------
+        np.ndarray
+            (B, H, W, 2) uint8 labels: tongue mask (0/1), jaw heatmap
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        width, height = self.target_resolution
+        labels = np.empty((len(indices), height, width, 2), dtype=np.uint8)
+        labels[..., 0] = np.unpackbits(self.tongue_bits[indices], axis=1, count=width * height).reshape(
+            len(indices), height, width)
+        jitter = sigma_jitter > 0 or position_jitter > 0
+        if jitter and rng is None:
+            rng = np.random.default_rng()
+        for b, i in enumerate(indices):
+            x, y, visible = self.keypoints[i]
+            source_resolution = tuple(int(v) for v in self.source_resolutions[i])
+            if not visible:
+                labels[b, ..., 1] = make_jaw_mask(None, source_resolution, self.target_resolution,
+                                                  self.gaussian_sigma)
+                continue
+            if jitter:
+                coord = np.array([x, y], dtype=np.float64)
+                if position_jitter > 0:
+                    coord += rng.normal(0.0, position_jitter, 2)
+                coord = coord.tolist()
+                scale = rng.uniform(1 - sigma_jitter, 1 + sigma_jitter) if sigma_jitter > 0 else 1.0
+                sigma = tuple(s * scale for s in self.gaussian_sigma)
+            else:
+                # Integer coordinates, exactly as read_jaw_csv passes them
+                coord, sigma = [int(x), int(y)], self.gaussian_sigma
+            labels[b, ..., 1] = make_jaw_mask(coord, source_resolution, self.target_resolution, sigma)
+        return labels
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.render([index])[0]
+        if isinstance(index, slice):
+            index = np.arange(len(self))[index]
+        return self.render(index)
+
+    def to_array(self, chunk_size: int = 1024) -> np.ndarray:
+        """Render all labels; equal to the heatmap labels of ``load_licking_data``."""
+        labels = np.empty(self.shape, dtype=np.uint8)
+        for start in range(0, len(self), chunk_size):
+            labels[start:start + chunk_size] = self.render(np.arange(start, min(start + chunk_size, len(self))))
+        return labels
@@ -1,4 +1,5 @@
 import csv
+import json
 import os
 import sys
 import numpy as np
@@ -9,22 +10,819 @@ from typing import List, Tuple, Union, Optional
 # Add parent directories to path for utils access
 sys.path.append('../..')
 from utils import image_manip
+from prefetch import Prefetcher
+from temporal_windows import TemporalWindows
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.npy')
+# Written into the images folder by ``dataset-utils transcode``
+TRANSCODE_METADATA = 'transcode.json'
+
+
+def index_image_paths(image_paths: List[str]) -> Tuple[dict, dict]:
+    """
+    Map frame numbers to image paths using the image file names.
+    
+    File names are expected to be frame numbers, optionally prefixed with
+    ``scene`` (e.g. ``scene0042.png`` or ``42.jpg``).
+    
+    Parameters
+    ----------
+    image_paths : List[str]
+        Paths of the image files of one experiment
+        
+    Returns
+    -------
+    Tuple containing:
+        - frame_to_path: dict mapping frame number to image path
+        - frame_to_name: dict mapping frame number to image name without extension
+    """
+    if not image_paths:
+        return {}, {}
+    
+    # Extract frame numbers from image names
+    img_names = [os.path.basename(img_path) for img_path in image_paths]
+    
+    # Remove .png suffix if present
+    if img_names[0].endswith('.png'):
+        img_names_no_ext = [img[:-4] for img in img_names]
+    else:
+        img_names_no_ext = [os.path.splitext(img)[0] for img in img_names]
+        
+    # Remove scene prefix if present
+    if img_names_no_ext[0].startswith('scene'):
+        img_nums = [img[5:] for img in img_names_no_ext]
+    else:
+        img_nums = img_names_no_ext
+        
+    # Create mapping from frame number to image path and processed name
+    frame_to_path = {}
+    frame_to_name = {}
+    for path, name, num in zip(image_paths, img_names_no_ext, img_nums):
+        try:
+            frame_num = int(num)
+            frame_to_path[frame_num] = path
+            frame_to_name[frame_num] = name
+        except ValueError:
+            print(f'Warning: Could not convert frame number "{num}" to int for {path}')
+            continue
+    
+    return frame_to_path, frame_to_name
+
+
+def read_jaw_csv(csv_path: str,
+                 csv_delimiter: str = ' ',
+                 csv_has_header: bool = True,
+                 occlusion_markers: Tuple[str, ...] = ('nan', 'NaN', 'NAN', 'None', ''),
+                 verbose: bool = True,
+                 skipped_rows: Optional[List] = None) -> dict:
+    """
+    Read jaw keypoints from a ``frame,x,y`` CSV file.
+    
+    The delimiter is detected from the first data line and falls back to
+    ``csv_delimiter``.
+    
+    Parameters
+    ----------
+    csv_path : str
+        Path to the jaw CSV file
+    csv_delimiter : str
+        Delimiter to use when none can be detected
+    csv_has_header : bool
+        Whether the CSV file has a header row
+    occlusion_markers : Tuple[str, ...]
+        Values that indicate the keypoint is occluded/missing
+    verbose : bool
+        If True, print rows that are skipped
+    skipped_rows : Optional[List]
+        If given, rows that could not be parsed are appended to this list
+        
+    Returns
+    -------
+    dict
+        Mapping from frame number to [x, y], or None for occluded frames
+    """
+    jaw_coords = {}
+    
+    def skip(row, message):
+        if verbose:
+            print(message)
+        if skipped_rows is not None:
+            skipped_rows.append(row)
+    
+    with open(csv_path, mode='r') as file:
+        if csv_has_header:
+            next(file, None)
+            
+        # Detect delimiter by checking first data line
+        first_line = file.readline().strip()
+        if ',' in first_line:
+            delimiter = ','
+        elif ' ' in first_line:
+            delimiter = ' '
+        elif '\t' in first_line:
+            delimiter = '\t'
+        else:
+            delimiter = csv_delimiter  # use provided default
+            
+        # Reset file position
+        file.seek(0)
+        if csv_has_header:
+            next(file, None)
+            
+        reader = csv.reader(file, delimiter=delimiter)
+        for row in reader:
+            # Skip empty rows
+            if not row:
+                continue
+                
+            # Handle different numbers of columns - look for at least 3 values
+            if len(row) == 1:
+                # Try to split by other delimiters
+                if ',' in row[0]:
+                    row = row[0].split(',')
+                elif ' ' in row[0]:
+                    row = row[0].split()
+                elif '\t' in row[0]:
+                    row = row[0].split('\t')
+                    
+            # Skip rows with insufficient columns
+            if len(row) < 3:
+                skip(row, f"Skipping row with insufficient columns: {row}")
+                continue
+                
+            # Skip rows with empty values in first 3 columns
+            if not row[0].strip() or not row[1].strip() or not row[2].strip():
+                skip(row, f"Skipping row with empty values: {row}")
+                continue
+                
+            try:
+                frame_num = int(row[0].strip())
+                x_str = row[1].strip()
+                y_str = row[2].strip()
+                
+                # Check for occlusion markers
+                if x_str in occlusion_markers or y_str in occlusion_markers:
+                    jaw_coords[frame_num] = None  # Mark as occluded/missing
+                else:
+                    x = int(float(x_str))
+                    y = int(float(y_str))
+                    jaw_coords[frame_num] = [x, y]
+                    
+            except ValueError as e:
+                skip(row, f"Error converting values in row {row}: {e}")
+                continue
+    
+    return jaw_coords
+
+
+def get_video_info(video_path: str) -> Tuple[int, Tuple[int, int]]:
+    """
+    Read the frame count and resolution of a video without decoding frames.
+    
+    Returns
+    -------
+    Tuple containing:
+        - n_frames: Number of frames reported by the container
+        - resolution: (height, width)
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f'Could not open video: {video_path}')
+        n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        resolution = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+    finally:
+        cap.release()
+    return n_frames, resolution
+
+
+def read_video_frames(video_path: str,
+                      frame_indices: List[int],
+                      max_sequential_gap: int = 30):
+    """
+    Decode selected frames of a video in ascending order.
+    
+    Small gaps between requested frames are crossed with ``grab`` (no color
+    conversion), larger gaps by seeking, so sparse labeled frames do not
+    require decoding the whole video.
+    
+    Parameters
+    ----------
+    video_path : str
+        Path to the video file
+    frame_indices : List[int]
+        0-based indices of the frames to decode
+    max_sequential_gap : int
+        Largest gap crossed by grabbing frames instead of seeking
+        
+    Yields
+    ------
+    (frame_index, image)
+        BGR image as returned by ``cv2.imread``, or None if it could not be decoded
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f'Could not open video: {video_path}')
+    try:
+        position = 0  # index of the next frame the decoder returns
+        for frame_index in sorted(frame_indices):
+            gap = frame_index - position
+            if gap < 0 or gap > max_sequential_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            else:
+                for _ in range(gap):
+                    cap.grab()
+            ok, image = cap.read()
+            position = frame_index + 1
+            yield frame_index, image if ok else None
+    finally:
+        cap.release()
+
+
+def read_frame(image_path: str) -> Optional[np.ndarray]:
+    """
+    Read a frame as ``cv2.imread`` does; ``.npy`` frames (see ``dataset-utils transcode``) are loaded as arrays.
+    """
+    if image_path.lower().endswith('.npy'):
+        try:
+            return np.load(image_path)
+        except (OSError, ValueError):
+            return None
+    return cv2.imread(image_path)
+
+
+class DuplicateDecodes:
+    """
+    Decode each file of a dedup manifest once (see ``dataset-utils dedup``).
+    
+    Files listed as byte-identical copies share one decoded array. Decodes
+    are counted per kind (frame or mask) over the paths announced with
+    ``expect``, and an array is held only until its last expected decode.
+    Files outside the manifest, or not announced, are decoded as usual.
+    
+    Parameters
+    ----------
+    manifest_path : str
+        JSON manifest written by ``dataset-utils dedup --manifest``
+    """
+
+    def __init__(self, manifest_path: str):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        self.canonical = {}
+        for group in manifest['groups']:
+            paths = [os.path.normcase(os.path.join(manifest['root'], path)) for path in group['paths']]
+            for path in paths:
+                self.canonical[path] = paths[0]
+        self.remaining = {}  # (canonical path, kind) -> expected decodes still to come
+        self.arrays = {}
+        self.hits = 0
+
+    def _canonical(self, path: Optional[str]) -> Optional[str]:
+        return None if path is None else self.canonical.get(os.path.normcase(os.path.abspath(path)))
+
+    def expect(self, paths, kind: str = 'image') -> None:
+        """Announce that each of ``paths`` will be decoded once as ``kind``."""
+        for path in paths:
+            canonical = self._canonical(path)
+            if canonical is not None:
+                key = (canonical, kind)
+                self.remaining[key] = self.remaining.get(key, 0) + 1
+
+    def decode(self, path: Optional[str], read, kind: str = 'image'):
+        """
+        ``read()`` the file at ``path``, or reuse the array of an identical file read before.
+        
+        ``kind`` separates decodes of the same bytes with different flags
+        (frames in colour, masks in grayscale).
+        """
+        canonical = self._canonical(path)
+        if canonical is None:
+            return read()
+        key = (canonical, kind)
+        if key in self.arrays:
+            self.hits += 1
+            array = self.arrays[key]
+        else:
+            array = read()
+        remaining = self.remaining.pop(key, 0) - 1
+        if remaining > 0:
+            self.remaining[key] = remaining
+            self.arrays[key] = array
+        else:
+            self.arrays.pop(key, None)
+        return array
+
+
+def iter_frame_images(frame_to_path: dict,
+                      frames: List[int],
+                      video_path: Optional[str] = None):
+    """
+    Yield ``(frame_num, image)`` for the given frames of an experiment.
+    
+    Images are read from ``frame_to_path``, or decoded from ``video_path``
+    when the experiment is stored as a video. Unreadable frames yield None.
+    """
+    if video_path is not None:
+        yield from read_video_frames(video_path, frames)
+        return
+    for frame_num in frames:
+        yield frame_num, read_frame(frame_to_path[frame_num])
+
+
+def iter_frame_data(experiment: dict,
+                    prefetch: Optional[Prefetcher] = None,
+                    duplicates: Optional[DuplicateDecodes] = None,
+                    tongue_masks: Optional[dict] = None):
+    """
+    Yield ``(frame_num, image, tongue_mask)`` for the frames of a ``scan_experiment`` experiment.
+    
+    Tongue masks are as returned by ``read_tongue_mask`` (original size, None
+    if missing). With a ``Prefetcher``, the bytes of upcoming image and mask
+    files are read ahead on its thread pool and decoded here in frame order.
+    With ``duplicates``, files with an identical copy that was already decoded
+    reuse its array. With ``tongue_masks`` (filled by ``label_extent``), masks
+    are rebuilt from it instead of being decoded again.
+    """
+    frames = experiment['frames']
+    tongue_path = experiment['tongue_path']
+    frame_to_name = experiment['frame_to_name']
+    frame_to_path = experiment['frame_to_path']
+    video_path = experiment['video_path']
+    if tongue_masks is not None:
+        if video_path is not None or (prefetch is None and duplicates is None):
+            images = iter_frame_images(frame_to_path, frames, video_path)
+        elif prefetch is None:
+            images = ((frame_num, duplicates.decode(frame_to_path[frame_num],
+                                                    lambda: read_frame(frame_to_path[frame_num])))
+                      for frame_num in frames)
+        else:
+            image_paths = [frame_to_path[frame_num] for frame_num in frames]
+            images = ((frame_num, prefetch.decode_image(data) if duplicates is None
+                       else duplicates.decode(path, lambda: prefetch.decode_image(data)))
+                      for frame_num, path, data in zip(frames, image_paths, prefetch.read_ahead(image_paths)))
+        for frame_num, image in images:
+            yield frame_num, image, expand_mask(tongue_masks.get(frame_to_name[frame_num] + '.png'))
+        return
+    if duplicates is None and prefetch is None:
+        for frame_num, image in iter_frame_images(frame_to_path, frames, video_path):
+            yield frame_num, image, read_tongue_mask(tongue_path, frame_to_name[frame_num])
+        return
+    if prefetch is None:
+        if video_path is not None:
+            images = iter_frame_images(frame_to_path, frames, video_path)
+        else:
+            images = ((frame_num, duplicates.decode(frame_to_path[frame_num],
+                                                    lambda: read_frame(frame_to_path[frame_num])))
+                      for frame_num in frames)
+        for frame_num, image in images:
+            name = frame_to_name[frame_num]
+            yield frame_num, image, duplicates.decode(os.path.join(tongue_path, name + '.png'),
+                                                      lambda: read_tongue_mask(tongue_path, name), 'mask')
+        return
+
+    def decode(path, data, kind='image'):
+        flags = cv2.IMREAD_GRAYSCALE if kind == 'mask' else cv2.IMREAD_COLOR
+        if duplicates is None:
+            return prefetch.decode_image(data, flags)
+        return duplicates.decode(path, lambda: prefetch.decode_image(data, flags), kind)
+
+    # One listing instead of an existence check per mask
+    mask_files = set(os.listdir(tongue_path))
+    mask_paths = [os.path.join(tongue_path, frame_to_name[frame_num] + '.png')
+                  if frame_to_name[frame_num] + '.png' in mask_files else None
+                  for frame_num in frames]
+    if video_path is not None:
+        # Video frames are decoded sequentially; only the masks are read ahead
+        masks = prefetch.read_ahead(mask_paths)
+        for (frame_num, image), mask_path, mask_bytes in zip(read_video_frames(video_path, frames), mask_paths, masks):
+            yield frame_num, image, decode(mask_path, mask_bytes, 'mask')
+        return
+    items = [(frame_to_path[frame_num], mask_path) for frame_num, mask_path in zip(frames, mask_paths)]
+    for frame_num, (image_path, mask_path), (image_bytes, mask_bytes) in zip(frames, items, prefetch.read_ahead(items)):
+        yield frame_num, decode(image_path, image_bytes), decode(mask_path, mask_bytes, 'mask')
+
+
+def read_original_resolution(images_folder: str) -> Optional[Tuple[int, int]]:
+    """
+    (height, width) of the frames before ``dataset-utils transcode`` resized them, or None.
+    
+    Labels of transcoded frames stay in original pixels.
+    """
+    metadata_path = os.path.join(images_folder, TRANSCODE_METADATA)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as file:
+        return tuple(json.load(file)['original_resolution'])
+
+
+def scan_experiment(experiment_path: str,
+                    csv_delimiter: str = ' ',
+                    csv_has_header: bool = True,
+                    image_extensions: Tuple[str, ...] = IMAGE_EXTENSIONS,
+                    images_dir_name: str = 'images',
+                    labels_dir_name: str = 'labels',
+                    tongue_folder_name: str = 'tongue',
+                    jaw_folder_name: str = 'jaw',
+                    occlusion_markers: Tuple[str, ...] = ('nan', 'NaN', 'NAN', 'None', ''),
+                    load_all_images: bool = True,
+                    video_extensions: Tuple[str, ...] = ('.mp4', '.avi', '.mov', '.mkv')) -> Optional[dict]:
+    """
+    Resolve the frames and jaw labels of one experiment folder without loading images.
+    
+    Parameters match ``load_licking_data``. Reasons for skipping the folder
+    are printed.
+    
+    Returns
+    -------
+    dict or None
+        None if the folder is skipped, otherwise a dict with keys:
+        'folder', 'frame_to_path', 'frame_to_name', 'jaw_coords',
+        'tongue_path', 'video_path', 'original_resolution' (height, width)
+        and 'frames' (sorted frame numbers to load)
+    """
+    experiment_folder = os.path.basename(os.path.normpath(experiment_path))
+    
+    # Check if required label folders exist
+    labels_path = os.path.join(experiment_path, labels_dir_name)
+    if not os.path.exists(labels_path):
+        print(f'Skipping {experiment_folder}: No {labels_dir_name} folder found')
+        return None
+
+    label_folders = os.listdir(labels_path)
+    # Filter out 'tip' folders if they exist
+    label_folders = [folder for folder in label_folders if folder != 'tip']
+
+    tongue_path = os.path.join(labels_path, tongue_folder_name)
+    jaw_path = os.path.join(labels_path, jaw_folder_name)
+
+    if not os.path.exists(tongue_path) or not os.path.exists(jaw_path):
+        print(f'Skipping {experiment_folder}: Missing tongue or jaw folder')
+        print(f'Found label folders: {label_folders}')
+        return None
+
+    # Process images, or a video file when there is no image folder
+    img_folder = os.path.join(experiment_path, images_dir_name)
+    image_paths = []
+    if os.path.exists(img_folder):
+        image_paths = [os.path.join(img_folder, img) for img in os.listdir(img_folder)
+                      if any(img.lower().endswith(ext) for ext in image_extensions)]
+    video_path = None
+    if not image_paths:
+        video_files = sorted(f for f in os.listdir(experiment_path)
+                             if f.lower().endswith(video_extensions))
+        if video_files:
+            video_path = os.path.join(experiment_path, video_files[0])
+        elif not os.path.exists(img_folder):
+            print(f'Skipping {experiment_folder}: No {images_dir_name} folder found')
+            return None
+        else:
+            print(f'Skipping {experiment_folder}: No images found')
+            return None
+
+    if video_path is None:
+        print(f'Found {len(image_paths)} images')
+        frame_to_path, frame_to_name = index_image_paths(image_paths)
+    else:
+        n_video_frames, video_resolution = get_video_info(video_path)
+        print(f'Found video {os.path.basename(video_path)} with {n_video_frames} frames')
+        # Frame numbers are frame indices; tongue masks are matched by frame number
+        frame_to_path = {frame_num: os.path.join(video_path, str(frame_num))
+                         for frame_num in range(n_video_frames)}
+        tongue_masks = [os.path.join(tongue_path, f) for f in os.listdir(tongue_path)
+                        if f.lower().endswith('.png')]
+        frame_to_name = {frame_num: str(frame_num) for frame_num in frame_to_path}
+        frame_to_name.update(index_image_paths(tongue_masks)[1])
+
+    # Load jaw coordinates from CSV
+    jaw_csv_files = [f for f in os.listdir(jaw_path) if f.endswith('.csv')]
+    if not jaw_csv_files:
+        print(f'Skipping {experiment_folder}: No CSV file found in jaw folder')
+        return None
+
+    jaw_csv_file = jaw_csv_files[0]
+    jaw_coords = read_jaw_csv(os.path.join(jaw_path, jaw_csv_file),
+                              csv_delimiter=csv_delimiter,
+                              csv_has_header=csv_has_header,
+                              occlusion_markers=occlusion_markers)
+
+    # Get first valid image to determine actual resolution
+    if not frame_to_path:
+        print(f'Skipping {experiment_folder}: No valid frame numbers found')
+        return None
+
+    if video_path is None:
+        first_frame = next(iter(frame_to_path.keys()))
+        first_img = read_frame(frame_to_path[first_frame])
+        if first_img is None:
+            print(f'Skipping {experiment_folder}: Could not read first image')
+            return None
+        actual_original_resolution = (read_original_resolution(img_folder)
+                                      or (first_img.shape[0], first_img.shape[1]))
+    else:
+        actual_original_resolution = video_resolution
+
+    print(f'Original resolution: {actual_original_resolution}')
+
+    # Determine which frames to process
+    all_frames = sorted(frame_to_path.keys())
+    if load_all_images:
+        valid_frames = all_frames
+    else:
+        # Only process frames that have jaw coordinates
+        valid_frames = [frame for frame in all_frames if frame in jaw_coords]
+
+    if not valid_frames:
+        print(f'Skipping {experiment_folder}: No valid frames found')
+        return None
+
+    return {
+        'folder': experiment_folder,
+        'frame_to_path': frame_to_path,
+        'frame_to_name': frame_to_name,
+        'jaw_coords': jaw_coords,
+        'tongue_path': tongue_path,
+        'video_path': video_path,
+        'original_resolution': actual_original_resolution,
+        'frames': valid_frames,
+    }
+
+
+def read_tongue_mask(tongue_path: str, img_name: str) -> Optional[np.ndarray]:
+    """
+    Read the tongue mask ``<img_name>.png`` at its original size; None if it is missing or unreadable.
+    """
+    tongue_label_path = os.path.join(tongue_path, img_name + '.png')
+    if not os.path.exists(tongue_label_path):
+        return None
+    return cv2.imread(tongue_label_path, cv2.IMREAD_GRAYSCALE)
+
+
+def resize_tongue_mask(mask: Optional[np.ndarray],
+                       target_resolution: Tuple[int, int]) -> np.ndarray:
+    """
+    Resize a mask from ``read_tongue_mask`` to a boolean mask; empty if ``mask`` is None.
+    """
+    if mask is None:
+        # Create empty mask for missing tongue labels
+        return np.zeros(target_resolution[::-1], dtype=bool)
+    return cv2.resize(mask, target_resolution) > 0
+
+
+def load_tongue_mask(tongue_path: str,
+                     img_name: str,
+                     target_resolution: Tuple[int, int]) -> np.ndarray:
+    """
+    Load and resize the tongue mask ``<img_name>.png``; empty if it is missing.
+    """
+    return resize_tongue_mask(read_tongue_mask(tongue_path, img_name), target_resolution)
+
+
+def make_jaw_mask(jaw_coord: Optional[List[int]],
+                  original_resolution: Tuple[int, int],
+                  target_resolution: Tuple[int, int],
+                  gaussian_sigma: Tuple[int, int]) -> np.ndarray:
+    """
+    Render a jaw keypoint as a ``uint8`` Gaussian heatmap; empty if the keypoint is missing.
+    """
+    if jaw_coord is None:
+        # Create empty mask for missing jaw coordinates
+        return np.zeros(target_resolution[::-1], dtype=np.uint8)
+    jaw_mask = image_manip.create_gaussian_mask(
+        original_resolution, target_resolution, jaw_coord, gaussian_sigma)
+    # Convert to uint8
+    return (jaw_mask * 255).astype(np.uint8)
+
+
+def plan_pyramid(resolutions: List[Tuple[int, int]],
+                 original_resolution: Tuple[int, int]) -> List[Tuple[Tuple[int, int], Optional[Tuple[int, int]]]]:
+    """
+    Order target resolutions largest first and choose the source of each level.
+
+    A level is resized from an earlier (larger) level when that level is an
+    exact integer multiple in both dimensions and was itself downscaled from
+    the original, since area averaging then composes (up to uint8 rounding).
+    Otherwise it is resized from the original image.
+
+    Parameters
+    ----------
+    resolutions : List[Tuple[int, int]]
+        Target resolutions (width, height)
+    original_resolution : Tuple[int, int]
+        Original image resolution (height, width)
+
+    Returns
+    -------
+    List of (resolution, source resolution or None for the original image)
+    """
+    original_height, original_width = original_resolution
+    plan = []
+    for width, height in sorted(set(resolutions), key=lambda r: (r[0] * r[1], r), reverse=True):
+        source = None
+        for level, _ in plan:
+            level_width, level_height = level
+            downscaled = level_width <= original_width and level_height <= original_height
+            if (downscaled and level_width > width and level_height > height and
+                    level_width % width == 0 and level_height % height == 0):
+                source = level  # keep the smallest valid level
+        plan.append(((width, height), source))
+    return plan
+
+
+def resize_pyramid(image: np.ndarray, plan) -> dict:
+    """Resize an image to every level of a ``plan_pyramid`` plan; returns resolution -> image."""
+    levels = {}
+    for resolution, source in plan:
+        levels[resolution] = cv2.resize(image if source is None else levels[source], resolution,
+                                        interpolation=cv2.INTER_AREA)
+    return levels
+
+
+def expand_mask(sparse: Optional[tuple]) -> Optional[np.ndarray]:
+    """Full-size mask from a ``label_extent`` cache entry: (shape, x, y, non-zero bounding box pixels), or None."""
+    if sparse is None:
+        return None
+    shape, x, y, pixels = sparse
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[y:y + pixels.shape[0], x:x + pixels.shape[1]] = pixels
+    return mask
+
+
+def label_extent(experiment: dict, tongue_masks: Optional[dict] = None) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box of all labels of a ``scan_experiment`` experiment in original pixels.
+
+    The box is the union of the non-zero pixels of every tongue mask in the
+    tongue folder and every visible jaw coordinate.
+
+    Parameters
+    ----------
+    experiment : dict
+        Experiment from ``scan_experiment``
+    tongue_masks : Optional[dict]
+        If given, filled with mask filename -> (shape, x, y, pixels of the
+        non-zero bounding box) of every decoded mask, so ``iter_frame_data``
+        can rebuild the masks without decoding them again
+
+    Returns
+    -------
+    (x0, y0, x1, y1) with exclusive x1, y1, or None if the experiment has no labels
+    """
+    original_height, original_width = experiment['original_resolution']
+    xs, ys = [], []
+    for x, y in (coord for coord in experiment['jaw_coords'].values() if coord is not None):
+        xs += [x, x + 1]
+        ys += [y, y + 1]
+
+    tongue_path = experiment['tongue_path']
+    for filename in os.listdir(tongue_path):
+        if not filename.lower().endswith('.png'):
+            continue
+        mask = cv2.imread(os.path.join(tongue_path, filename), cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            continue
+        x, y, w, h = cv2.boundingRect(mask)
+        if tongue_masks is not None:
+            tongue_masks[filename] = (mask.shape, x, y, mask[y:y + h, x:x + w].copy())
+        if w == 0 or h == 0:
+            continue
+        # Masks saved at another size than the frames are scaled to frame pixels
+        scale_x = original_width / mask.shape[1]
+        scale_y = original_height / mask.shape[0]
+        xs += [int(x * scale_x), int(np.ceil((x + w) * scale_x))]
+        ys += [int(y * scale_y), int(np.ceil((y + h) * scale_y))]
+
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def crop_box(extent: Tuple[int, int, int, int],
+             original_resolution: Tuple[int, int],
+             margin: int = 0,
+             aspect: Optional[float] = None) -> Tuple[int, int, int, int]:
+    """
+    Grow a label extent by a margin (and to an aspect ratio) within the frame.
+
+    Parameters
+    ----------
+    extent : Tuple[int, int, int, int]
+        (x0, y0, x1, y1) from ``label_extent``
+    original_resolution : Tuple[int, int]
+        Frame resolution (height, width)
+    margin : int
+        Pixels added on every side
+    aspect : Optional[float]
+        Width / height of the box, e.g. that of the target resolution so
+        cropped frames are not distorted by resizing. The box is widened or
+        heightened around its center, then shifted to fit the frame; it is
+        clipped (changing the aspect) only if it is larger than the frame
+
+    Returns
+    -------
+    (x0, y0, x1, y1) with exclusive x1, y1
+    """
+    height, width = original_resolution
+    x0, y0, x1, y1 = extent
+    x0, y0, x1, y1 = x0 - margin, y0 - margin, x1 + margin, y1 + margin
+    if aspect is not None:
+        box_width, box_height = x1 - x0, y1 - y0
+        if box_width < box_height * aspect:
+            grow = int(round(box_height * aspect)) - box_width
+            x0, x1 = x0 - grow // 2, x1 + grow - grow // 2
+        else:
+            grow = int(round(box_width / aspect)) - box_height
+            y0, y1 = y0 - grow // 2, y1 + grow - grow // 2
+
+    def fit(start, stop, size):
+        length = min(stop - start, size)
+        start = min(max(start, 0), size - length)
+        return start, start + length
+
+    x0, x1 = fit(x0, x1, width)
+    y0, y1 = fit(y0, y1, height)
+    return x0, y0, x1, y1
+
+
+def crop_frame(image: np.ndarray,
+               box: Optional[Tuple[int, int, int, int]],
+               original_resolution: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Crop an image to a box in original pixels (no-op if ``box`` is None).
+
+    Images of another size than ``original_resolution`` (height, width), such
+    as tongue masks saved at a lower resolution, are cropped to the scaled box.
+    """
+    if box is None:
+        return image
+    x0, y0, x1, y1 = box
+    if original_resolution is not None and image.shape[:2] != tuple(original_resolution):
+        scale_y = image.shape[0] / original_resolution[0]
+        scale_x = image.shape[1] / original_resolution[1]
+        x0, x1 = int(round(x0 * scale_x)), int(round(x1 * scale_x))
+        y0, y1 = int(round(y0 * scale_y)), int(round(y1 * scale_y))
+    return image[y0:y1, x0:x1]
+
+
+def crop_to_original(coords: np.ndarray,
+                     box,
+                     target_resolution: Tuple[int, int]) -> np.ndarray:
+    """
+    Map (x, y) coordinates in a cropped, resized frame back to original pixels.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (..., 2) coordinates in target pixels
+    box : array-like
+        (x0, y0, x1, y1) crop box, or (..., 4) boxes broadcastable against ``coords``
+    target_resolution : Tuple[int, int]
+        Resolution the crop was resized to (width, height)
+
+    Returns
+    -------
+    np.ndarray
+        (..., 2) coordinates in original pixels
+    """
+    box = np.asarray(box, dtype=np.float64)
+    origin = box[..., :2]
+    scale = (box[..., 2:] - origin) / np.asarray(target_resolution, dtype=np.float64)
+    return origin + np.asarray(coords, dtype=np.float64) * scale
+
+
+def original_to_crop(coords: np.ndarray,
+                     box,
+                     target_resolution: Tuple[int, int]) -> np.ndarray:
+    """Inverse of ``crop_to_original``: original pixels to cropped, resized frame pixels."""
+    box = np.asarray(box, dtype=np.float64)
+    origin = box[..., :2]
+    scale = np.asarray(target_resolution, dtype=np.float64) / (box[..., 2:] - origin)
+    return (np.asarray(coords, dtype=np.float64) - origin) * scale
 
 
 def load_licking_data(data_folder: str,
-                      target_resolution: Tuple[int, int] = (256, 256),
+                      target_resolution: Union[Tuple[int, int], List[Tuple[int, int]]] = (256, 256),
                       csv_delimiter: str = ' ',
                       csv_has_header: bool = True,
                       original_resolution: Tuple[int, int] = (480, 640),
                       gaussian_sigma: Tuple[int, int] = (25, 25),
-                      image_extensions: Tuple[str, ...] = ('.png', '.jpg', '.jpeg'),
+                      image_extensions: Tuple[str, ...] = IMAGE_EXTENSIONS,
                       images_dir_name: str = 'images',
                       labels_dir_name: str = 'labels',
                       tongue_folder_name: str = 'tongue',
                       jaw_folder_name: str = 'jaw',
                       occlusion_markers: Tuple[str, ...] = ('nan', 'NaN', 'NAN', 'None', ''),
                       return_numpy: bool = True,
-                      load_all_images: bool = True) -> Tuple[Union[List, np.ndarray], List[str], Union[List, np.ndarray]]:
+                      load_all_images: bool = True,
+                      video_extensions: Tuple[str, ...] = ('.mp4', '.avi', '.mov', '.mkv'),
+                      experiment_folders: Optional[List[str]] = None,
+                      temporal_window: Optional[int] = None,
+                      window_padding: str = 'edge',
+                      crop_margin: Optional[int] = None,
+                      prefetch_workers: int = 0,
+                      prefetch_bytes: int = 256 * 2 ** 20,
+                      keypoint_format: str = 'heatmap',
+                      dedup_manifest: Optional[str] = None) -> Tuple[Union[List, np.ndarray], List[str], Union[List, np.ndarray]]:
     """
     Load licking dataset with tongue masks and jaw keypoints from CSV files.
     
@@ -32,8 +830,11 @@ def load_licking_data(data_folder: str,
     ----------
     data_folder : str
         Path to the root folder containing experiment subfolders
-    target_resolution : Tuple[int, int]
-        Target resolution to resize images to (width, height)
+    target_resolution : Tuple[int, int] or List[Tuple[int, int]]
+        Target resolution to resize images to (width, height). A list of
+        resolutions decodes every image and mask once and returns one aligned
+        dataset per resolution; smaller levels are resized from larger ones
+        when the sizes divide exactly (see ``plan_pyramid``)
     csv_delimiter : str
         Delimiter character used in CSV files
     csv_has_header : bool
@@ -58,266 +859,317 @@ def load_licking_data(data_folder: str,
         If True, returns numpy arrays instead of lists
     load_all_images : bool
         If True, loads all images and pads missing labels with NaN/zeros
+    video_extensions : Tuple[str, ...]
+        Extensions of video files used when an experiment folder has no
+        images. Jaw CSV frame numbers are 0-based frame indices into the video
+        and tongue masks are matched by frame number.
+    experiment_folders : Optional[List[str]]
+        Names of the experiment subfolders to load, in this order. If None,
+        all subfolders of ``data_folder`` are loaded.
+    temporal_window : Optional[int]
+        If set (requires ``return_numpy``), images are returned as a
+        ``TemporalWindows`` of this many consecutive frames centered on every
+        frame: ``(N, T, H, W, C)`` windows that are views of one frame array.
+        Frames are in frame order within each experiment and windows never
+        cross experiments. With ``load_all_images=False`` the frames of a
+        window are neighbouring labeled frames, which need not be consecutive
+    window_padding : str
+        Frames beyond the ends of an experiment in a window: 'edge', 'zero'
+        or 'reflect' (see ``TemporalWindows``)
+    crop_margin : Optional[int]
+        If set, every experiment is cropped to the union of its tongue mask
+        extents and jaw coordinates (``label_extent``) grown by this many
+        original pixels and to the aspect ratio of the (first) target
+        resolution (``crop_box``). Frames and tongue masks are cropped before
+        resizing and jaw heatmaps are rendered in the crop. Experiments
+        without labels are not cropped
+    prefetch_workers : int
+        Threads reading the bytes of upcoming image and mask files ahead of
+        decoding (see ``Prefetcher``), for storage with high per-file latency
+        such as ``/mnt/c`` under WSL or network file systems. 0 reads each
+        file when it is decoded
+    prefetch_bytes : int
+        Cap on the file bytes read ahead
+    keypoint_format : str
+        'heatmap' stores a Gaussian jaw heatmap per frame in the labels.
+        'coordinates' (requires ``return_numpy``) returns the labels as a
+        ``KeypointLabels`` that stores the tongue masks and the jaw
+        ``(x, y, visible)`` of every frame, and renders identical heatmaps
+        when indexed
+    dedup_manifest : Optional[str]
+        Manifest of byte-identical files (``dataset-utils dedup --manifest``);
+        each group of identical frames or masks is decoded only once (see
+        ``DuplicateDecodes``)
         
     Returns
     -------
     Tuple containing:
         - training_images: List or numpy array of resized images
-        - training_image_filenames: List of image file paths
+        - training_image_filenames: List of image file paths. Frames read from
+          a video are named ``<video path>/<frame number>``
         - training_labels: List or numpy array of labels [tongue_masks, jaw_masks]
+          (one label per frame, i.e. for the center frame of every temporal window)
+    When ``target_resolution`` is a list, images and labels are dicts mapping
+    each resolution to the above; filenames are shared by all resolutions.
+    With ``crop_margin``, a fourth item maps every experiment folder to its
+    crop box (x0, y0, x1, y1) in original pixels; ``crop_to_original`` maps
+    predicted coordinates back.
     """
+    if temporal_window is not None and not return_numpy:
+        raise ValueError('temporal_window requires return_numpy=True')
+    if keypoint_format not in ('heatmap', 'coordinates'):
+        raise ValueError(f"keypoint_format must be 'heatmap' or 'coordinates', got {keypoint_format!r}")
+    if keypoint_format == 'coordinates' and not return_numpy:
+        raise ValueError("keypoint_format='coordinates' requires return_numpy=True")
+    store_heatmaps = keypoint_format == 'heatmap'
+    multi_resolution = isinstance(target_resolution, list)
+    resolutions = [tuple(r) for r in target_resolution] if multi_resolution else [tuple(target_resolution)]
     
-    experiment_folders = [filename for filename in os.listdir(data_folder) 
-                         if os.path.isdir(os.path.join(data_folder, filename))]
+    if experiment_folders is None:
+        experiment_folders = [filename for filename in os.listdir(data_folder) 
+                             if os.path.isdir(os.path.join(data_folder, filename))]
+    
+    prefetch = Prefetcher(prefetch_workers, prefetch_bytes) if prefetch_workers > 0 else None
+    
+    def scan(experiment_folder):
+        return scan_experiment(os.path.join(data_folder, experiment_folder),
+                               csv_delimiter=csv_delimiter,
+                               csv_has_header=csv_has_header,
+                               image_extensions=image_extensions,
+                               images_dir_name=images_dir_name,
+                               labels_dir_name=labels_dir_name,
+                               tongue_folder_name=tongue_folder_name,
+                               jaw_folder_name=jaw_folder_name,
+                               occlusion_markers=occlusion_markers,
+                               load_all_images=load_all_images,
+                               video_extensions=video_extensions)
+    
+    duplicates = None
+    scanned = {}
+    if dedup_manifest is not None:
+        # Count the decodes of every file that will be loaded before the first one, so a
+        # shared array is kept exactly until its last copy in any experiment has been read
+        duplicates = DuplicateDecodes(dedup_manifest)
+        for experiment_folder in experiment_folders:
+            experiment = scanned[experiment_folder] = scan(experiment_folder)
+            if experiment is None:
+                continue
+            frames = experiment['frames']
+            if experiment['video_path'] is None:
+                duplicates.expect((experiment['frame_to_path'][frame_num] for frame_num in frames), 'image')
+            if crop_margin is None:
+                # With crop_margin the masks come from ``label_extent`` instead
+                tongue_path, frame_to_name = experiment['tongue_path'], experiment['frame_to_name']
+                duplicates.expect((os.path.join(tongue_path, frame_to_name[frame_num] + '.png') for frame_num in frames),
+                                  'mask')
     
     # Progress bar setup
     iterable = enumerate(experiment_folders)
     progress = tqdm(iterable, desc='Loading', total=len(experiment_folders), 
                    ascii=True, leave=True, position=0)
     
-    training_images = []
+    training_images = {r: [] for r in resolutions}
     training_image_filenames = []
-    training_labels = [[], []]  # [tongue_masks, jaw_masks]
+    training_labels = {r: [[], []] for r in resolutions}  # [tongue_masks, jaw_masks]
+    experiment_sizes = []  # frames loaded per experiment, in loading order
+    keypoints = []  # (x, y, visible) and source (height, width) per frame, for keypoint_format='coordinates'
+    crop_boxes = {}
     
     n_features = 2  # tongue and jaw
     
     for i, experiment_folder in progress:
-        experiment_path = os.path.join(data_folder, experiment_folder)
-        
         print(f'Loading experiment folder: {experiment_folder}')
         
-        # Check if required label folders exist
-        labels_path = os.path.join(experiment_path, labels_dir_name)
-        if not os.path.exists(labels_path):
-            print(f'Skipping {experiment_folder}: No {labels_dir_name} folder found')
+        experiment = scanned.pop(experiment_folder) if experiment_folder in scanned else scan(experiment_folder)
+        if experiment is None:
             continue
-            
-        label_folders = os.listdir(labels_path)
-        # Filter out 'tip' folders if they exist
-        label_folders = [folder for folder in label_folders if folder != 'tip']
-        
-        tongue_path = os.path.join(labels_path, tongue_folder_name)
-        jaw_path = os.path.join(labels_path, jaw_folder_name)
         
-        if not os.path.exists(tongue_path) or not os.path.exists(jaw_path):
-            print(f'Skipping {experiment_folder}: Missing tongue or jaw folder')
-            print(f'Found label folders: {label_folders}')
-            continue
-        
-        # Process images
-        img_folder = os.path.join(experiment_path, images_dir_name)
-        if not os.path.exists(img_folder):
-            print(f'Skipping {experiment_folder}: No {images_dir_name} folder found')
-            continue
-            
-        image_paths = [os.path.join(img_folder, img) for img in os.listdir(img_folder)
-                      if any(img.lower().endswith(ext) for ext in image_extensions)]
-        
-        if not image_paths:
-            print(f'Skipping {experiment_folder}: No images found')
-            continue
-            
-        print(f'Found {len(image_paths)} images')
-        
-        # Extract frame numbers from image names
-        img_names = [os.path.basename(img_path) for img_path in image_paths]
-        
-        # Remove .png suffix if present
-        if img_names[0].endswith('.png'):
-            img_names_no_ext = [img[:-4] for img in img_names]
-        else:
-            img_names_no_ext = [os.path.splitext(img)[0] for img in img_names]
-            
-        # Remove scene prefix if present
-        if img_names_no_ext[0].startswith('scene'):
-            img_nums = [img[5:] for img in img_names_no_ext]
-        else:
-            img_nums = img_names_no_ext
-            
-        # Create mapping from frame number to image path and processed name
-        frame_to_path = {}
-        frame_to_name = {}
-        for path, name, num in zip(image_paths, img_names_no_ext, img_nums):
-            try:
-                frame_num = int(num)
-                frame_to_path[frame_num] = path
-                frame_to_name[frame_num] = name
-            except ValueError:
-                print(f'Warning: Could not convert frame number "{num}" to int for {path}')
-                continue
-        
-        # Load jaw coordinates from CSV
-        jaw_csv_files = [f for f in os.listdir(jaw_path) if f.endswith('.csv')]
-        if not jaw_csv_files:
-            print(f'Skipping {experiment_folder}: No CSV file found in jaw folder')
-            continue
-            
-        jaw_csv_file = jaw_csv_files[0]
-        jaw_coords = {}
-        
-        with open(os.path.join(jaw_path, jaw_csv_file), mode='r') as file:
-            if csv_has_header:
-                next(file)
-                
-            # Try different delimiters to handle various CSV formats
-            content = file.read()
-            file.seek(0)
-            if csv_has_header:
-                next(file)
-                
-            # Detect delimiter by checking first data line
-            first_line = file.readline().strip()
-            if ',' in first_line:
-                delimiter = ','
-            elif ' ' in first_line:
-                delimiter = ' '
-            elif '\t' in first_line:
-                delimiter = '\t'
+        frame_to_path = experiment['frame_to_path']
+        jaw_coords = experiment['jaw_coords']
+        valid_frames = experiment['frames']
+        original_resolution = experiment['original_resolution']
+        box = None
+        tongue_masks = None
+        if crop_margin is not None:
+            # The masks decoded for the extent are kept (cropped to their content) for the frame loop
+            tongue_masks = {}
+            extent = label_extent(experiment, tongue_masks)
+            if extent is None:
+                print(f'No labels in {experiment_folder}, not cropping')
             else:
-                delimiter = csv_delimiter  # use provided default
-                
-            # Reset file position
-            file.seek(0)
-            if csv_has_header:
-                next(file)
-                
-            reader = csv.reader(file, delimiter=delimiter)
-            for row in reader:
-                # Skip empty rows
-                if not row:
-                    continue
-                    
-                # Handle different numbers of columns - look for at least 3 values
-                if len(row) == 1:
-                    # Try to split by other delimiters
-                    if ',' in row[0]:
-                        row = row[0].split(',')
-                    elif ' ' in row[0]:
-                        row = row[0].split()
-                    elif '\t' in row[0]:
-                        row = row[0].split('\t')
-                        
-                # Skip rows with insufficient columns
-                if len(row) < 3:
-                    print(f"Skipping row with insufficient columns: {row}")
-                    continue
-                    
-                # Skip rows with empty values in first 3 columns
-                if not row[0].strip() or not row[1].strip() or not row[2].strip():
-                    print(f"Skipping row with empty values: {row}")
-                    continue
-                    
-                try:
-                    frame_num = int(row[0].strip())
-                    x_str = row[1].strip()
-                    y_str = row[2].strip()
-                    
-                    # Check for occlusion markers
-                    if x_str in occlusion_markers or y_str in occlusion_markers:
-                        jaw_coords[frame_num] = None  # Mark as occluded/missing
-                    else:
-                        x = int(float(x_str))
-                        y = int(float(y_str))
-                        jaw_coords[frame_num] = [x, y]
-                        
-                except ValueError as e:
-                    print(f"Error converting values in row {row}: {e}")
-                    continue
-        
-        # Get first valid image to determine actual resolution
-        if not frame_to_path:
-            print(f'Skipping {experiment_folder}: No valid frame numbers found')
-            continue
-            
-        first_frame = next(iter(frame_to_path.keys()))
-        first_img = cv2.imread(frame_to_path[first_frame])
-        if first_img is None:
-            print(f'Skipping {experiment_folder}: Could not read first image')
-            continue
-            
-        actual_original_resolution = (first_img.shape[0], first_img.shape[1])
-        print(f'Original resolution: {actual_original_resolution}')
+                box = crop_box(extent, original_resolution, crop_margin, aspect=resolutions[0][0] / resolutions[0][1])
+                print(f'Crop box (x0, y0, x1, y1): {box}')
+            crop_boxes[experiment_folder] = box or (0, 0, original_resolution[1], original_resolution[0])
+        # Resolution of the (cropped) frames that are resized to the targets
+        source_resolution = original_resolution if box is None else (box[3] - box[1], box[2] - box[0])
+        plan = plan_pyramid(resolutions, source_resolution)
         
-        # Determine which frames to process
-        all_frames = sorted(frame_to_path.keys())
-        if load_all_images:
-            valid_frames = all_frames
-        else:
-            # Only process frames that have jaw coordinates
-            valid_frames = [frame for frame in all_frames if frame in jaw_coords]
-            
-        if not valid_frames:
-            print(f'Skipping {experiment_folder}: No valid frames found')
-            continue
-            
         print(f'Processing {len(valid_frames)} frames')
         
         # Process each frame
-        experiment_images = []
+        experiment_images = {r: [] for r in resolutions}
         experiment_image_filenames = []
-        experiment_labels = [[], []]  # [tongue_masks, jaw_masks]
+        experiment_labels = {r: [[], []] for r in resolutions}  # [tongue_masks, jaw_masks]
+        experiment_keypoints = []
         
-        for frame_num in valid_frames:
+        for frame_num, image, tongue_mask in iter_frame_data(experiment, prefetch, duplicates, tongue_masks):
             image_path = frame_to_path[frame_num]
             
             # Load and resize image
-            image = cv2.imread(image_path)
             if image is None:
                 print(f'Could not read image: {image_path}')
                 continue
                 
             try:
-                image_resized = cv2.resize(image, target_resolution, interpolation=cv2.INTER_AREA)
-                experiment_images.append(image_resized)
-                experiment_image_filenames.append(image_path)
+                image_levels = resize_pyramid(crop_frame(image, box), plan)
             except Exception as e:
                 print(f'Error resizing image {image_path}: {e}')
                 continue
-                
-            # Process tongue mask
-            img_name = frame_to_name[frame_num]
-            tongue_label_path = os.path.join(tongue_path, img_name + '.png')
+            experiment_image_filenames.append(image_path)
             
-            if os.path.exists(tongue_label_path):
-                mask = cv2.imread(tongue_label_path, cv2.IMREAD_GRAYSCALE)
-                if mask is not None:
-                    mask = cv2.resize(mask, target_resolution)
-                    mask = mask > 0
-                    experiment_labels[0].append(mask)
-                else:
-                    # Create empty mask
-                    experiment_labels[0].append(np.zeros(target_resolution, dtype=bool))
-            else:
-                # Create empty mask for missing tongue labels
-                experiment_labels[0].append(np.zeros(target_resolution, dtype=bool))
-                
-            # Process jaw coordinates
-            if frame_num in jaw_coords and jaw_coords[frame_num] is not None:
-                jaw_coord = jaw_coords[frame_num]
-                jaw_mask = image_manip.create_gaussian_mask(
-                    actual_original_resolution, target_resolution, jaw_coord, gaussian_sigma)
-                # Convert to uint8
-                jaw_mask = (jaw_mask * 255).astype(np.uint8)
-                experiment_labels[1].append(jaw_mask)
-            else:
-                # Create empty mask for missing jaw coordinates
-                jaw_mask = np.zeros(target_resolution, dtype=np.uint8)
-                experiment_labels[1].append(jaw_mask)
-                if load_all_images:
-                    print(f'No jaw label for frame {frame_num} in {experiment_folder}, using empty mask')
+            # The tongue mask is decoded once for all resolutions
+            if tongue_mask is not None:
+                tongue_mask = crop_frame(tongue_mask, box, original_resolution)
+            jaw_coord = jaw_coords.get(frame_num)
+            label_coord = jaw_coord
+            if jaw_coord is not None and box is not None:
+                label_coord = [jaw_coord[0] - box[0], jaw_coord[1] - box[1]]
+            for resolution in resolutions:
+                experiment_images[resolution].append(image_levels[resolution])
+                experiment_labels[resolution][0].append(resize_tongue_mask(tongue_mask, resolution))
+                if store_heatmaps:
+                    experiment_labels[resolution][1].append(make_jaw_mask(
+                        label_coord, source_resolution, resolution, gaussian_sigma))
+            if not store_heatmaps:
+                experiment_keypoints.append(([0, 0, 0] if label_coord is None else [*label_coord, 1],
+                                             source_resolution))
+            if jaw_coord is None and load_all_images:
+                print(f'No jaw label for frame {frame_num} in {experiment_folder}, using empty mask')
         
         # Add experiment data to training data
-        training_images.extend(experiment_images)
+        if experiment_image_filenames:
+            experiment_sizes.append(len(experiment_image_filenames))
         training_image_filenames.extend(experiment_image_filenames)
-        for i in range(n_features):
-            training_labels[i].extend(experiment_labels[i])
+        keypoints.extend(experiment_keypoints)
+        for resolution in resolutions:
+            training_images[resolution].extend(experiment_images[resolution])
+            for i in range(n_features):
+                training_labels[resolution][i].extend(experiment_labels[resolution][i])
     
-    print(f'Loaded {len(training_images)} images total')
+    print(f'Loaded {len(training_image_filenames)} images total')
+    if prefetch is not None:
+        prefetch.close()
+        print(prefetch.report())
+    if duplicates is not None:
+        print(f'Reused {duplicates.hits} decodes of duplicate files')
     
     if return_numpy:
         # Convert to numpy arrays
-        images_np = np.stack(training_images) if training_images else np.array([])
-        labels_np = np.moveaxis(np.stack(training_labels), [0], [-1]) if training_labels[0] else np.array([])
-        return images_np, training_image_filenames, labels_np
+        for resolution in resolutions:
+            images = training_images[resolution]
+            labels = training_labels[resolution]
+            if temporal_window is not None and images:
+                training_images[resolution] = TemporalWindows(images, experiment_sizes, temporal_window,
+                                                              window_padding)
+            else:
+                training_images[resolution] = np.stack(images) if images else np.array([])
+            if not store_heatmaps and labels[0]:
+                from keypoint_labels import KeypointLabels
+                training_labels[resolution] = KeypointLabels(
+                    np.stack(labels[0]), [k for k, _ in keypoints], [r for _, r in keypoints],
+                    resolution, gaussian_sigma)
+            else:
+                training_labels[resolution] = np.moveaxis(np.stack(labels), [0], [-1]) if labels[0] else np.array([])
+    if multi_resolution:
+        result = (training_images, training_image_filenames, training_labels)
+    else:
+        result = (training_images[resolutions[0]], training_image_filenames, training_labels[resolutions[0]])
+    if crop_margin is not None:
+        result += (crop_boxes,)
+    return result
+
+
+def main(argv=None):
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description='Load a licking dataset folder and save it as one dataset file')
+    parser.add_argument('data_folder', help='Root folder containing experiment subfolders')
+    parser.add_argument('output', help='Output .pkl of (images, filenames, labels), or any other '
+                                       'extension for a chunked archive')
+    parser.add_argument('--resolution', type=int, nargs=2, action='append', metavar=('WIDTH', 'HEIGHT'),
+                        help='Target resolution (default: 256 256). Repeat to build several resolutions from one '
+                             'decode; each is written to <output>_<width>x<height>')
+    parser.add_argument('--sigma', type=int, nargs=2, default=(25, 25), metavar=('Y', 'X'),
+                        help='Jaw heatmap Gaussian sigma (default: 25 25)')
+    parser.add_argument('--labeled-only', dest='load_all_images', action='store_false',
+                        help='Only load frames that have jaw labels')
+    parser.add_argument('--experiments', nargs='+', default=None, help='Experiment subfolders to include')
+    parser.add_argument('--stats', action='store_true', help='Also compute and save dataset statistics')
+    parser.add_argument('--crop-margin', type=int, default=None, metavar='PIXELS',
+                        help='Crop every experiment to its label extents plus this margin before resizing; '
+                             'the crop boxes are saved to <output>.crops.json')
+    parser.add_argument('--prefetch-workers', type=int, default=0, metavar='THREADS',
+                        help='Read image and mask files ahead on this many threads (for slow or network storage)')
+    parser.add_argument('--dedup-manifest', default=None, metavar='JSON',
+                        help='Decode byte-identical files listed by dataset-utils dedup only once')
+    parser.add_argument('--keypoints', action='store_true',
+                        help='Store jaw keypoints as (x, y, visible) coordinates instead of heatmaps (.pkl only)')
+    args = parser.parse_args(argv)
+    if args.keypoints and not args.output.endswith('.pkl'):
+        parser.error('--keypoints needs a .pkl output')
+
+    resolutions = [tuple(r) for r in args.resolution] if args.resolution else [(256, 256)]
+    loaded = load_licking_data(
+        args.data_folder,
+        target_resolution=resolutions if len(resolutions) > 1 else resolutions[0],
+        gaussian_sigma=tuple(args.sigma),
+        load_all_images=args.load_all_images,
+        experiment_folders=args.experiments,
+        crop_margin=args.crop_margin,
+        prefetch_workers=args.prefetch_workers,
+        dedup_manifest=args.dedup_manifest,
+        keypoint_format='coordinates' if args.keypoints else 'heatmap')
+    images, filenames, labels = loaded[:3]
+    crops = None
+    if args.crop_margin is not None:
+        crops = {'margin': args.crop_margin,
+                 'box_format': 'x0, y0, x1, y1 in original pixels (x1, y1 exclusive)',
+                 'boxes': {experiment: list(box) for experiment, box in loaded[3].items()}}
+    if len(filenames) == 0:
+        print('No frames loaded; nothing written')
+        return 1
+    if len(resolutions) == 1:
+        outputs = {resolutions[0]: (args.output, images, labels)}
     else:
-        return training_images, training_image_filenames, training_labels
\ No newline at end of file
+        stem, ext = os.path.splitext(args.output)
+        outputs = {r: (f'{stem}_{r[0]}x{r[1]}{ext}', images[r], labels[r]) for r in resolutions}
+
+    for resolution, (output, images, labels) in outputs.items():
+        if crops is not None:
+            crops_path = os.path.splitext(output)[0] + '.crops.json'
+            with open(crops_path + '.tmp', 'w') as handle:
+                json.dump(dict(crops, resolution=list(resolution)), handle, indent=1)
+            os.replace(crops_path + '.tmp', crops_path)
+            print(f'Saved crop boxes to {crops_path}')
+        if output.endswith('.pkl'):
+            tmp_path = output + '.tmp'
+            with open(tmp_path, 'wb') as handle:
+                pickle.dump((images, filenames, labels), handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, output)
+        else:
+            from chunked_archive import write_archive
+            write_archive(output, images, labels, filenames=filenames,
+                          metadata=None if crops is None else {'crops': dict(crops, resolution=list(resolution))})
+        print(f'Wrote {len(images)} frames to {output}')
+
+        if args.stats:
+            from dataset_stats import compute_stats_arrays, stats_path
+            stats = compute_stats_arrays(images, labels, filenames)
+            json_path, _ = stats.save(stats_path(output))
+            print(f'Saved statistics to {json_path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
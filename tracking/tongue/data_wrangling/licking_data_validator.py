@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Fast pre-flight validation of a licking dataset folder.
+
+Checks every experiment folder the same way ``load_licking_data`` would, but
+only reads image headers (never decodes pixels) and reads them in parallel.
+The result is a structured report of missing tongue masks, jaw CSV frames
+without an image, resolution mismatches and unreadable files.
+
+Example usage:
+  python licking_data_validator.py /mnt/c/Users/wanglab/Desktop/Mask+Jaw/
+  python licking_data_validator.py /mnt/c/Users/wanglab/Desktop/Mask+Jaw/ --json report.json
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from licking_data_parser import (IMAGE_EXTENSIONS, get_video_info, index_image_paths, read_jaw_csv,
+                                 read_original_resolution)
+
+try:
+    from PIL import Image
+except Exception:  # pragma: no cover - pillow may not be installed in all environments
+    Image = None
+
+
+# Maximum number of example paths/frames kept per issue in the report
+MAX_EXAMPLES = 20
+# Relative aspect ratio difference above which a tongue mask cannot be resized onto its frame
+ASPECT_TOLERANCE = 0.01
+
+
+def _png_size(fh) -> Tuple[int, int]:
+    header = fh.read(24)
+    if len(header) < 24 or header[12:16] != b'IHDR':
+        raise ValueError('Corrupt PNG header')
+    width, height = struct.unpack('>II', header[16:24])
+    return height, width
+
+
+def _jpeg_size(fh) -> Tuple[int, int]:
+    fh.read(2)  # SOI marker
+    while True:
+        byte = fh.read(1)
+        while byte and byte != b'\xff':
+            byte = fh.read(1)
+        while byte == b'\xff':
+            byte = fh.read(1)
+        if not byte:
+            raise ValueError('No SOF marker found in JPEG')
+        marker = byte[0]
+        if marker in (0x01, 0xd8) or 0xd0 <= marker <= 0xd7:
+            continue  # standalone markers without a length field
+        (length,) = struct.unpack('>H', fh.read(2))
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            fh.read(1)  # sample precision
+            height, width = struct.unpack('>HH', fh.read(4))
+            return height, width
+        fh.seek(length - 2, os.SEEK_CUR)
+
+
+def _bmp_size(fh) -> Tuple[int, int]:
+    header = fh.read(26)
+    width, height = struct.unpack('<ii', header[18:26])
+    return abs(height), width
+
+
+def _npy_size(fh) -> Tuple[int, int]:
+    import numpy as np
+    version = np.lib.format.read_magic(fh)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape = read_header(fh)[0]
+    if len(shape) < 2:
+        raise ValueError(f'Array of shape {shape} is not an image')
+    return shape[0], shape[1]
+
+
+def read_image_header(image_path: str) -> Tuple[Tuple[int, int], str]:
+    """
+    Read the resolution and format of an image without decoding it.
+
+    PNG, JPEG, BMP and ``.npy`` (``dataset-utils transcode``) headers are
+    parsed directly. Other formats fall back to Pillow, which also only reads
+    the header.
+
+    Parameters
+    ----------
+    image_path : str
+        Path to the image file
+
+    Returns
+    -------
+    Tuple containing:
+        - resolution: (height, width), matching ``image.shape[:2]`` in OpenCV
+        - format: Image format name (e.g. 'PNG', 'JPEG')
+    """
+    with open(image_path, 'rb') as fh:
+        signature = fh.read(8)
+        fh.seek(0)
+        if signature.startswith(b'\x89PNG\r\n\x1a\n'):
+            return _png_size(fh), 'PNG'
+        if signature.startswith(b'\xff\xd8'):
+            return _jpeg_size(fh), 'JPEG'
+        if signature.startswith(b'BM'):
+            return _bmp_size(fh), 'BMP'
+        if signature.startswith(b'\x93NUMPY'):
+            return _npy_size(fh), 'NPY'
+
+    if Image is None:
+        raise ValueError('Unknown image format (install Pillow to read more formats)')
+    with Image.open(image_path) as im:
+        return (im.height, im.width), im.format
+
+
+def _safe_read_header(image_path: str):
+    try:
+        return read_image_header(image_path)
+    except Exception as e:
+        return e
+
+
+def _safe_read_video_info(video_path: str):
+    try:
+        n_frames, resolution = get_video_info(video_path)
+        return resolution, os.path.splitext(video_path)[1].lstrip('.').upper(), n_frames
+    except Exception as e:
+        return e
+
+
+def _examples(values) -> list:
+    return sorted(values)[:MAX_EXAMPLES]
+
+
+def _list_experiment(experiment_path: str,
+                     image_extensions: Tuple[str, ...],
+                     images_dir_name: str,
+                     labels_dir_name: str,
+                     tongue_folder_name: str,
+                     jaw_folder_name: str,
+                     video_extensions: Tuple[str, ...]) -> Dict:
+    """Collect the file layout of one experiment folder (no image reads)."""
+    layout = {'skip_reason': None}
+
+    labels_path = os.path.join(experiment_path, labels_dir_name)
+    tongue_path = os.path.join(labels_path, tongue_folder_name)
+    jaw_path = os.path.join(labels_path, jaw_folder_name)
+    img_folder = os.path.join(experiment_path, images_dir_name)
+
+    if not os.path.exists(labels_path):
+        layout['skip_reason'] = f'No {labels_dir_name} folder found'
+        return layout
+    if not os.path.exists(tongue_path) or not os.path.exists(jaw_path):
+        layout['skip_reason'] = 'Missing tongue or jaw folder'
+        return layout
+
+    image_paths = []
+    if os.path.exists(img_folder):
+        image_paths = [os.path.join(img_folder, img) for img in os.listdir(img_folder)
+                       if any(img.lower().endswith(ext) for ext in image_extensions)]
+    layout['video_path'] = None
+    if not image_paths:
+        video_files = sorted(f for f in os.listdir(experiment_path) if f.lower().endswith(video_extensions))
+        if video_files:
+            layout['video_path'] = os.path.join(experiment_path, video_files[0])
+        elif not os.path.exists(img_folder):
+            layout['skip_reason'] = f'No {images_dir_name} folder found'
+            return layout
+        else:
+            layout['skip_reason'] = 'No images found'
+            return layout
+
+    jaw_csv_files = [f for f in os.listdir(jaw_path) if f.endswith('.csv')]
+    if not jaw_csv_files:
+        layout['skip_reason'] = 'No CSV file found in jaw folder'
+        return layout
+
+    layout['image_paths'] = image_paths
+    # Jaw coordinates and tongue masks of transcoded, resized frames stay in original pixels
+    layout['original_resolution'] = read_original_resolution(img_folder) if image_paths else None
+    layout['tongue_path'] = tongue_path
+    layout['tongue_files'] = [f for f in os.listdir(tongue_path)
+                              if os.path.isfile(os.path.join(tongue_path, f))]
+    layout['jaw_csv_path'] = os.path.join(jaw_path, jaw_csv_files[0])
+    layout['extra_jaw_csv_files'] = sorted(jaw_csv_files[1:])
+    return layout
+
+
+def validate_licking_data(data_folder: str,
+                          csv_delimiter: str = ' ',
+                          csv_has_header: bool = True,
+                          image_extensions: Tuple[str, ...] = IMAGE_EXTENSIONS,
+                          images_dir_name: str = 'images',
+                          labels_dir_name: str = 'labels',
+                          tongue_folder_name: str = 'tongue',
+                          jaw_folder_name: str = 'jaw',
+                          occlusion_markers: Tuple[str, ...] = ('nan', 'NaN', 'NAN', 'None', ''),
+                          video_extensions: Tuple[str, ...] = ('.mp4', '.avi', '.mov', '.mkv'),
+                          max_workers: Optional[int] = None) -> Dict:
+    """
+    Validate a licking dataset folder before running ``load_licking_data``.
+
+    Only image headers are read, in parallel across all experiments. The
+    folder layout arguments match those of ``load_licking_data``.
+
+    Parameters
+    ----------
+    data_folder : str
+        Path to the root folder containing experiment subfolders
+    csv_delimiter : str
+        Delimiter to use for jaw CSV files when none can be detected
+    csv_has_header : bool
+        Whether CSV files have a header row
+    image_extensions : Tuple[str, ...]
+        Tuple of valid image file extensions
+    images_dir_name : str
+        Name of the directory containing images
+    labels_dir_name : str
+        Name of the directory containing label data
+    tongue_folder_name : str
+        Name of the folder containing tongue mask images
+    jaw_folder_name : str
+        Name of the folder containing jaw CSV files
+    occlusion_markers : Tuple[str, ...]
+        Values in CSV that indicate the keypoint is occluded/missing
+    video_extensions : Tuple[str, ...]
+        Extensions of video files used when an experiment has no images
+    max_workers : Optional[int]
+        Number of threads used to read headers (default: 4 x CPU count, max 64)
+
+    Returns
+    -------
+    dict
+        Report with keys 'data_folder', 'experiments' (list of per-experiment
+        dicts), 'totals' and 'seconds'
+    """
+    if not os.path.isdir(data_folder):
+        raise ValueError(f'Data folder does not exist: {data_folder}')
+
+    start = time.perf_counter()
+    if max_workers is None:
+        max_workers = min(64, 4 * (os.cpu_count() or 1))
+
+    experiment_folders = sorted(filename for filename in os.listdir(data_folder)
+                                if os.path.isdir(os.path.join(data_folder, filename)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Directory listings are cheap but slow on network drives, so list in parallel too
+        layouts = list(executor.map(
+            lambda folder: _list_experiment(os.path.join(data_folder, folder), image_extensions,
+                                            images_dir_name, labels_dir_name,
+                                            tongue_folder_name, jaw_folder_name, video_extensions),
+            experiment_folders))
+
+        header_paths = []
+        for layout in layouts:
+            if layout['skip_reason'] is None:
+                header_paths.extend(layout['image_paths'])
+                header_paths.extend(os.path.join(layout['tongue_path'], f)
+                                    for f in layout['tongue_files'] if f.lower().endswith('.png'))
+        headers = dict(zip(header_paths, executor.map(_safe_read_header, header_paths)))
+
+        video_paths = [layout['video_path'] for layout in layouts
+                       if layout['skip_reason'] is None and layout['video_path'] is not None]
+        headers.update(zip(video_paths, executor.map(_safe_read_video_info, video_paths)))
+
+    experiments = []
+    for folder, layout in zip(experiment_folders, layouts):
+        experiments.append(_validate_experiment(folder, layout, headers, csv_delimiter,
+                                                csv_has_header, occlusion_markers))
+
+    totals = Counter()
+    for exp in experiments:
+        totals['experiments'] += 1
+        totals[exp['status']] += 1
+        for key in ('n_images', 'n_tongue_masks', 'n_jaw_rows', 'frames_all_images',
+                    'frames_labeled_only', 'n_unreadable_images', 'n_unreadable_masks',
+                    'n_images_without_tongue_mask',
+                    'n_jaw_frames_without_image'):
+            totals[key] += exp.get(key, 0)
+
+    return {
+        'data_folder': data_folder,
+        'experiments': experiments,
+        'totals': dict(totals),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _validate_experiment(folder: str,
+                         layout: Dict,
+                         headers: Dict,
+                         csv_delimiter: str,
+                         csv_has_header: bool,
+                         occlusion_markers: Tuple[str, ...]) -> Dict:
+    """Cross-check images, tongue masks and jaw CSV of one experiment."""
+    if layout['skip_reason'] is not None:
+        return {'folder': folder, 'status': 'skipped', 'issues': [layout['skip_reason']]}
+
+    issues = []
+    image_paths = layout['image_paths']
+    frame_to_path, frame_to_name = index_image_paths(image_paths)
+    unnumbered = len(image_paths) - len(frame_to_path)
+    if unnumbered:
+        issues.append(f'{unnumbered} image names are not frame numbers')
+
+    # Image headers
+    resolutions = Counter()
+    formats = Counter()
+    unreadable_images = []
+    frame_resolution = {}
+    video_path = layout['video_path']
+    if video_path is not None:
+        # Frame numbers are frame indices and tongue masks are matched by frame number
+        info = headers[video_path]
+        if isinstance(info, Exception):
+            unreadable_images.append(video_path)
+        else:
+            resolution, fmt, n_frames = info
+            frame_to_path = {frame_num: video_path for frame_num in range(n_frames)}
+            frame_resolution = dict.fromkeys(frame_to_path, resolution)
+            resolutions[f'{resolution[0]}x{resolution[1]}'] = n_frames
+            formats[fmt] = n_frames
+        tongue_masks = [os.path.join(layout['tongue_path'], f) for f in layout['tongue_files']
+                        if f.lower().endswith('.png')]
+        frame_to_name = {frame_num: str(frame_num) for frame_num in frame_to_path}
+        frame_to_name.update((frame_num, name) for frame_num, name in index_image_paths(tongue_masks)[1].items()
+                             if frame_num in frame_to_path)
+    else:
+        for frame_num, path in frame_to_path.items():
+            header = headers[path]
+            if isinstance(header, Exception):
+                unreadable_images.append(path)
+                continue
+            resolution, fmt = header
+            frame_resolution[frame_num] = resolution
+            resolutions[f'{resolution[0]}x{resolution[1]}'] += 1
+            formats[fmt] += 1
+    if unreadable_images:
+        issues.append(f'{len(unreadable_images)} images have unreadable headers')
+    if len(resolutions) > 1:
+        issues.append(f'Mixed image resolutions: {dict(resolutions)}')
+    # Resolution the labels refer to
+    original_resolution = layout.get('original_resolution')
+    label_resolution = (frame_resolution if original_resolution is None
+                        else dict.fromkeys(frame_resolution, original_resolution))
+
+    # Tongue masks are looked up as <image name>.png
+    tongue_path = layout['tongue_path']
+    tongue_names = {os.path.splitext(f)[0] for f in layout['tongue_files']
+                    if f.lower().endswith('.png')}
+    non_png_masks = [f for f in layout['tongue_files'] if not f.lower().endswith('.png')]
+    image_names = set(frame_to_name.values())
+    images_without_mask = [frame for frame, name in frame_to_name.items() if name not in tongue_names]
+    masks_without_image = tongue_names - image_names
+    unreadable_masks = []
+    mask_size_mismatch = []
+    mask_aspect_mismatch = []
+    for frame_num, name in frame_to_name.items():
+        if name not in tongue_names or frame_num not in frame_resolution:
+            continue
+        header = headers[os.path.join(tongue_path, name + '.png')]
+        if isinstance(header, Exception):
+            unreadable_masks.append(os.path.join(tongue_path, name + '.png'))
+        elif header[0] != label_resolution[frame_num]:
+            # The loader resizes masks to the frames, which only distorts them if the aspect ratio differs
+            (mask_height, mask_width), (height, width) = header[0], label_resolution[frame_num]
+            if abs(mask_width * height / (mask_height * width) - 1) > ASPECT_TOLERANCE:
+                mask_aspect_mismatch.append(frame_num)
+            else:
+                mask_size_mismatch.append(frame_num)
+    if non_png_masks:
+        issues.append(f'{len(non_png_masks)} non-PNG files in tongue folder are ignored')
+    if masks_without_image:
+        issues.append(f'{len(masks_without_image)} tongue masks have no matching image')
+    if unreadable_masks:
+        issues.append(f'{len(unreadable_masks)} tongue masks have unreadable headers')
+    if mask_size_mismatch:
+        issues.append(f'{len(mask_size_mismatch)} tongue masks differ in size from their image (resized when loading)')
+    if mask_aspect_mismatch:
+        issues.append(f'{len(mask_aspect_mismatch)} tongue masks differ in aspect ratio from their image')
+
+    # Jaw keypoints
+    skipped_rows = []
+    try:
+        jaw_coords = read_jaw_csv(layout['jaw_csv_path'], csv_delimiter=csv_delimiter,
+                                  csv_has_header=csv_has_header,
+                                  occlusion_markers=occlusion_markers,
+                                  verbose=False, skipped_rows=skipped_rows)
+    except Exception as e:
+        jaw_coords = {}
+        issues.append(f'Could not read jaw CSV: {e}')
+    if skipped_rows:
+        issues.append(f'{len(skipped_rows)} jaw CSV rows could not be parsed')
+    if layout['extra_jaw_csv_files']:
+        issues.append(f'Extra jaw CSV files are ignored: {layout["extra_jaw_csv_files"]}')
+    jaw_without_image = [frame for frame in jaw_coords if frame not in frame_to_path]
+    if jaw_without_image:
+        issues.append(f'{len(jaw_without_image)} jaw CSV frames have no image')
+    out_of_bounds = []
+    for frame_num, coord in jaw_coords.items():
+        if coord is None or frame_num not in label_resolution:
+            continue
+        height, width = label_resolution[frame_num]
+        if not (0 <= coord[0] < width and 0 <= coord[1] < height):
+            out_of_bounds.append(frame_num)
+    if out_of_bounds:
+        issues.append(f'{len(out_of_bounds)} jaw keypoints lie outside the image')
+
+    labeled_frames = [frame for frame in frame_to_path if frame in jaw_coords]
+    if not frame_to_path:
+        status = 'skipped'
+        issues.insert(0, 'No valid frame numbers found')
+    elif unreadable_images or unreadable_masks or len(resolutions) > 1 or mask_aspect_mismatch or jaw_without_image \
+            or out_of_bounds or skipped_rows:
+        status = 'error'
+    elif issues or images_without_mask:
+        status = 'warning'
+    else:
+        status = 'ok'
+
+    return {
+        'folder': folder,
+        'status': status,
+        'issues': issues,
+        'n_images': len(frame_to_path) if video_path is not None else len(image_paths),
+        'video': video_path,
+        'n_tongue_masks': len(tongue_names),
+        'n_jaw_rows': len(jaw_coords),
+        'n_jaw_occluded': sum(coord is None for coord in jaw_coords.values()),
+        'frames_all_images': len(frame_to_path) - len(unreadable_images),
+        'frames_labeled_only': len(labeled_frames),
+        'resolutions': dict(resolutions),
+        'original_resolution': None if original_resolution is None else list(original_resolution),
+        'formats': dict(formats),
+        'n_unreadable_images': len(unreadable_images),
+        'unreadable_images': _examples(unreadable_images),
+        'n_unreadable_masks': len(unreadable_masks),
+        'unreadable_masks': _examples(unreadable_masks),
+        'n_images_without_tongue_mask': len(images_without_mask),
+        'images_without_tongue_mask': _examples(images_without_mask),
+        'tongue_masks_without_image': _examples(masks_without_image),
+        'tongue_mask_size_mismatch': _examples(mask_size_mismatch),
+        'tongue_mask_aspect_mismatch': _examples(mask_aspect_mismatch),
+        'n_jaw_frames_without_image': len(jaw_without_image),
+        'jaw_frames_without_image': _examples(jaw_without_image),
+        'jaw_out_of_bounds': _examples(out_of_bounds),
+        'skipped_jaw_rows': [list(row) for row in skipped_rows[:MAX_EXAMPLES]],
+    }
+
+
+def print_validation_report(report: Dict, verbose: bool = False) -> None:
+    """Print a validation report as a table, followed by the issues found."""
+    print(f"{'Folder':30} {'Status':>8} {'Images':>8} {'Tongue':>8} {'Jaw':>8} {'Resolution':>12}")
+    print('-' * 79)
+    for exp in report['experiments']:
+        resolutions = exp.get('resolutions') or {}
+        resolution = next(iter(resolutions)) if len(resolutions) == 1 else ('mixed' if resolutions else '-')
+        print(f"{exp['folder'][:30]:30} {exp['status']:>8} {exp.get('n_images', 0):8d} "
+              f"{exp.get('n_tongue_masks', 0):8d} {exp.get('n_jaw_rows', 0):8d} {resolution:>12}")
+    print('-' * 79)
+    totals = report['totals']
+    print(f"{'TOTAL':30} {'':>8} {totals.get('n_images', 0):8d} "
+          f"{totals.get('n_tongue_masks', 0):8d} {totals.get('n_jaw_rows', 0):8d}")
+
+    print(f"\n{totals.get('experiments', 0)} experiments: {totals.get('ok', 0)} ok, "
+          f"{totals.get('warning', 0)} warning, {totals.get('error', 0)} error, "
+          f"{totals.get('skipped', 0)} skipped")
+    print(f"Frames to load: {totals.get('frames_all_images', 0)} (load_all_images=True), "
+          f"{totals.get('frames_labeled_only', 0)} (load_all_images=False)")
+    if totals.get('n_unreadable_images') or totals.get('n_unreadable_masks'):
+        print(f"Unreadable: {totals.get('n_unreadable_images', 0)} images, "
+              f"{totals.get('n_unreadable_masks', 0)} tongue masks")
+    print(f"Validated in {report['seconds']:.2f} s")
+
+    for exp in report['experiments']:
+        if exp['status'] == 'ok':
+            continue
+        if exp['status'] == 'warning' and not verbose:
+            continue
+        print(f"\n{exp['folder']} [{exp['status']}]")
+        for issue in exp['issues']:
+            print(f'  - {issue}')
+        if exp.get('n_images_without_tongue_mask'):
+            print(f"  - {exp['n_images_without_tongue_mask']} images have no tongue mask (empty mask used)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate a licking dataset folder by reading only image headers')
+    parser.add_argument('data_folder', help='Root folder containing experiment subfolders')
+    parser.add_argument('--json', '-j', help='Path to write the full report as JSON')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Number of header reader threads')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Also list issues of folders with warnings')
+    args = parser.parse_args()
+
+    try:
+        report = validate_licking_data(args.data_folder, max_workers=args.workers)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    print_validation_report(report, verbose=args.verbose)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote report to {args.json}')
+
+    if report['totals'].get('error', 0):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
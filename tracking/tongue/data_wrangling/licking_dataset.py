@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from licking_data_parser import iter_frame_images, load_tongue_mask, make_jaw_mask, scan_experiment
+
+
+class LickingDataset:
+    """
+    Lazy, random-access view of a licking dataset folder.
+
+    The frame list and jaw coordinates of every experiment are resolved up
+    front, exactly as ``load_licking_data`` would, but images and masks are only
+    decoded when indexed. Processed frames are kept in a bounded LRU cache.
+
+    ``len(dataset)``, ``dataset.filenames`` and the returned arrays match
+    ``load_licking_data(..., return_numpy=True)``: ``dataset[i]`` returns
+    ``(image, label)`` where ``label[..., 0]`` is the tongue mask and
+    ``label[..., 1]`` the jaw heatmap, and slices or index arrays return
+    stacked ``(images, labels)``. Unlike ``load_licking_data``, frames whose
+    image cannot be read raise an ``IOError`` instead of being dropped.
+
+    Parameters
+    ----------
+    data_folder : str
+        Path to the root folder containing experiment subfolders
+    target_resolution : Tuple[int, int]
+        Target resolution to resize images to (width, height)
+    gaussian_sigma : Tuple[int, int]
+        Sigma values for creating Gaussian masks for jaw (y_sigma, x_sigma)
+    load_all_images : bool
+        If True, includes all images; otherwise only frames with jaw coordinates
+    experiment_folders : Optional[List[str]]
+        Names of the experiment subfolders to include, in this order
+    cache_size : int
+        Maximum number of processed frames kept in memory
+    **scan_kwargs
+        Folder layout and CSV options passed on to ``scan_experiment``
+    """
+
+    def __init__(self,
+                 data_folder: str,
+                 target_resolution: Tuple[int, int] = (256, 256),
+                 gaussian_sigma: Tuple[int, int] = (25, 25),
+                 load_all_images: bool = True,
+                 experiment_folders: Optional[List[str]] = None,
+                 cache_size: int = 1024,
+                 **scan_kwargs):
+        self.data_folder = data_folder
+        self.target_resolution = target_resolution
+        self.gaussian_sigma = gaussian_sigma
+        self.cache_size = cache_size
+
+        if experiment_folders is None:
+            experiment_folders = [filename for filename in os.listdir(data_folder)
+                                  if os.path.isdir(os.path.join(data_folder, filename))]
+
+        self.experiments = []
+        self._frames = []  # (experiment index, frame number) per item
+        for experiment_folder in experiment_folders:
+            experiment = scan_experiment(os.path.join(data_folder, experiment_folder),
+                                         load_all_images=load_all_images, **scan_kwargs)
+            if experiment is None:
+                continue
+            exp_index = len(self.experiments)
+            self.experiments.append(experiment)
+            self._frames.extend((exp_index, frame_num) for frame_num in experiment['frames'])
+
+        self.filenames = [self.experiments[e]['frame_to_path'][f] for e, f in self._frames]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __repr__(self) -> str:
+        return (f'LickingDataset({self.data_folder!r}, frames={len(self)}, '
+                f'experiments={len(self.experiments)}, target_resolution={self.target_resolution})')
+
+    def frame_info(self, index: int) -> Tuple[str, int]:
+        """Experiment folder name and frame number of an item."""
+        exp_index, frame_num = self._frames[index]
+        return self.experiments[exp_index]['folder'], frame_num
+
+    def _process(self, exp_index: int, frame_num: int, image: Optional[np.ndarray]):
+        """Resize an image and build its label, as ``load_licking_data`` does."""
+        experiment = self.experiments[exp_index]
+        if image is None:
+            raise IOError(f'Could not read image: {experiment["frame_to_path"][frame_num]}')
+        image = cv2.resize(image, self.target_resolution, interpolation=cv2.INTER_AREA)
+        tongue = load_tongue_mask(experiment['tongue_path'], experiment['frame_to_name'][frame_num],
+                                  self.target_resolution)
+        jaw = make_jaw_mask(experiment['jaw_coords'].get(frame_num), experiment['original_resolution'],
+                            self.target_resolution, self.gaussian_sigma)
+        return image, np.stack([tongue, jaw], axis=-1)
+
+    def _load(self, indices: List[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Return processed frames for ``indices``, decoding cache misses grouped by experiment."""
+        results = {}
+        missing = {}
+        with self._lock:
+            for index in indices:
+                key = self._frames[index]
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[key] = self._cache[key]
+                else:
+                    missing.setdefault(key[0], set()).add(key[1])
+
+        # Decode outside the lock; one pass per experiment keeps video reads sequential
+        for exp_index, frame_nums in missing.items():
+            experiment = self.experiments[exp_index]
+            for frame_num, image in iter_frame_images(experiment['frame_to_path'], sorted(frame_nums),
+                                                      experiment['video_path']):
+                results[(exp_index, frame_num)] = self._process(exp_index, frame_num, image)
+
+        if missing and self.cache_size > 0:
+            with self._lock:
+                for exp_index, frame_nums in missing.items():
+                    for frame_num in frame_nums:
+                        key = (exp_index, frame_num)
+                        self._cache[key] = results[key]
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [results[self._frames[index]] for index in indices]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            indices = list(range(*key.indices(len(self))))
+        elif isinstance(key, (list, tuple, np.ndarray)):
+            indices = [int(i) + len(self) if int(i) < 0 else int(i) for i in np.asarray(key).ravel()]
+            if any(not 0 <= i < len(self) for i in indices):
+                raise IndexError(f'Index out of range for dataset of length {len(self)}')
+        else:
+            index = int(key)
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(f'Index {key} out of range for dataset of length {len(self)}')
+            return self._load([index])[0]
+
+        width, height = self.target_resolution
+        if not indices:
+            return np.empty((0, height, width, 3), dtype=np.uint8), np.empty((0, height, width, 2), dtype=np.uint8)
+        items = self._load(indices)
+        return np.stack([image for image, _ in items]), np.stack([label for _, label in items])
+
+    def cache_clear(self) -> None:
+        """Drop all cached frames."""
+        with self._lock:
+            self._cache.clear()
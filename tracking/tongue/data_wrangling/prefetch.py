@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Read-ahead of small files for loading datasets from high-latency storage.
+
+On ``/mnt/c`` under WSL or on cluster network storage, reading thousands of
+small image and mask files one after another spends most of the time waiting
+for each read to return. ``Prefetcher.read_ahead`` reads the raw bytes of
+upcoming files on a bounded thread pool while the caller decodes the current
+ones with ``cv2.imdecode``. Results come back in request order, and the bytes
+held in memory are capped.
+
+``Prefetcher.stats`` separates the time the caller spent blocked on I/O
+(``io_wait``) from the time spent decoding (``decode``); ``read`` is the
+summed time of the reads themselves across threads.
+
+Example:
+  with Prefetcher(max_workers=16) as prefetch:
+      for image_bytes, mask_bytes in prefetch.read_ahead(zip(image_paths, mask_paths)):
+          image = prefetch.decode_image(image_bytes)
+          mask = prefetch.decode_image(mask_bytes, cv2.IMREAD_GRAYSCALE)
+      print(prefetch.report())
+
+  python prefetch.py /mnt/c/data/Mask+Jaw/exp1/images --workers 16
+"""
+
+import argparse
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+NPY_MAGIC = b'\x93NUMPY'
+
+
+def read_file(path: Optional[str]) -> Optional[bytes]:
+    """Raw bytes of a file; None for a None path or a file that cannot be read."""
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read()
+    except OSError:
+        return None
+
+
+class Prefetcher:
+    """
+    Bounded read-ahead of file bytes on a thread pool.
+
+    Parameters
+    ----------
+    max_workers : int
+        Concurrent reads. 0 reads synchronously in the calling thread, which
+        gives the same statistics for comparison
+    max_bytes : int
+        Cap on the bytes read ahead but not yet consumed. Reads in flight are
+        counted at the mean file size seen so far
+    max_items : Optional[int]
+        Cap on the items read ahead (default: 4 * max_workers)
+    """
+
+    def __init__(self, max_workers: int = 8, max_bytes: int = 256 * 2 ** 20, max_items: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.max_items = max_items or max(4 * max_workers, 1)
+        self.stats = {'files': 0, 'bytes': 0, 'read': 0.0, 'io_wait': 0.0, 'decode': 0.0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _read(self, paths: Tuple[Optional[str], ...]) -> Tuple[Optional[bytes], ...]:
+        start = time.perf_counter()
+        data = tuple(read_file(path) for path in paths)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats['read'] += elapsed
+            self.stats['files'] += sum(d is not None for d in data)
+            self.stats['bytes'] += sum(len(d) for d in data if d is not None)
+        return data
+
+    def _has_room(self, pending) -> bool:
+        """Whether another item may be read ahead of the consumer."""
+        if len(pending) >= self.max_items:
+            return False
+        with self._lock:
+            mean_size = self.stats['bytes'] / self.stats['files'] if self.stats['files'] else 0.0
+        buffered = 0.0
+        for future, n_paths, _ in pending:
+            if future.done() and future.exception() is None:
+                buffered += sum(len(d) for d in future.result() if d is not None)
+            else:
+                buffered += mean_size * n_paths
+        return buffered < self.max_bytes
+
+    def read_ahead(self, items: Iterable) -> Iterable[Tuple[Optional[bytes], ...]]:
+        """
+        Yield the bytes of every item, in order, reading ahead of the consumer.
+
+        Parameters
+        ----------
+        items : Iterable
+            Paths, or tuples of paths read together (e.g. an image and its
+            mask). None paths yield None without any I/O
+
+        Yields
+        ------
+        bytes or None for a single path, a tuple of them for a tuple of paths
+        """
+        items = iter(items)
+        if self._executor is None:
+            for item in items:
+                paths = item if isinstance(item, tuple) else (item,)
+                start = time.perf_counter()
+                data = self._read(paths)
+                self.stats['io_wait'] += time.perf_counter() - start
+                yield data if isinstance(item, tuple) else data[0]
+            return
+
+        pending = deque()  # (future, number of paths, item is a tuple)
+        exhausted = False
+        try:
+            while True:
+                # Keep at least one read in flight; add more within the caps
+                while not exhausted and (not pending or self._has_room(pending)):
+                    item = next(items, StopIteration)
+                    if item is StopIteration:
+                        exhausted = True
+                        break
+                    paths = item if isinstance(item, tuple) else (item,)
+                    pending.append((self._executor.submit(self._read, paths), len(paths),
+                                    isinstance(item, tuple)))
+                if not pending:
+                    return
+                future, _, is_tuple = pending.popleft()
+                start = time.perf_counter()
+                data = future.result()
+                self.stats['io_wait'] += time.perf_counter() - start
+                yield data if is_tuple else data[0]
+        finally:
+            for future, _, _ in pending:
+                future.cancel()
+
+    def decode_image(self, data: Optional[bytes], flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """
+        ``cv2.imdecode`` of file bytes (None if missing or undecodable), timed into ``stats['decode']``.
+
+        Bytes of a ``.npy`` file are loaded as the stored array.
+        """
+        if data is None:
+            return None
+        start = time.perf_counter()
+        if data.startswith(NPY_MAGIC):
+            image = np.load(io.BytesIO(data))
+        else:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        self.stats['decode'] += time.perf_counter() - start
+        return image
+
+    def report(self) -> str:
+        stats = self.stats
+        return (f"Read {stats['files']} files ({stats['bytes'] / 2 ** 20:.1f} MB) with "
+                f"{self.max_workers or 'no'} I/O threads: waited {stats['io_wait']:.2f}s on I/O, "
+                f"decoded for {stats['decode']:.2f}s (reads took {stats['read']:.2f}s in total)")
+
+
+def benchmark(paths: Sequence[str], worker_counts: Sequence[int] = (0, 4, 16), flags: int = cv2.IMREAD_COLOR):
+    """
+    Read and decode ``paths`` with each number of I/O threads.
+
+    Returns
+    -------
+    dict
+        workers -> stats dict with an added 'wall' time
+    """
+    results = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        with Prefetcher(max_workers=workers) as prefetch:
+            for data in prefetch.read_ahead(paths):
+                prefetch.decode_image(data, flags)
+            results[workers] = dict(prefetch.stats, wall=time.perf_counter() - start)
+            print(f'{prefetch.report()}; wall {results[workers]["wall"]:.2f}s')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare image loading with and without read-ahead')
+    parser.add_argument('folder', help='Folder of images')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4, 16], help='I/O thread counts to compare')
+    parser.add_argument('--extensions', nargs='+', default=['.png', '.jpg', '.jpeg'], help='Image extensions')
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder)
+                   if f.lower().endswith(tuple(args.extensions)))
+    print(f'{len(paths)} images in {args.folder}')
+    benchmark(paths, args.workers)
+
+
+if __name__ == '__main__':
+    main()
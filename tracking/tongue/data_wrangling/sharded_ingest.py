@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Shard-aware ingestion of a licking dataset for cluster array jobs.
+
+Each shard deterministically takes every ``num_shards``-th experiment folder
+(sorted by name), loads it with ``load_licking_data`` and writes an
+independent shard file. A merge step combines all shards into one dataset,
+ordered by experiment folder, with a JSON manifest.
+
+Example usage (SLURM array job, shard index taken from the environment):
+  #SBATCH --array=0-7
+  python sharded_ingest.py ingest /mnt/data/Mask+Jaw/ /mnt/data/shards/
+  python sharded_ingest.py merge /mnt/data/shards/ --output /mnt/data/licking_dataset.pkl
+
+Locally the same can be done with explicit shard indices:
+  python sharded_ingest.py ingest data/ shards/ --shard 0 --num-shards 2 &
+  python sharded_ingest.py ingest data/ shards/ --shard 1 --num-shards 2
+"""
+
+import argparse
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from licking_data_parser import load_licking_data
+
+
+SHARD_PATTERN = 'shard-{shard:05d}-of-{num_shards:05d}'
+
+# Loader settings that change what load_licking_data returns (an ingested
+# dataset holds one images array, one heatmap labels array and the
+# filenames), or that the ingestion sets itself, with the only accepted value
+FIXED_LOADER_KWARGS = {'return_numpy': True, 'experiment_folders': None, 'temporal_window': None,
+                       'crop_margin': None, 'keypoint_format': 'heatmap'}
+# Loader settings that only change how fast the same arrays are loaded
+RUNTIME_LOADER_KWARGS = ('prefetch_workers', 'dedup_manifest')
+
+
+def list_experiment_folders(data_folder: str) -> List[str]:
+    """Sorted names of the experiment subfolders of ``data_folder``."""
+    return sorted(filename for filename in os.listdir(data_folder)
+                  if os.path.isdir(os.path.join(data_folder, filename)))
+
+
+def folder_list_hash(experiment_folders: List[str]) -> str:
+    """Hash of the experiment folder list, used to check that all shards saw the same folders."""
+    return hashlib.sha1('\n'.join(sorted(experiment_folders)).encode('utf-8')).hexdigest()
+
+
+def shard_experiment_folders(experiment_folders: List[str], shard: int, num_shards: int) -> List[str]:
+    """
+    Select the experiment folders handled by one shard.
+
+    Folders are sorted by name and dealt round-robin, so every process that sees
+    the same folder list makes the same assignment without coordination.
+    """
+    if num_shards < 1:
+        raise ValueError(f'num_shards must be at least 1, got {num_shards}')
+    if not 0 <= shard < num_shards:
+        raise ValueError(f'shard must be in [0, {num_shards}), got {shard}')
+    return sorted(experiment_folders)[shard::num_shards]
+
+
+def check_loader_kwargs(loader_kwargs: Dict, ingestion: str) -> None:
+    """
+    Remove the ``FIXED_LOADER_KWARGS`` from ``loader_kwargs`` in place.
+
+    Raises ``ValueError`` if one of them has another value, or if
+    ``target_resolution`` is a list (which returns dicts of arrays), before
+    anything is loaded.
+    """
+    for key, value in FIXED_LOADER_KWARGS.items():
+        if key in loader_kwargs and loader_kwargs.pop(key) != value:
+            raise ValueError(f'{key} is not supported by {ingestion} ingestion')
+    if isinstance(loader_kwargs.get('target_resolution'), list):
+        raise ValueError(f'{ingestion} ingestion takes one target_resolution')
+
+
+def loader_settings(loader_kwargs: Dict) -> Dict:
+    """
+    Settings that shape the loaded arrays: ``load_licking_data`` defaults updated with ``loader_kwargs``.
+
+    Fixed and runtime settings are left out; tuples become lists as in JSON.
+    """
+    parameters = inspect.signature(load_licking_data).parameters
+    settings = {name: parameter.default for name, parameter in parameters.items()
+                if parameter.default is not inspect.Parameter.empty}
+    settings.update(loader_kwargs)
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in settings.items()
+            if key not in FIXED_LOADER_KWARGS and key not in RUNTIME_LOADER_KWARGS}
+
+
+def _write_atomic(path: str, write) -> None:
+    """Write a file through a temporary name so partial files are never mistaken for finished ones."""
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def ingest_shard(data_folder: str,
+                 output_folder: str,
+                 shard: int,
+                 num_shards: int,
+                 **loader_kwargs) -> Dict:
+    """
+    Load the experiments of one shard and write them to ``output_folder``.
+
+    Writes ``shard-<i>-of-<n>.pkl`` containing ``(images, filenames, labels)`` as
+    returned by ``load_licking_data(return_numpy=True)``, and a ``.json`` file with
+    the frame range of every experiment in the shard.
+
+    Parameters
+    ----------
+    data_folder : str
+        Path to the root folder containing experiment subfolders
+    output_folder : str
+        Folder the shard files are written to
+    shard : int
+        Index of this shard, in [0, num_shards)
+    num_shards : int
+        Total number of shards
+    **loader_kwargs
+        Passed on to ``load_licking_data``. Settings that change the returned
+        arrays (``FIXED_LOADER_KWARGS``, a list of resolutions) are rejected
+
+    Returns
+    -------
+    dict
+        The shard metadata written to the JSON file
+    """
+    start = time.perf_counter()
+    check_loader_kwargs(loader_kwargs, 'sharded')
+    all_folders = list_experiment_folders(data_folder)
+    folders = shard_experiment_folders(all_folders, shard, num_shards)
+    print(f'Shard {shard}/{num_shards}: {len(folders)} of {len(all_folders)} experiment folders')
+
+    images, filenames, labels = [], [], []
+    experiments = []
+    n_frames = 0
+    for folder in folders:
+        exp_images, exp_filenames, exp_labels = load_licking_data(
+            data_folder, experiment_folders=[folder], return_numpy=True, **loader_kwargs)
+        experiments.append({'folder': folder, 'start': n_frames, 'stop': n_frames + len(exp_filenames)})
+        if len(exp_filenames):
+            images.append(exp_images)
+            filenames.extend(exp_filenames)
+            labels.append(exp_labels)
+            n_frames += len(exp_filenames)
+
+    images_np = np.concatenate(images) if images else np.array([])
+    labels_np = np.concatenate(labels) if labels else np.array([])
+
+    os.makedirs(output_folder, exist_ok=True)
+    base = os.path.join(output_folder, SHARD_PATTERN.format(shard=shard, num_shards=num_shards))
+
+    def write_pickle(path):
+        with open(path, 'wb') as handle:
+            pickle.dump((images_np, filenames, labels_np), handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    metadata = {
+        'shard': shard,
+        'num_shards': num_shards,
+        'data_folder': data_folder,
+        'folder_list_hash': folder_list_hash(all_folders),
+        'n_folders_total': len(all_folders),
+        'experiments': experiments,
+        'n_frames': n_frames,
+        'images_shape': list(images_np.shape),
+        'images_dtype': str(images_np.dtype),
+        'labels_shape': list(labels_np.shape),
+        'labels_dtype': str(labels_np.dtype),
+        'loader_kwargs': {k: list(v) if isinstance(v, tuple) else v for k, v in loader_kwargs.items()},
+        'seconds': time.perf_counter() - start,
+    }
+
+    def write_json(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
+
+    # The JSON is written last: its presence marks the shard as complete
+    _write_atomic(base + '.pkl', write_pickle)
+    _write_atomic(base + '.json', write_json)
+    print(f'Wrote {n_frames} frames to {base}.pkl in {metadata["seconds"]:.1f} s')
+    return metadata
+
+
+def merge_shards(shard_folder: str,
+                 output_path: Optional[str] = None,
+                 manifest_path: Optional[str] = None) -> Dict:
+    """
+    Merge shard files written by ``ingest_shard`` into one dataset.
+
+    Experiments are ordered by folder name regardless of which shard loaded
+    them, so the result does not depend on the number of shards. The merged
+    file holds ``(images, filenames, labels)`` like a single
+    ``load_licking_data`` call.
+
+    Parameters
+    ----------
+    shard_folder : str
+        Folder containing the shard ``.pkl``/``.json`` files
+    output_path : Optional[str]
+        Merged dataset path (default: ``<shard_folder>/licking_dataset.pkl``)
+    manifest_path : Optional[str]
+        Manifest path (default: output path with ``.manifest.json`` suffix)
+
+    Returns
+    -------
+    dict
+        The manifest: per-experiment frame ranges and source shards, totals
+    """
+    metadata_paths = sorted(glob.glob(os.path.join(shard_folder, 'shard-*-of-*.json')))
+    if not metadata_paths:
+        raise FileNotFoundError(f'No shard metadata found in {shard_folder}')
+
+    shards = []
+    for path in metadata_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            shards.append(json.load(f))
+
+    num_shards = {m['num_shards'] for m in shards}
+    hashes = {m['folder_list_hash'] for m in shards}
+    if len(num_shards) != 1:
+        raise ValueError(f'Shards were written with different num_shards: {sorted(num_shards)}')
+    if len(hashes) != 1:
+        raise ValueError('Shards saw different experiment folder lists; re-run ingestion for all shards')
+    num_shards = num_shards.pop()
+    missing = sorted(set(range(num_shards)) - {m['shard'] for m in shards})
+    if missing:
+        raise ValueError(f'Missing shards: {missing}')
+
+    # Global order: experiments sorted by folder name
+    experiments = []
+    for meta in shards:
+        for exp in meta['experiments']:
+            experiments.append(dict(exp, shard=meta['shard']))
+    experiments.sort(key=lambda exp: exp['folder'])
+    n_frames = 0
+    for exp in experiments:
+        exp['shard_start'], exp['shard_stop'] = exp.pop('start'), exp.pop('stop')
+        exp['start'] = n_frames
+        n_frames += exp['shard_stop'] - exp['shard_start']
+        exp['stop'] = n_frames
+
+    settings = [loader_settings(m['loader_kwargs']) for m in shards]
+    differing = sorted({key for s in settings for key in s if any(o.get(key) != s[key] for o in settings)})
+    if differing:
+        raise ValueError(f'Shards were loaded with different settings: {", ".join(differing)}; '
+                         f're-run ingestion for all shards')
+
+    non_empty = [m for m in shards if m['n_frames']]
+    if not non_empty:
+        raise ValueError('All shards are empty')
+    images_shape = {tuple(m['images_shape'][1:]) for m in non_empty}
+    labels_shape = {tuple(m['labels_shape'][1:]) for m in non_empty}
+    if len(images_shape) != 1 or len(labels_shape) != 1:
+        raise ValueError('Shards were loaded with different resolutions')
+    images_np = np.empty((n_frames,) + images_shape.pop(), dtype=non_empty[0]['images_dtype'])
+    labels_np = np.empty((n_frames,) + labels_shape.pop(), dtype=non_empty[0]['labels_dtype'])
+    filenames = [None] * n_frames
+
+    # Copy one shard at a time to keep peak memory at the merged size plus one shard
+    for meta in shards:
+        if not meta['n_frames']:
+            continue
+        pkl_path = os.path.join(shard_folder, SHARD_PATTERN.format(shard=meta['shard'],
+                                                                   num_shards=num_shards) + '.pkl')
+        with open(pkl_path, 'rb') as handle:
+            shard_images, shard_filenames, shard_labels = pickle.load(handle)
+        for exp in experiments:
+            if exp['shard'] != meta['shard']:
+                continue
+            src = slice(exp['shard_start'], exp['shard_stop'])
+            dst = slice(exp['start'], exp['stop'])
+            images_np[dst] = shard_images[src]
+            labels_np[dst] = shard_labels[src]
+            filenames[dst] = shard_filenames[src]
+        del shard_images, shard_labels
+
+    if output_path is None:
+        output_path = os.path.join(shard_folder, 'licking_dataset.pkl')
+    if manifest_path is None:
+        manifest_path = os.path.splitext(output_path)[0] + '.manifest.json'
+
+    def write_pickle(path):
+        with open(path, 'wb') as handle:
+            pickle.dump((images_np, filenames, labels_np), handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    manifest = {
+        'dataset': os.path.basename(output_path),
+        'data_folder': shards[0]['data_folder'],
+        'num_shards': num_shards,
+        'folder_list_hash': hashes.pop(),
+        'n_frames': n_frames,
+        'n_experiments': len(experiments),
+        'images_shape': list(images_np.shape),
+        'labels_shape': list(labels_np.shape),
+        'loader_kwargs': shards[0]['loader_kwargs'],
+        'experiments': experiments,
+    }
+
+    def write_json(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    _write_atomic(output_path, write_pickle)
+    _write_atomic(manifest_path, write_json)
+    print(f'Merged {num_shards} shards: {n_frames} frames from {len(experiments)} experiments -> {output_path}')
+    return manifest
+
+
+def _default_shard_args(args):
+    """Fill --shard/--num-shards from the SLURM array environment when not given."""
+    if args.shard is None:
+        task_id = os.environ.get('SLURM_ARRAY_TASK_ID')
+        task_min = int(os.environ.get('SLURM_ARRAY_TASK_MIN', 0))
+        args.shard = int(task_id) - task_min if task_id is not None else None
+    if args.num_shards is None:
+        task_count = os.environ.get('SLURM_ARRAY_TASK_COUNT')
+        args.num_shards = int(task_count) if task_count is not None else None
+    if args.shard is None or args.num_shards is None:
+        print('Shard index and count are required: pass --shard/--num-shards or run as a SLURM array job',
+              file=sys.stderr)
+        sys.exit(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded licking dataset ingestion for array jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='Load one shard of the experiment folders')
+    ingest.add_argument('data_folder', help='Root folder containing experiment subfolders')
+    ingest.add_argument('output_folder', help='Folder to write the shard files to')
+    ingest.add_argument('--shard', type=int, default=None,
+                        help='Shard index (default: $SLURM_ARRAY_TASK_ID - $SLURM_ARRAY_TASK_MIN)')
+    ingest.add_argument('--num-shards', type=int, default=None,
+                        help='Number of shards (default: $SLURM_ARRAY_TASK_COUNT)')
+    ingest.add_argument('--resolution', type=int, nargs=2, default=(256, 256), metavar=('WIDTH', 'HEIGHT'),
+                        help='Target resolution (default: 256 256)')
+    ingest.add_argument('--labeled-only', dest='load_all_images', action='store_false',
+                        help='Only load frames that have jaw labels')
+
+    merge = subparsers.add_parser('merge', help='Merge all shards into one dataset')
+    merge.add_argument('shard_folder', help='Folder containing the shard files')
+    merge.add_argument('--output', '-o', default=None, help='Merged dataset path')
+    merge.add_argument('--manifest', default=None, help='Manifest path')
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        _default_shard_args(args)
+        ingest_shard(args.data_folder, args.output_folder, args.shard, args.num_shards,
+                     target_resolution=tuple(args.resolution), load_all_images=args.load_all_images)
+    else:
+        merge_shards(args.shard_folder, output_path=args.output, manifest_path=args.manifest)
+
+
+if __name__ == '__main__':
+    main()
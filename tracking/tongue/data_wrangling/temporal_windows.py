@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Zero-copy temporal windows over licking dataset frames.
+
+Tongue and jaw tracking can use the neighbouring frames of every labeled frame
+as extra input. ``TemporalWindows`` stores each experiment's frames once, in
+frame order, with a few padding frames at both ends, and exposes windows
+``(N, T, H, W, C)`` as strided views of that array. Window ``i`` is centered
+on frame ``i`` of the dataset, so labels and filenames stay aligned with
+windows. Windows never cross experiment boundaries: frames beyond either end of
+an experiment are filled according to the padding policy.
+
+``gather`` materializes only the windows of one batch, so training holds
+``batch_size * T`` frames in memory rather than ``N * T``.
+
+Example:
+  windows, filenames, labels = load_licking_data(data_folder, temporal_window=5)
+  windows.gather([10, 500, 7])          # (3, 5, H, W, C) copy
+  windows.gather([10, 500, 7], stack_channels=True)   # (3, H, W, 5 * C)
+  windows.experiment_view(0)            # (n_0, 5, H, W, C) read-only view
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from dataset_stats import experiment_of
+
+PADDING_MODES = ('edge', 'zero', 'reflect')
+
+
+class TemporalWindows:
+    """
+    Sliding windows of ``window`` consecutive frames, one centered on every frame.
+
+    Parameters
+    ----------
+    frames : Sequence[np.ndarray]
+        All frames, experiment after experiment, each experiment in frame order
+    experiment_sizes : Sequence[int]
+        Number of frames of each experiment, in the order of ``frames``
+    window : int
+        Frames per window. Window ``i`` covers frames
+        ``i - (window - 1) // 2`` to ``i + window // 2`` of its experiment
+    padding : str
+        How frames beyond the ends of an experiment are filled: 'edge' repeats
+        the first/last frame, 'zero' uses black frames, 'reflect' mirrors the
+        frames next to the end (without repeating the end frame)
+    """
+
+    def __init__(self,
+                 frames: Sequence[np.ndarray],
+                 experiment_sizes: Sequence[int],
+                 window: int,
+                 padding: str = 'edge'):
+        if window < 1:
+            raise ValueError(f'window must be at least 1, got {window}')
+        if padding not in PADDING_MODES:
+            raise ValueError(f'padding must be one of {PADDING_MODES}, got {padding!r}')
+        experiment_sizes = [int(n) for n in experiment_sizes]
+        if sum(experiment_sizes) != len(frames):
+            raise ValueError(f'Experiment sizes add up to {sum(experiment_sizes)}, but there are {len(frames)} frames')
+        if any(n < 1 for n in experiment_sizes):
+            raise ValueError('Every experiment needs at least one frame')
+        if padding == 'reflect' and any(n <= (window - 1) // 2 or n <= window // 2 for n in experiment_sizes):
+            raise ValueError("'reflect' padding needs experiments longer than half the window")
+
+        self.window = window
+        self.padding = padding
+        self.before = (window - 1) // 2
+        self.after = window // 2
+        self.experiment_sizes = experiment_sizes
+
+        # Layout of the base array: [pad before][experiment frames][pad after] per experiment
+        pad = self.before + self.after
+        first = np.asarray(frames[0])
+        self.base = np.empty((len(frames) + pad * len(experiment_sizes),) + first.shape, dtype=first.dtype)
+        # Base index of the first frame of every window
+        self.starts = np.empty(len(frames), dtype=np.int64)
+        # Base index of the first (padding) frame of every experiment
+        self.experiment_offsets = np.empty(len(experiment_sizes), dtype=np.int64)
+
+        source = 0
+        target = 0
+        for e, n in enumerate(experiment_sizes):
+            self.experiment_offsets[e] = target
+            frame_positions = np.arange(-self.before, n + self.after)
+            for k, position in enumerate(frame_positions):
+                self.base[target + k] = self._padding_frame(frames, source, n, position)
+            self.starts[source:source + n] = target + np.arange(n)
+            source += n
+            target += n + pad
+
+    def _padding_frame(self, frames, source: int, n: int, position: int):
+        """Frame at ``position`` of an experiment starting at ``frames[source]``, padded beyond its ends."""
+        if 0 <= position < n:
+            return frames[source + position]
+        if self.padding == 'zero':
+            return 0
+        if self.padding == 'edge':
+            return frames[source + min(max(position, 0), n - 1)]
+        # reflect: -1 -> 1, n -> n - 2
+        return frames[source + (-position if position < 0 else 2 * (n - 1) - position)]
+
+    @classmethod
+    def from_array(cls, images: np.ndarray, filenames: Sequence[str], window: int, padding: str = 'edge'):
+        """
+        Windows over an already loaded image array.
+
+        Frames are grouped into experiments by consecutive runs of the same
+        experiment folder in ``filenames``, the order ``load_licking_data`` writes them in.
+        """
+        experiments = [experiment_of(f) for f in filenames]
+        sizes = []
+        for k, experiment in enumerate(experiments):
+            if k and experiment == experiments[k - 1]:
+                sizes[-1] += 1
+            else:
+                sizes.append(1)
+        return cls(images, sizes, window, padding)
+
+    @property
+    def shape(self):
+        return (len(self.starts), self.window) + self.base.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.base.dtype
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes actually held, including the padding frames."""
+        return self.base.nbytes
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def experiment_view(self, experiment: int) -> np.ndarray:
+        """Read-only ``(n, T, H, W, C)`` view of every window of one experiment, without copying."""
+        offset = self.experiment_offsets[experiment]
+        n = self.experiment_sizes[experiment]
+        segment = self.base[offset:offset + n + self.window - 1]
+        return np.moveaxis(np.lib.stride_tricks.sliding_window_view(segment, self.window, axis=0), -1, 1)
+
+    @property
+    def experiment_views(self) -> List[np.ndarray]:
+        return [self.experiment_view(e) for e in range(len(self.experiment_sizes))]
+
+    def frame_indices(self, indices) -> np.ndarray:
+        """(B, T) base array indices of the frames of the given windows."""
+        return self.starts[np.asarray(indices)][..., None] + np.arange(self.window)
+
+    def gather(self, indices, stack_channels: bool = False, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Copy the given windows into one batch.
+
+        Parameters
+        ----------
+        indices : array-like of int
+            Window (= center frame) indices
+        stack_channels : bool
+            Return ``(B, H, W, T * C)`` with the frames of each window stacked
+            along the channel axis (oldest frame first) instead of ``(B, T, H, W, C)``
+        out : Optional[np.ndarray]
+            Preallocated ``(B, T, H, W, C)`` array to fill
+
+        Returns
+        -------
+        np.ndarray
+            The batch
+        """
+        batch = np.take(self.base, self.frame_indices(indices), axis=0, out=out)
+        if stack_channels:
+            batch = stack_window_channels(batch)
+        return batch
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            start = self.starts[index]
+            return self.base[start:start + self.window]
+        if isinstance(index, slice):
+            index = np.arange(len(self))[index]
+        return self.gather(index)
+
+
+def stack_window_channels(batch: np.ndarray) -> np.ndarray:
+    """(B, T, H, W, C) -> (B, H, W, T * C); (B, T, H, W) -> (B, H, W, T)."""
+    if batch.ndim == 4:
+        return np.moveaxis(batch, 1, -1)
+    b, t, h, w, c = batch.shape
+    return np.moveaxis(batch, 1, 3).reshape(b, h, w, t * c)
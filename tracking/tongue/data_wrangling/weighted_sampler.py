@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Label-aware sampling of licking dataset frames.
+
+With ``load_all_images=True`` many frames have an empty tongue mask and no jaw
+keypoint. Instead of showing every frame once per epoch, ``label_weights``
+scores each frame from its label content (tongue mask area, jaw keypoint
+presence, experiment size) and ``WeightedSampler`` draws a reproducible index
+schedule for every epoch from those weights. ``ScheduledBatches`` feeds the
+schedule to ``model.fit`` as a Keras dataset.
+
+Example:
+  weights = label_weights(labels, filenames, empty_weight=0.1, balance_experiments=0.5)
+  sampler = WeightedSampler(weights, seed=4)
+  model.fit(ScheduledBatches((images, labels), sampler, batch_size=32), epochs=150)
+
+  python weighted_sampler.py licking_dataset.pkl --empty-weight 0.1 --balance 0.5
+"""
+
+import argparse
+import os
+import pickle
+from typing import Optional, Sequence
+
+import numpy as np
+
+from dataset_stats import experiment_of
+
+try:
+    from keras.utils import PyDataset as _BatchBase
+except ImportError:
+    try:
+        from keras.utils import Sequence as _BatchBase
+    except ImportError:
+        _BatchBase = object
+
+
+def label_content(labels: np.ndarray, chunk_size: int = 1024):
+    """
+    Per-frame tongue mask area fraction and jaw keypoint presence.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        (N, H, W, 2) labels: tongue mask, jaw heatmap
+    chunk_size : int
+        Frames reduced at a time, bounding temporary memory
+
+    Returns
+    -------
+    tongue_area : np.ndarray
+        (N,) fraction of pixels covered by the tongue mask
+    has_jaw : np.ndarray
+        (N,) True where the jaw heatmap is not empty
+    """
+    n = len(labels)
+    tongue_area = np.zeros(n, dtype=np.float64)
+    has_jaw = np.zeros(n, dtype=bool)
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(labels[start:start + chunk_size])
+        flat = chunk.reshape(len(chunk), -1, chunk.shape[-1])
+        tongue_area[start:start + len(chunk)] = np.count_nonzero(flat[..., 0], axis=1) / flat.shape[1]
+        has_jaw[start:start + len(chunk)] = flat[..., 1].max(axis=1) > 0
+    return tongue_area, has_jaw
+
+
+def label_weights(labels: np.ndarray,
+                  filenames: Optional[Sequence[str]] = None,
+                  empty_weight: float = 0.1,
+                  tongue_weight: float = 1.0,
+                  area_power: float = 0.5,
+                  keypoint_weight: float = 1.0,
+                  balance_experiments: float = 0.0,
+                  experiments: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Sampling weight of every frame from its label content.
+
+    A frame with neither a tongue mask nor a jaw keypoint gets ``empty_weight``.
+    Otherwise the weight is ``empty_weight + tongue_weight * (area / mean_area) ** area_power
+    + keypoint_weight * has_jaw``, where ``mean_area`` is the mean area of the
+    non-empty masks. The weights are then multiplied by
+    ``experiment_frames ** -balance_experiments`` (0: no balancing, 1: every
+    experiment is drawn equally often) and normalized to a mean of 1.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        (N, H, W, 2) labels: tongue mask, jaw heatmap
+    filenames : Optional[Sequence[str]]
+        Frame filenames, used to find each frame's experiment folder
+    empty_weight : float
+        Weight of frames with empty labels (0 excludes them)
+    tongue_weight : float
+        Weight of a tongue mask of mean area
+    area_power : float
+        How strongly larger masks are favored (0: any non-empty mask counts the same)
+    keypoint_weight : float
+        Extra weight of frames with a jaw keypoint
+    balance_experiments : float
+        Experiment balancing strength in [0, 1]
+    experiments : Optional[Sequence[str]]
+        Experiment of each frame; overrides ``filenames``
+
+    Returns
+    -------
+    np.ndarray
+        (N,) float64 weights
+    """
+    tongue_area, has_jaw = label_content(labels)
+    has_tongue = tongue_area > 0
+    weights = np.full(len(tongue_area), float(empty_weight))
+    if has_tongue.any():
+        mean_area = tongue_area[has_tongue].mean()
+        weights[has_tongue] += tongue_weight * (tongue_area[has_tongue] / mean_area) ** area_power
+    weights[has_jaw] += keypoint_weight
+
+    if balance_experiments:
+        if experiments is None:
+            if filenames is None:
+                raise ValueError('Experiment balancing needs filenames or experiments')
+            experiments = [experiment_of(f) for f in filenames]
+        _, inverse, counts = np.unique(np.asarray(experiments, dtype=str), return_inverse=True, return_counts=True)
+        weights *= counts[inverse].astype(np.float64) ** -balance_experiments
+
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError('All sampling weights are zero')
+    return weights * (len(weights) / total)
+
+
+class WeightedSampler:
+    """
+    Reproducible per-epoch index schedules drawn from frame weights.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        (N,) non-negative frame weights
+    num_samples : Optional[int]
+        Frames per epoch (default: N)
+    replacement : bool
+        Draw with replacement. Without replacement each frame appears at most
+        once per epoch (weighted random order, Efraimidis-Spirakis keys)
+    seed : int
+        Base seed; epoch ``e`` uses ``(seed, e)`` so schedules can be regenerated
+    """
+
+    def __init__(self,
+                 weights: np.ndarray,
+                 num_samples: Optional[int] = None,
+                 replacement: bool = True,
+                 seed: int = 0):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or np.any(weights < 0) or not np.all(np.isfinite(weights)):
+            raise ValueError('weights must be a 1D array of finite, non-negative values')
+        self.weights = weights
+        self.probabilities = weights / weights.sum()
+        self.num_samples = len(weights) if num_samples is None else int(num_samples)
+        self.replacement = replacement
+        self.seed = seed
+        if not replacement and self.num_samples > np.count_nonzero(weights):
+            raise ValueError('num_samples exceeds the number of frames with non-zero weight')
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def epoch_indices(self, epoch: int) -> np.ndarray:
+        """Frame indices of one epoch, in the order they should be shown."""
+        rng = np.random.default_rng((self.seed, epoch))
+        if self.replacement:
+            return rng.choice(len(self.weights), size=self.num_samples, p=self.probabilities)
+        with np.errstate(divide='ignore'):
+            keys = np.log(rng.random(len(self.weights))) / self.weights
+        return np.argsort(-keys, kind='stable')[:self.num_samples]
+
+    def schedule(self, num_epochs: int, first_epoch: int = 0) -> np.ndarray:
+        """(num_epochs, num_samples) index schedule."""
+        return np.stack([self.epoch_indices(e) for e in range(first_epoch, first_epoch + num_epochs)])
+
+    def effective_sample_size(self) -> float:
+        """Kish effective number of distinct frames per epoch implied by the weights."""
+        return float(self.weights.sum() ** 2 / (self.weights ** 2).sum())
+
+
+class ScheduledBatches(_BatchBase):
+    """
+    Batches of a dataset in the order given by a ``WeightedSampler``.
+
+    Usable directly with ``model.fit`` (a Keras ``PyDataset`` when Keras is
+    installed). The schedule advances to the next epoch in ``on_epoch_end``.
+
+    Parameters
+    ----------
+    data : tuple or indexable
+        ``(images, labels)`` arrays, or an object such as ``LickingDataset``
+        where ``data[index_array]`` returns stacked ``(images, labels)``
+    sampler : WeightedSampler
+        Index schedule
+    batch_size : int
+        Frames per batch; the last partial batch of an epoch is dropped
+    transform : callable, optional
+        ``transform(images, labels) -> (images, labels)`` applied to every batch
+        (e.g. augmentation)
+    **kwargs
+        Passed on to ``keras.utils.PyDataset`` (workers, use_multiprocessing)
+    """
+
+    def __init__(self, data, sampler: WeightedSampler, batch_size: int = 32, transform=None, **kwargs):
+        if _BatchBase is not object:
+            super().__init__(**kwargs)
+        self.data = data
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.transform = transform
+        self.epoch = 0
+        self.indices = sampler.epoch_indices(0)
+
+    def __len__(self) -> int:
+        return len(self.indices) // self.batch_size
+
+    def batch_indices(self, batch: int) -> np.ndarray:
+        if not 0 <= batch < len(self):
+            raise IndexError(f'Batch {batch} out of range for {len(self)} batches')
+        return self.indices[batch * self.batch_size:(batch + 1) * self.batch_size]
+
+    def __getitem__(self, batch: int):
+        index = self.batch_indices(batch)
+        if isinstance(self.data, tuple):
+            images, labels = self.data[0][index], self.data[1][index]
+        else:
+            images, labels = self.data[index]
+        if self.transform is not None:
+            images, labels = self.transform(images, labels)
+        return images, labels
+
+    def on_epoch_end(self) -> None:
+        self.epoch += 1
+        self.indices = self.sampler.epoch_indices(self.epoch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute label-aware sampling weights for a licking dataset')
+    parser.add_argument('dataset', help='Dataset .pkl with (images, labels) or (images, filenames, labels)')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Weights .npy (default: <dataset>.weights.npy next to the dataset)')
+    parser.add_argument('--empty-weight', type=float, default=0.1, help='Weight of empty frames (default: 0.1)')
+    parser.add_argument('--tongue-weight', type=float, default=1.0, help='Weight of a mean-area tongue mask')
+    parser.add_argument('--area-power', type=float, default=0.5, help='Exponent on relative mask area')
+    parser.add_argument('--keypoint-weight', type=float, default=1.0, help='Extra weight of jaw keypoints')
+    parser.add_argument('--balance', type=float, default=0.0, help='Experiment balancing strength in [0, 1]')
+    args = parser.parse_args()
+
+    with open(args.dataset, 'rb') as handle:
+        data = pickle.load(handle)
+    if len(data) == 3:
+        _, filenames, labels = data
+    else:
+        (_, labels), filenames = data, None
+
+    weights = label_weights(labels, filenames, args.empty_weight, args.tongue_weight, args.area_power,
+                            args.keypoint_weight, args.balance)
+    output = args.output or os.path.splitext(args.dataset)[0] + '.weights.npy'
+    np.save(output, weights)
+
+    tongue_area, has_jaw = label_content(labels)
+    empty = (tongue_area == 0) & ~has_jaw
+    sampler = WeightedSampler(weights)
+    print(f'Frames: {len(weights)}  empty: {empty.sum()} ({empty.mean():.1%} of frames, '
+          f'{sampler.probabilities[empty].sum():.1%} of draws)')
+    print(f'Effective sample size: {sampler.effective_sample_size():.0f}')
+    print(f'Weights saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
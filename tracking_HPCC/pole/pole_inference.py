@@ -0,0 +1,306 @@
+"""
+Batched inference for the pole tracker.
+
+Frames are decoded and preprocessed on a background thread and handed to
+``model.predict`` in batches through a bounded queue, so decoding overlaps with
+prediction. Predicted heatmaps are converted to pixel coordinates and written
+in the same ``frame,x,y`` layout as ``labels/jaw/jaw.csv``. The heatmap
+decoder comes from ``create_dataset_utils`` (``pip install -e .`` in the
+repository root).
+
+Example usage:
+  python pole_inference.py Tip+Curve+Ryan.weights.h5 /path/to/experiment/images predictions.csv \
+      --tracking-root /home/mvdokh/tracking
+  python pole_inference.py pole_tracker.keras /path/to/experiment/video.mp4 predictions.csv
+"""
+
+import argparse
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from create_dataset_utils.heatmap_decoder import DECODE_METHODS, decode_heatmaps
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+_END = object()
+
+
+def frame_number(image_path):
+    """Frame number of an image named like ``42.png`` or ``scene0042.png``."""
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    if name.startswith('scene'):
+        name = name[5:]
+    return int(name)
+
+
+def list_frames(images_folder, image_extensions=IMAGE_EXTENSIONS):
+    """
+    List the images of a folder sorted by frame number.
+
+    Returns
+    -------
+    list of (frame_number, image_path)
+    """
+    frames = []
+    for fname in os.listdir(images_folder):
+        if not fname.lower().endswith(image_extensions):
+            continue
+        try:
+            frames.append((frame_number(fname), os.path.join(images_folder, fname)))
+        except ValueError:
+            print(f'Warning: Could not convert frame number for {fname}, skipping')
+    return sorted(frames)
+
+
+def preprocess_frame(image, input_shape):
+    """Resize a BGR frame to the model input shape, as done when building the training data."""
+    height, width = input_shape[:2]
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _read_batches(frames, input_shape, batch_size, out_queue, num_workers, stop):
+    """Producer: decode and preprocess frames, put (frame_nums, batch, resolutions) on the queue."""
+    def load(item):
+        frame_num, path = item
+        image = cv2.imread(path)
+        if image is None:
+            return frame_num, None, None
+        return frame_num, preprocess_frame(image, input_shape), image.shape[:2]
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for start in range(0, len(frames), batch_size):
+                if stop.is_set():
+                    break
+                loaded = [item for item in executor.map(load, frames[start:start + batch_size])
+                          if item[1] is not None]
+                if not loaded:
+                    continue
+                frame_nums, images, resolutions = zip(*loaded)
+                out_queue.put((list(frame_nums), np.stack(images), np.array(resolutions)))
+    except Exception as e:
+        out_queue.put(e)
+    finally:
+        out_queue.put(_END)
+
+
+def _read_video_batches(video_path, input_shape, batch_size, out_queue, stop):
+    """Producer for video files: frame numbers are 0-based frame indices."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f'Could not open video: {video_path}')
+        frame_nums, images, resolutions = [], [], []
+        index = 0
+        while not stop.is_set():
+            ok, image = cap.read()
+            if not ok:
+                break
+            frame_nums.append(index)
+            images.append(preprocess_frame(image, input_shape))
+            resolutions.append(image.shape[:2])
+            index += 1
+            if len(images) == batch_size:
+                out_queue.put((frame_nums, np.stack(images), np.array(resolutions)))
+                frame_nums, images, resolutions = [], [], []
+        if images:
+            out_queue.put((frame_nums, np.stack(images), np.array(resolutions)))
+    except Exception as e:
+        out_queue.put(e)
+    finally:
+        cap.release()
+        out_queue.put(_END)
+
+
+def predict_keypoints(model, source, output_csv, input_shape=(256, 256, 3), batch_size=32,
+                      queue_size=4, num_workers=4, threshold=0.1, method='quadratic', verbose=True):
+    """
+    Run batched keypoint prediction over a folder of frames or a video file.
+
+    Parameters
+    ----------
+    model : object
+        Anything with a ``predict(batch, verbose=0)`` method returning heatmaps of
+        shape (N, H, W, K), e.g. a keras model
+    source : str or Path
+        Folder of frames (named by frame number) or a video file
+    output_csv : str or Path
+        CSV to write with header ``frame,x,y``. If the model predicts K > 1
+        keypoints, one file per keypoint is written with suffix ``_<k>``
+    input_shape : tuple
+        Model input shape (height, width, channels)
+    batch_size : int
+        Frames per ``model.predict`` call
+    queue_size : int
+        Maximum number of preprocessed batches waiting for the model
+    num_workers : int
+        Threads decoding frames from an image folder
+    threshold : float
+        Heatmap peaks below this value are written as occluded ('nan')
+    method : str
+        Sub-pixel refinement passed to ``decode_heatmaps``
+    verbose : bool
+        If True, print progress and the throughput summary
+
+    Returns
+    -------
+    dict
+        Summary with keys: frames, seconds, fps, predict_seconds,
+        wait_seconds, output_paths
+    """
+    source = str(source)
+    output_csv = Path(output_csv)
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    if os.path.isdir(source):
+        frames = list_frames(source)
+        if not frames:
+            raise ValueError(f'No frames found in {source}')
+        producer = threading.Thread(target=_read_batches,
+                                    args=(frames, input_shape, batch_size, batches, num_workers, stop),
+                                    daemon=True)
+    elif source.lower().endswith(VIDEO_EXTENSIONS):
+        producer = threading.Thread(target=_read_video_batches,
+                                    args=(source, input_shape, batch_size, batches, stop),
+                                    daemon=True)
+    else:
+        raise ValueError(f'Source must be a folder of frames or a video file: {source}')
+
+    all_frames, all_coords = [], []
+    predict_seconds = 0.0
+    wait_seconds = 0.0
+    start = time.perf_counter()
+    producer.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            item = batches.get()
+            wait_seconds += time.perf_counter() - t0
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            frame_nums, batch, resolutions = item
+            t0 = time.perf_counter()
+            heatmaps = model.predict(batch, verbose=0)
+            predict_seconds += time.perf_counter() - t0
+
+            coords, _, _ = decode_heatmaps(heatmaps, original_resolution=resolutions,
+                                           method=method, threshold=threshold)
+            all_frames.extend(frame_nums)
+            all_coords.append(coords)
+            if verbose:
+                print(f'Predicted {len(all_frames)} frames', end='\r')
+    finally:
+        stop.set()
+        # Drain so the producer is never blocked on a full queue
+        while producer.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+
+    seconds = time.perf_counter() - start
+    coords = np.concatenate(all_coords) if all_coords else np.zeros((0, 1, 2))
+    output_paths = write_keypoint_csv(output_csv, all_frames, coords)
+
+    summary = {
+        'frames': len(all_frames),
+        'seconds': seconds,
+        'fps': len(all_frames) / seconds if seconds > 0 else 0.0,
+        'predict_seconds': predict_seconds,
+        'wait_seconds': wait_seconds,
+        'output_paths': [str(p) for p in output_paths],
+    }
+    if verbose:
+        print(f"Predicted {summary['frames']} frames in {seconds:.1f} s ({summary['fps']:.1f} frames/s, "
+              f"{predict_seconds:.1f} s in predict, {wait_seconds:.1f} s waiting for frames)")
+    return summary
+
+
+def write_keypoint_csv(output_csv, frame_nums, coords):
+    """
+    Write predicted coordinates as ``frame,x,y`` CSV files.
+
+    Occluded keypoints (NaN) are written as 'nan', which ``load_licking_data``
+    reads back as occluded.
+
+    Returns
+    -------
+    list of Path
+        The files written, one per keypoint
+    """
+    output_csv = Path(output_csv)
+    n_keypoints = coords.shape[1]
+    if n_keypoints == 1:
+        paths = [output_csv]
+    else:
+        paths = [output_csv.with_name(f'{output_csv.stem}_{k}{output_csv.suffix}') for k in range(n_keypoints)]
+
+    for k, path in enumerate(paths):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'x', 'y'])
+            for frame_num, (x, y) in zip(frame_nums, coords[:, k]):
+                if np.isnan(x) or np.isnan(y):
+                    writer.writerow([frame_num, 'nan', 'nan'])
+                else:
+                    writer.writerow([frame_num, f'{x:.2f}', f'{y:.2f}'])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict pole keypoints for a folder of frames or a video')
+    parser.add_argument('model', help='Weights checkpoint written by pole_tracker.ipynb (.weights.h5), '
+                                      'or a saved keras model (.keras) including architecture')
+    parser.add_argument('source', help='Folder of frames or a video file')
+    parser.add_argument('output_csv', help='CSV file to write (frame,x,y)')
+    parser.add_argument('--batch-size', '-b', type=int, default=32)
+    parser.add_argument('--queue-size', type=int, default=4, help='Max preprocessed batches waiting for the model')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='Frame decoding threads')
+    parser.add_argument('--threshold', '-t', type=float, default=0.1, help='Minimum heatmap peak for a visible keypoint')
+    parser.add_argument('--method', '-m', default='quadratic', choices=DECODE_METHODS,
+                        help='Sub-pixel refinement of heatmap peaks')
+    parser.add_argument('--input-shape', type=int, nargs=3, default=(256, 256, 3), metavar=('H', 'W', 'C'),
+                        help='Model input shape the weights were trained with (weights checkpoints only)')
+    parser.add_argument('--num-classes', type=int, default=1, help='Heatmaps per frame (weights checkpoints only)')
+    parser.add_argument('--tracking-root', default=None,
+                        help='Tracking repository holding DeepLearningUtils, needed to rebuild the '
+                             'architecture of a weights checkpoint')
+    args = parser.parse_args()
+
+    import keras
+
+    if args.model.endswith('.weights.h5'):
+        # ModelCheckpoint(save_weights_only=True) stores no architecture
+        if args.tracking_root is not None:
+            sys.path.append(args.tracking_root)
+        from pole_tracker import build_pole_model
+
+        model = build_pole_model(tuple(args.input_shape), args.num_classes, backbone_weights=None)
+        model.load_weights(args.model)
+    else:
+        model = keras.models.load_model(args.model, compile=False)
+    input_shape = tuple(model.input_shape[1:])
+    predict_keypoints(model, args.source, args.output_csv, input_shape=input_shape,
+                      batch_size=args.batch_size, queue_size=args.queue_size,
+                      num_workers=args.workers, threshold=args.threshold, method=args.method)
+
+
+if __name__ == '__main__':
+    main()
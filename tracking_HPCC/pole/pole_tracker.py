@@ -117,3 +117,54 @@ class MetricsLoggerCallback(keras.callbacks.Callback):
         plt.tight_layout()
         plt.savefig(self.plot_path, dpi=150, bbox_inches='tight')
         plt.close(fig)
+
+
+# Layer settings of the attention U-Net trained in pole_tracker.ipynb
+FILTER_NUM = [64, 64, 64, 64, 64, 64]
+
+
+def build_pole_model(input_shape=(256, 256, 3), num_classes=1, filter_num=FILTER_NUM, backbone_weights='imagenet'):
+    """
+    Build the pole tracker network: an EfficientNetB1 attention U-Net behind EfficientNet input preprocessing.
+
+    Training checkpoints only store weights (``*.weights.h5``), so inference
+    rebuilds this architecture and loads them into it. Needs
+    ``DeepLearningUtils`` from the tracking repository on ``sys.path``.
+
+    Parameters
+    ----------
+    input_shape : tuple
+        Model input shape (height, width, channels)
+    num_classes : int
+        Number of predicted heatmaps
+    filter_num : list
+        Filters per U-Net level
+    backbone_weights : str or None
+        Backbone initialization; None skips the ImageNet download when weights are loaded afterwards
+    """
+    from DeepLearningUtils.keras_unet_collection import models
+
+    unet = models.att_unet_2d(input_shape,
+                              filter_num=filter_num,
+                              n_labels=num_classes,
+                              stack_num_down=2,
+                              stack_num_up=2,
+                              activation='ReLU',
+                              atten_activation='ReLU',
+                              attention='add',
+                              output_activation='Sigmoid',  # For multi-class use Softmax
+                              batch_norm=True,
+                              dropout=True,
+                              dropout_rate=0.1,
+                              l2_regularization=False,
+                              l2_weight=1e-4,
+                              pool=False,  # Uses strided convolutions instead of max pooling
+                              unpool=False,  # Uses transposed convolutions instead of upsampling
+                              backbone='EfficientNetB1',
+                              weights=backbone_weights,
+                              freeze_backbone=True,
+                              freeze_batch_norm=True,
+                              name='attunet')
+    inputs = keras.Input(shape=input_shape)
+    x = keras.applications.efficientnet.preprocess_input(inputs)
+    return keras.Model(inputs=inputs, outputs=unet(x))